@@ -404,6 +404,21 @@ class FakeOFTable:
                 self.tables.append([])
             self.tables[stat.table_id].append(FlowMod(stat))
 
+    def flow_stats_reply(self):
+        """Return an OFPFlowStatsReply message for all flows in all tables."""
+        body = []
+        for table_id, table in enumerate(self.tables):
+            for fte in table:
+                body.append(parser.OFPFlowStats(
+                    table_id=table_id, duration_sec=0, duration_nsec=0,
+                    priority=fte.priority, idle_timeout=fte.idle_timeout,
+                    hard_timeout=fte.hard_timeout, flags=fte.flags, cookie=fte.cookie,
+                    packet_count=0, byte_count=0, match=fte.match,
+                    instructions=fte.instructions))
+        reply = parser.OFPFlowStatsReply(None, body=body)
+        reply.flags = 0
+        return reply
+
     def apply_ofmsgs(self, ofmsgs, ignore_errors=False):
         """Update state of test flow tables."""
         for ofmsg in ofmsgs:
@@ -418,6 +433,8 @@ class FakeOFTable:
                     continue
                 if isinstance(ofmsg, parser.OFPDescStatsRequest):
                     continue
+                if isinstance(ofmsg, parser.OFPFlowStatsRequest):
+                    continue
                 if isinstance(ofmsg, parser.OFPMeterMod):
                     # TODO: handle OFPMeterMod
                     continue
@@ -848,6 +865,10 @@ class FlowMod:
         """flowmod is a ryu flow modification message object"""
         self.priority = flowmod.priority
         self.cookie = flowmod.cookie
+        self.idle_timeout = flowmod.idle_timeout
+        self.hard_timeout = flowmod.hard_timeout
+        self.flags = flowmod.flags
+        self.match = flowmod.match
         self.instructions = flowmod.instructions
         self.validate_instructions()
         self.match_values = {}
@@ -756,6 +756,11 @@ class ValveTestBases:
                     'inefficient duplicate flow generation (before %u, after %u)' % (
                         before_flow_count, after_flow_count))
             self.network.apply_ofmsgs(int(dp_id), final_ofmsgs)
+            if any(isinstance(ofmsg, parser.OFPFlowStatsRequest) for ofmsg in final_ofmsgs):
+                reconcile_ofmsgs = valve.flow_stats_reply_handler(
+                    self.network.tables[int(dp_id)].flow_stats_reply())
+                final_ofmsgs = final_ofmsgs + self.apply_ofmsgs(
+                    reconcile_ofmsgs, dp_id=dp_id, offset=offset)
             if all_offsets:
                 for offset_iter in range(len(ofmsgs)):
                     self._verify_redundant_safe_offset_ofmsgs(ofmsgs, dp_id, offset_iter)
@@ -876,6 +881,7 @@ class ValveTestBases:
             connect_msgs = (
                 valve.switch_features(None) +
                 valve.datapath_connect(self.mock_time(10), discovered_up_ports))
+            self.valves_manager.update_running_valves()
             connect_msgs = self.apply_ofmsgs(connect_msgs, dp_id)
             self.valves_manager.update_config_applied(sent={dp_id: True})
             self.assertEqual(1, int(self.get_prom('dp_status', dp_id=dp_id)))
@@ -884,7 +890,7 @@ class ValveTestBases:
 
         def disconnect_dp(self):
             valve = self.valves_manager.valves[self.DP_ID]
-            valve.datapath_disconnect(time.time())
+            self.valves_manager.datapath_disconnect(time.time(), valve)
 
         def cold_start(self, dp_id=None):
             """
@@ -897,7 +903,7 @@ class ValveTestBases:
             if dp_id is None:
                 dp_id = self.DP_ID
             valve = self.valves_manager.valves[dp_id]
-            valve.datapath_disconnect(time.time())
+            self.valves_manager.datapath_disconnect(time.time(), valve)
             return self.connect_dp(dp_id)
 
         def get_prom(self, var, labels=None, bare=False, dp_id=None):
@@ -1122,6 +1128,7 @@ class ValveTestBases:
                 valve.dp.dyn_running = True
                 for port in valve.dp.stack_ports():
                     port.stack_up()
+            self.valves_manager.update_running_valves()
 
         def up_stack_port(self, port, dp_id=None):
             """Bring up a single stack port"""
@@ -1164,6 +1171,7 @@ class ValveTestBases:
                 valve.dp.dyn_running = True
                 for port in valve.dp.ports.values():
                     port.dyn_phys_up = True
+                self.valves_manager.update_running_valves()
                 for port in valve.dp.stack_ports():
                     self.up_stack_port(port, dp_id=valve.dp.dp_id)
                     self._update_port_map(port, True)
@@ -1462,7 +1470,7 @@ class ValveTestBases:
             msg.xid = 123
             valve.recent_ofmsgs.append(msg)
             test_error = valve_of.parser.OFPErrorMsg(datapath=datapath, msg=msg)
-            valve.oferror(test_error)
+            valve.oferror(test_error, time.time())
 
         def test_tfm(self):
             """Test TFM is sent."""
@@ -2341,12 +2349,28 @@ meters:
             del_event = RouteRemoval(
                 IPPrefix.from_string(prefix),
             )
+            bgp_speaker_key = faucet_bgp.BgpSpeakerKey(self.DP_ID, 0x100, 4)
+            route_labels = {'vlan': str(0x100), 'ipv': '4'}
+            vlan = self.valves_manager.valves[self.DP_ID].dp.vlans[0x100]
+            # Route changes are queued, and applied in one batch.
             self.bgp._bgp_route_handler(  # pylint: disable=protected-access
-                add_event,
-                faucet_bgp.BgpSpeakerKey(self.DP_ID, 0x100, 4))
+                add_event, bgp_speaker_key)
+            self.assertEqual(1, self.get_prom('bgp_route_queue_depth', labels=route_labels))
+            self.assertNotIn(ipaddress.ip_network(prefix), vlan.routes_by_ipv(4))
+            self.bgp._flush_routes()  # pylint: disable=protected-access
+            self.assertEqual(0, self.get_prom('bgp_route_queue_depth', labels=route_labels))
+            self.assertIn(ipaddress.ip_network(prefix), vlan.routes_by_ipv(4))
             self.bgp._bgp_route_handler(  # pylint: disable=protected-access
-                del_event,
-                faucet_bgp.BgpSpeakerKey(self.DP_ID, 0x100, 4))
+                del_event, bgp_speaker_key)
+            self.bgp._flush_routes()  # pylint: disable=protected-access
+            self.assertNotIn(ipaddress.ip_network(prefix), vlan.routes_by_ipv(4))
+            # A route added and withdrawn before it was applied is dropped.
+            self.bgp._bgp_route_handler(  # pylint: disable=protected-access
+                add_event, bgp_speaker_key)
+            self.bgp._bgp_route_handler(  # pylint: disable=protected-access
+                del_event, bgp_speaker_key)
+            self.assertEqual(0, self.get_prom('bgp_route_queue_depth', labels=route_labels))
+            self.assertEqual(4, self.get_prom('bgp_route_changes_total', labels=route_labels))
             self.bgp._bgp_up_handler(nexthop, 65001)  # pylint: disable=protected-access
             self.bgp._bgp_down_handler(nexthop, 65001)  # pylint: disable=protected-access
 
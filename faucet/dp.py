@@ -89,6 +89,8 @@ configuration.
         # By default drop packets on datapath spoofing the FAUCET_MAC
         'group_table': False,
         # Use GROUP tables for VLAN flooding
+        'group_table_routing': False,
+        # Use an indirect GROUP per resolved nexthop, that FIB entries point to
         'max_hosts_per_resolve_cycle': 5,
         # Max hosts to try to resolve per gateway resolution cycle.
         'max_host_fib_retry_count': 10,
@@ -101,8 +103,19 @@ configuration.
         # Ask switch to rate limit slowpath pps. TODO: Not supported by OVS in 2.7.0
         'learn_jitter': 0,
         # Jitter learn timeouts by up to this many seconds
+        'max_inflight_barriers': None,
+        # Max number of barriers in flight to the DP before queueing further messages.
+        # 0 does not limit, None uses the hardware default.
         'learn_ban_timeout': 0,
         # When banning/limiting learning, wait this many seconds before learning can be retried
+        'admit_packetin_port_pps': None,
+        # Admit up to this many packet ins per second from each port. None does not limit.
+        'admit_packetin_vlan_pps': None,
+        # Admit up to this many packet ins per second on each VLAN. None does not limit.
+        'admit_packetin_dp_pps': None,
+        # Admit up to this many packet ins per second from the DP. None does not limit.
+        'admit_packetin_port_ban': False,
+        # Temporarily ban learning on a port over its packet in rate limit.
         'advertise_interval': 30,
         # How often to slow advertise (eg. IPv6 RAs)
         'fast_advertise_interval': 5,
@@ -113,6 +126,8 @@ configuration.
         # whether proactive learning is enabled for IPv6 nexthops
         'use_idle_timeout': False,
         # Turn on/off the use of idle timeout for src_table, default OFF.
+        'reconcile_flows': False,
+        # On reconnect or VLAN change, change only flows that differ from those FAUCET added.
         'lldp_beacon': {},
         # Config for LLDP beacon service.
         'metrics_rate_limit_sec': 0,
@@ -173,18 +188,25 @@ configuration.
         'drop_broadcast_source_address': bool,
         'drop_spoofed_faucet_mac': bool,
         'group_table': bool,
+        'group_table_routing': bool,
         'max_hosts_per_resolve_cycle': int,
         'max_host_fib_retry_count': int,
         'max_resolve_backoff_time': int,
         'packetin_pps': int,
         'slowpath_pps': int,
         'learn_jitter': int,
+        'max_inflight_barriers': int,
         'learn_ban_timeout': int,
+        'admit_packetin_port_pps': int,
+        'admit_packetin_vlan_pps': int,
+        'admit_packetin_dp_pps': int,
+        'admit_packetin_port_ban': bool,
         'advertise_interval': int,
         'fast_advertise_interval': int,
         'proactive_learn_v4': bool,
         'proactive_learn_v6': bool,
         'use_idle_timeout': bool,
+        'reconcile_flows': bool,
         'lldp_beacon': dict,
         'metrics_rate_limit_sec': int,
         'faucet_dp_mac': str,
@@ -260,6 +282,7 @@ configuration.
         self.global_vlan = None
         self.groups = None
         self.group_table = False
+        self.group_table_routing = False
         self.hardware = None
         self.high_priority = None
         self.highest_priority = None
@@ -268,7 +291,12 @@ configuration.
         self.interfaces = None
         self.lacp_timeout = None
         self.learn_ban_timeout = None
+        self.admit_packetin_port_pps = None
+        self.admit_packetin_vlan_pps = None
+        self.admit_packetin_dp_pps = None
+        self.admit_packetin_port_ban = None
         self.learn_jitter = None
+        self.max_inflight_barriers = None
         self.lldp_beacon = None
         self.low_priority = None
         self.lowest_priority = None
@@ -293,6 +321,7 @@ configuration.
         self.timeout = None
         self.unicast_flood = None
         self.use_idle_timeout = None
+        self.reconcile_flows = None
         self.vlans = None
         self.min_wildcard_table_size = None
         self.max_wildcard_table_size = None
@@ -330,6 +359,10 @@ configuration.
         self.dyn_running = prev_dp.dyn_running
         self.dyn_up_port_nos = set(prev_dp.dyn_up_port_nos)
         self.dyn_last_coldstart_time = prev_dp.dyn_last_coldstart_time
+        if self.group_table_routing:
+            # Nexthop groups stay installed over a warm start, so keep tracking them.
+            for group_id, entry in prev_dp.groups.entries.items():
+                self.groups.get_entry(group_id, entry.buckets, type_=entry.type_)
 
     def cold_start(self, now):
         """Update to reflect a cold start"""
@@ -356,6 +389,14 @@ configuration.
             'L2 timeout must be > ARP timeout * 2'))
         test_config_condition(
             self.arp_neighbor_timeout > 65535, 'arp_neighbor_timeout cannot be > 65535')
+        test_config_condition(
+            self.max_inflight_barriers is not None and self.max_inflight_barriers < 0, (
+                'max_inflight_barriers cannot be negative'))
+        for pps_conf in (
+                'admit_packetin_port_pps', 'admit_packetin_vlan_pps', 'admit_packetin_dp_pps'):
+            pps = getattr(self, pps_conf)
+            test_config_condition(
+                pps is not None and pps < 0, '%s cannot be negative' % pps_conf)
         test_config_condition(not (self.nd_neighbor_timeout < (self.timeout / 2)), (
             'L2 timeout must be > ND timeout * 2'))
         test_config_condition(
@@ -469,6 +510,11 @@ configuration.
         if acl_tables:
             included_tables.update(set(acl_tables.keys()))
             self.has_acls = True
+        # Nexthop groups output directly to the port, past eth_dst and egress tables.
+        test_config_condition(self.group_table_routing and self.egress_pipeline, (
+            'group_table_routing cannot be used with egress ACLs or egress_pipeline'))
+        test_config_condition(self.group_table_routing and self.hairpin_ports, (
+            'group_table_routing cannot be used with hairpin ports'))
         # Only configure IP routing tables if enabled.
         for vlan in self.vlans.values():
             for ipv in vlan.ipvs():
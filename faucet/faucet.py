@@ -180,7 +180,22 @@ class Faucet(RyuAppBase):
         if not ryu_dp:
             valve.logger.error('send_flow_msgs: DP not up')
             return
-        valve.send_flows(ryu_dp, flow_msgs, time.time())
+        now = time.time()
+        if flow_msgs is None:
+            self._close_datapath(valve, ryu_dp, now)
+            return
+        valve.send_flows(ryu_dp, flow_msgs, now)
+
+    def _close_datapath(self, valve, ryu_dp, now):
+        """Disconnect an OF session, via ValvesManager so running Valves are updated.
+
+        Args:
+            valve (Valve): Valve instance.
+            ryu_dp (ryu.controller.controller.Datapath): datapath.
+            now (float): current epoch time.
+        """
+        self.valves_manager.datapath_disconnect(now, valve)
+        ryu_dp.close()
 
     def _get_valve(self, ryu_event, require_running=False):
         """Get Valve instance to response to an event.
@@ -252,10 +267,10 @@ class Faucet(RyuAppBase):
         Args:
             ryu_event (ryu.controller.ofp_event.EventOFPErrorMsg): trigger
         """
-        valve, _, msg = self._get_valve(ryu_event)
+        valve, ryu_dp, msg = self._get_valve(ryu_event)
         if valve is None:
             return
-        valve.oferror(msg)
+        self._send_flow_msgs(valve, valve.oferror(msg, ryu_event.timestamp), ryu_dp=ryu_dp)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER) # pylint: disable=no-member
     @kill_on_exception(exc_logname)
@@ -285,10 +300,25 @@ class Faucet(RyuAppBase):
             port.port_no for port in list(ryu_dp.ports.values())
             if (valve_of.port_status_from_state(port.state) and
                 not valve_of.ignore_port(port.port_no))}
-        self._send_flow_msgs(
-            valve, self.valves_manager.datapath_connect(now, valve, discovered_up_ports))
+        flow_msgs = self.valves_manager.datapath_connect(now, valve, discovered_up_ports)
+        if flow_msgs is None:
+            self._close_datapath(valve, ryu_dp, now)
+            return
+        # Write cold start flows from their own thread, a chunk at a time,
+        # so other datapaths' events are handled in between chunks.
+        hub.spawn(self._send_flow_chunks, valve.send_flows_chunks(ryu_dp, flow_msgs))
         self.valves_manager.update_config_applied({valve.dp.dp_id: True})
 
+    @kill_on_exception(exc_logname)
+    def _send_flow_chunks(self, chunks):
+        """Write chunks of OpenFlow messages, yielding to other threads in between.
+
+        Args:
+            chunks (generator): writes a chunk of messages per iteration.
+        """
+        for _ in chunks:
+            hub.sleep(0)
+
     @kill_on_exception(exc_logname)
     def _datapath_disconnect(self, ryu_event):
         """Handle any/all disconnection of a datapath.
@@ -299,7 +329,7 @@ class Faucet(RyuAppBase):
         valve, _, _ = self._get_valve(ryu_event)
         if valve is None:
             return
-        valve.datapath_disconnect(time.time())
+        self.valves_manager.datapath_disconnect(time.time(), valve)
 
     @set_ev_cls(ofp_event.EventOFPDescStatsReply, MAIN_DISPATCHER) # pylint: disable=no-member
     @kill_on_exception(exc_logname)
@@ -314,6 +344,32 @@ class Faucet(RyuAppBase):
             return
         valve.ofdescstats_handler(msg.body)
 
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER) # pylint: disable=no-member
+    @kill_on_exception(exc_logname)
+    def flow_stats_reply_handler(self, ryu_event):
+        """Handle OFPFlowStatsReply from datapath.
+
+        Args:
+            ryu_event (ryu.controller.ofp_event.EventOFPFlowStatsReply): trigger.
+        """
+        valve, ryu_dp, msg = self._get_valve(ryu_event)
+        if valve is None:
+            return
+        self._send_flow_msgs(valve, valve.flow_stats_reply_handler(msg), ryu_dp=ryu_dp)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER) # pylint: disable=no-member
+    @kill_on_exception(exc_logname)
+    def barrier_reply_handler(self, ryu_event):
+        """Handle OFPBarrierReply from datapath.
+
+        Args:
+            ryu_event (ryu.controller.ofp_event.EventOFPBarrierReply): trigger.
+        """
+        valve, ryu_dp, msg = self._get_valve(ryu_event)
+        if valve is None:
+            return
+        valve.barrier_reply_handler(ryu_dp, msg, time.time())
+
     @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER) # pylint: disable=no-member
     @kill_on_exception(exc_logname)
     def port_status_handler(self, ryu_event):
@@ -19,6 +19,7 @@
 # limitations under the License.
 
 import ipaddress
+from collections import OrderedDict
 
 import eventlet
 eventlet.monkey_patch()
@@ -56,6 +57,9 @@ class FaucetBgp:
     """Wrapper for Ryu BGP speaker."""
 
     exc_logname = None
+    # Queue route changes for up to this long, or until this many are queued.
+    ROUTE_BATCH_SECS = 0.1
+    ROUTE_BATCH_SIZE = 1000
 
     def __init__(self, logger, exc_logname, metrics, send_flow_msgs):
         self.logger = logger
@@ -65,6 +69,9 @@ class FaucetBgp:
         self._dp_bgp_speakers = {}
         self._dp_bgp_rib = {}
         self._valves = None
+        self._route_queue = {}
+        self._route_queue_depth = 0
+        self._route_flush_thread = None
         self.thread = None
 
     def _valve_vlan(self, dp_id, vlan_vid):
@@ -95,17 +102,76 @@ class FaucetBgp:
 
     @kill_on_exception(exc_logname)
     def _bgp_route_handler(self, path_change, bgp_speaker_key):
-        """Handle a BGP change event.
+        """Queue a BGP change event, to be applied with others in one batch.
+
+        A later change to the same prefix replaces an earlier queued one,
+        and a withdrawal of a queued prefix not yet in the RIB cancels it.
 
         Args:
             path_change (ryu.services.protocols.bgp.bgpspeaker.EventPrefix): path change
         """
-        dp_id = bgp_speaker_key.dp_id
-        vlan_vid = bgp_speaker_key.vlan_vid
-        valve, vlan = self._valve_vlan(dp_id, vlan_vid)
+        prefix = ipaddress.ip_network(str(path_change.prefix))
+        route_queue = self._route_queue.setdefault(bgp_speaker_key, OrderedDict())
+        queued_path_change = route_queue.pop(prefix, None)
+        if queued_path_change is not None:
+            self._route_queue_depth -= 1
+        if (path_change.is_withdraw and queued_path_change is not None and
+                not queued_path_change.is_withdraw and
+                prefix not in self._dp_bgp_rib.get(bgp_speaker_key, {})):
+            self.logger.info('BGP route %s added and withdrawn before applied' % prefix)
+        else:
+            route_queue[prefix] = path_change
+            self._route_queue_depth += 1
+        self._update_route_queue_metrics(bgp_speaker_key, changes=1)
+        if self._route_queue_depth >= self.ROUTE_BATCH_SIZE:
+            self._flush_routes()
+        elif self._route_flush_thread is None:
+            self._route_flush_thread = hub.spawn_after(self.ROUTE_BATCH_SECS, self._flush_routes)
+
+    def _update_route_queue_metrics(self, bgp_speaker_key, changes=0):
+        valve, vlan = self._valve_vlan(bgp_speaker_key.dp_id, bgp_speaker_key.vlan_vid)
         if vlan is None:
             return
-        prefix = ipaddress.ip_network(str(path_change.prefix))
+        labels = dict(valve.dp.base_prom_labels(), vlan=vlan.vid, ipv=bgp_speaker_key.ipv)
+        if changes:
+            self.metrics.bgp_route_changes.labels( # pylint: disable=no-member
+                **labels).inc(changes)
+        self.metrics.bgp_route_queue_depth.labels( # pylint: disable=no-member
+            **labels).set(len(self._route_queue.get(bgp_speaker_key, ())))
+
+    @kill_on_exception(exc_logname)
+    def _flush_routes(self):
+        """Apply all queued BGP changes, updating each FIB once per speaker and DP."""
+        if self._route_flush_thread is not None:
+            self._route_flush_thread.cancel()
+            self._route_flush_thread = None
+        route_queue = self._route_queue
+        self._route_queue = {}
+        self._route_queue_depth = 0
+        flowmods_by_valve = OrderedDict()
+        for bgp_speaker_key, path_changes in route_queue.items():
+            valve, vlan = self._valve_vlan(bgp_speaker_key.dp_id, bgp_speaker_key.vlan_vid)
+            if vlan is not None:
+                route_changes = []
+                for prefix, path_change in path_changes.items():
+                    route_change = self._apply_path_change(
+                        valve, vlan, bgp_speaker_key, prefix, path_change)
+                    if route_change is not None:
+                        route_changes.append(route_change)
+                flowmods = valve.update_routes(vlan, route_changes)
+                if flowmods:
+                    flowmods_by_valve.setdefault(valve, []).extend(flowmods)
+            self._update_route_queue_metrics(bgp_speaker_key)
+        for valve, flowmods in flowmods_by_valve.items():
+            self._send_flow_msgs(valve, flowmods)
+
+    def _apply_path_change(self, valve, vlan, bgp_speaker_key, prefix, path_change):
+        """Apply a BGP change to the BGP RIB.
+
+        Returns:
+            tuple: (prefix, nexthop) to add a route to the Valve, (prefix, None)
+                to delete one, or None if the change is skipped.
+        """
         route_str = 'BGP route %s' % prefix
 
         if path_change.next_hop:
@@ -115,28 +181,24 @@ class FaucetBgp:
             if vlan.is_faucet_vip(nexthop):
                 self.logger.error(
                     'Skipping %s because nexthop cannot be us' % route_str)
-                return
+                return None
 
             if valve.router_vlan_for_ip_gw(vlan, nexthop) is None:
                 self.logger.info(
                     'Skipping %s because nexthop not in %s' % (route_str, vlan))
-                return
+                return None
 
         if bgp_speaker_key not in self._dp_bgp_rib:
             self._dp_bgp_rib[bgp_speaker_key] = {}
 
-        flowmods = []
         if path_change.is_withdraw:
             self.logger.info('withdraw %s', route_str)
             if prefix in self._dp_bgp_rib[bgp_speaker_key]:
                 del self._dp_bgp_rib[bgp_speaker_key][prefix]
-            flowmods = valve.del_route(vlan, prefix)
-        else:
-            self.logger.info('add %s', route_str)
-            self._dp_bgp_rib[bgp_speaker_key][prefix] = nexthop
-            flowmods = valve.add_route(vlan, nexthop, prefix)
-        if flowmods:
-            self._send_flow_msgs(valve, flowmods)
+            return (prefix, None)
+        self.logger.info('add %s', route_str)
+        self._dp_bgp_rib[bgp_speaker_key][prefix] = nexthop
+        return (prefix, nexthop)
 
     @staticmethod
     def _vlan_prefixes_by_ipv(vlan, ipv):
@@ -179,6 +241,11 @@ class FaucetBgp:
 
     def shutdown_bgp_speakers(self):
         """Shutdown any active BGP speakers."""
+        if self._route_flush_thread is not None:
+            self._route_flush_thread.cancel()
+            self._route_flush_thread = None
+        self._route_queue = {}
+        self._route_queue_depth = 0
         for bgp_speaker in self._dp_bgp_speakers.values():
             bgp_speaker.shutdown()
         self._dp_bgp_speakers = {}
@@ -189,12 +256,13 @@ class FaucetBgp:
             bgp_speaker = self._dp_bgp_speakers[bgp_speaker_key]
             if bgp_speaker_key in self._dp_bgp_rib:
                 # Re-add routes (to avoid flapping BGP even when VLAN cold starts).
+                route_changes = []
                 for prefix, nexthop in self._dp_bgp_rib[bgp_speaker_key].items():
                     self.logger.info('Re-adding %s via %s' % (prefix, nexthop))
-                    bgp_vlan = bgp_router.bgp_vlan()
-                    flowmods = valve.add_route(bgp_vlan, nexthop, prefix)
-                    if flowmods:
-                        self._send_flow_msgs(valve, flowmods)
+                    route_changes.append((prefix, nexthop))
+                flowmods = valve.update_routes(bgp_router.bgp_vlan(), route_changes)
+                if flowmods:
+                    self._send_flow_msgs(valve, flowmods)
         else:
             self.logger.info('Adding %s' % bgp_speaker_key)
             bgp_speaker = self._create_bgp_speaker_for_vlan(bgp_speaker_key, bgp_router)
@@ -68,6 +68,9 @@ class FaucetMetrics(PromClient):
         self.of_ignored_packet_ins = self._dpid_counter(
             'of_ignored_packet_ins',
             'number of OF packet_ins received but ignored from DP (due to rate limiting)')
+        self.of_limited_packet_ins = self._dpid_counter(
+            'of_limited_packet_ins',
+            'number of OF packet_ins received but not admitted, over the DP packet in rate limit')
         self.of_unexpected_packet_ins = self._dpid_counter(
             'of_unexpected_packet_ins',
             'number of OF packet_ins received that are unexpected from DP (e.g. for unknown VLAN)')
@@ -83,6 +86,24 @@ class FaucetMetrics(PromClient):
         self.of_flowmsgs_sent = self._dpid_counter(
             'of_flowmsgs_sent',
             'number of OF flow messages (and packet outs) sent to DP')
+        self.of_flowmsgs_batch_size = self._histogram(
+            'of_flowmsgs_batch_size',
+            'number of OF flow messages (and packet outs) sent to DP in one write',
+            self.REQUIRED_LABELS,
+            (1, 10, 100, 1000, 10000))
+        self.of_flowmsgs_batch_bytes = self._histogram(
+            'of_flowmsgs_batch_bytes',
+            'number of bytes of OF flow messages (and packet outs) sent to DP in one write',
+            self.REQUIRED_LABELS,
+            (128, 1024, 16384, 131072, 1048576))
+        self.of_flowmsgs_queued = self._dpid_gauge(
+            'of_flowmsgs_queued',
+            'number of OF flow messages (and packet outs) queued behind barriers in flight to DP')
+        self.of_barrier_rtt_secs = self._histogram(
+            'of_barrier_rtt_secs',
+            'seconds from sending a barrier to DP until its reply',
+            self.REQUIRED_LABELS,
+            (0.001, 0.01, 0.1, 1, 10))
         self.of_errors = self._dpid_counter(
             'of_errors',
             'number of OF errors received from DP')
@@ -104,6 +125,10 @@ class FaucetMetrics(PromClient):
             'vlan_neighbors',
             'number of L3 neighbors on a VLAN (whether resolved to L2 addresses, or not)',
             self.REQUIRED_LABELS + ['vlan', 'ipv'])
+        self.vlan_packet_ins_limited = self._counter(
+            'vlan_packet_ins_limited',
+            'number of OF packet_ins not admitted, over the VLAN packet in rate limit',
+            self.REQUIRED_LABELS + ['vlan'])
         self.vlan_learn_bans = self._gauge(
             'vlan_learn_bans',
             'number of times learning was banned on a VLAN',
@@ -130,6 +155,14 @@ class FaucetMetrics(PromClient):
             'bgp_neighbor_routes',
             'BGP neighbor route count',
             self.REQUIRED_LABELS + ['vlan', 'neighbor', 'ipv'])
+        self.bgp_route_changes = self._counter(
+            'bgp_route_changes',
+            'number of BGP route changes received',
+            self.REQUIRED_LABELS + ['vlan', 'ipv'])
+        self.bgp_route_queue_depth = self._gauge(
+            'bgp_route_queue_depth',
+            'number of BGP route changes queued to be applied',
+            self.REQUIRED_LABELS + ['vlan', 'ipv'])
         self.learned_macs = self._gauge(
             'learned_macs',
             ('MAC address stored as 64bit number to DP ID, port, VLAN, '
@@ -143,6 +176,10 @@ class FaucetMetrics(PromClient):
             'port_stack_state',
             'state of stacking on a port',
             self.PORT_REQUIRED_LABELS)
+        self.port_packet_ins_limited = self._counter(
+            'port_packet_ins_limited',
+            'number of OF packet_ins not admitted, over the port packet in rate limit',
+            self.PORT_REQUIRED_LABELS)
         self.port_learn_bans = self._gauge(
             'port_learn_bans',
             'number of times learning was banned on a port',
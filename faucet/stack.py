@@ -74,6 +74,13 @@ is technically a fixed allocation for this DP Stack instance."""
         self.roots_names = None
         self.root_flood_reflection = None
 
+        # Table of shortest paths, computed from the stack graph as needed
+        # and invalidated when the stack graph changes.
+        # Hop counts to each destination DP, by destination DP.
+        self.dyn_dists = {}
+        # Canonical shortest path, by (source DP, destination DP).
+        self.dyn_paths = {}
+
         # Whether the stack node is currently healthy
         self.dyn_healthy = False
 
@@ -177,6 +184,7 @@ is technically a fixed allocation for this DP Stack instance."""
             test_config_condition(count != 2, '%s defined only in one direction' % edge_name)
         if graph.size() and self.name in graph:
             self.graph = graph
+            self.invalidate_paths()
             for dp in graph.nodes():  # pylint: disable=invalid-name
                 path_to_root_len = len(self.shortest_path(self.root_name, src_dp=dp))
                 test_config_condition(
@@ -230,8 +238,24 @@ is technically a fixed allocation for this DP Stack instance."""
 
     def modify_link(self, dp, port, add=True):
         """Update the stack topology according to the event"""
+        self.invalidate_paths()
         return Stack.modify_topology(self.graph, dp, port, add)
 
+    def invalidate_paths(self):
+        """Forget all shortest paths, as the stack graph has changed."""
+        self.dyn_dists = {}
+        self.dyn_paths = {}
+
+    def _dists_to(self, dest_dp):
+        """Return dict of hop counts to a DP, by DP that can reach it."""
+        dists = self.dyn_dists.get(dest_dp, None)
+        if dists is None:
+            dists = {}
+            if dest_dp in self.graph:
+                dists = networkx.single_source_shortest_path_length(self.graph, dest_dp)
+            self.dyn_dists[dest_dp] = dists
+        return dists
+
     def hash(self):
         """Return hash of a topology graph"""
         return hash(tuple(sorted(self.graph.degree())))
@@ -262,15 +286,34 @@ is technically a fixed allocation for this DP Stack instance."""
         return self.canonical_port_order([port for port in ports if port.is_stack_up()])
 
     def shortest_path(self, dest_dp, src_dp=None):
-        """Return shortest path to a DP, as a list of DPs."""
+        """Return shortest path to a DP, as a list of DPs.
+
+        Where there are several shortest paths, the path that sorts first
+        is returned, so that all DPs agree on the same path. The list
+        returned is shared, and must not be modified.
+        """
         if src_dp is None:
             src_dp = self.name
-        if self.graph:
-            try:
-                return sorted(networkx.all_shortest_paths(self.graph, src_dp, dest_dp))[0]
-            except (networkx.exception.NetworkXNoPath, networkx.exception.NodeNotFound):
-                pass
-        return []
+        if not self.graph:
+            return []
+        path_key = (src_dp, dest_dp)
+        path = self.dyn_paths.get(path_key, None)
+        if path is None:
+            path = []
+            dists = self._dists_to(dest_dp)
+            if src_dp in dists:
+                # Each hop is to the lowest named neighbor that is
+                # one hop closer, which is the first sorted shortest path.
+                path.append(src_dp)
+                dp = src_dp  # pylint: disable=invalid-name
+                while dp != dest_dp:
+                    next_dist = dists[dp] - 1
+                    dp = min(  # pylint: disable=invalid-name
+                        peer_dp for peer_dp in self.graph.neighbors(dp)
+                        if dists.get(peer_dp, None) == next_dist)
+                    path.append(dp)
+            self.dyn_paths[path_key] = path
+        return path
 
     def shortest_path_to_root(self, src_dp=None):
         """Return shortest path to root DP, as list of DPs."""
@@ -309,9 +352,9 @@ is technically a fixed allocation for this DP Stack instance."""
         """Return length of the longest path to root in the stack."""
         if not self.graph or not self.root_name:
             return None
+        dists = self._dists_to(self.root_name)
         len_paths_to_root = [
-            len(self.shortest_path(self.root_name, src_dp=dp))
-            for dp in self.graph.nodes()]
+            dists[dp] + 1 if dp in dists else 0 for dp in self.graph.nodes()]
         if len_paths_to_root:
             return max(len_paths_to_root)
         return None
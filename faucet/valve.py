@@ -18,7 +18,9 @@
 # limitations under the License.
 
 import copy
+import heapq
 import logging
+import time
 
 from collections import defaultdict, deque
 
@@ -33,8 +35,11 @@ from faucet import valve_util
 from faucet import valve_pipeline
 from faucet.valve_manager_base import ValveManagerBase
 from faucet.valve_coprocessor import CoprocessorManager
+from faucet.valve_flowshadow import ValveFlowShadow
 from faucet.valve_lldp import ValveLLDPManager
 from faucet.valve_outonly import OutputOnlyManager
+from faucet.valve_ratelimit import PacketInAdmission
+from faucet.valve_send import ValveSendWindow
 from faucet.valve_stack import ValveStackManager
 
 
@@ -95,6 +100,62 @@ class ValveLogger:
         self.logger.warning(self._dpid_prefix(log_msg))
 
 
+class LearnedMacSlots:
+    """Stable learned_macs metric slots for hosts learned on a port/VLAN.
+
+    Each MAC keeps its slot while learned. Slots of expired MACs are reused,
+    lowest first, and MACs are lazily compacted into the lowest slots once
+    more slots are free than in use.
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.free_slots = []
+        self.highwater = 0
+
+    def _compact(self):
+        live = len(self.slots)
+        slot_values = {}
+        low_free_slots = sorted(slot for slot in self.free_slots if slot < live)
+        high_slots = sorted(
+            (slot, eth_src_int) for eth_src_int, slot in self.slots.items() if slot >= live)
+        for new_slot, (slot, eth_src_int) in zip(low_free_slots, high_slots):
+            self.slots[eth_src_int] = new_slot
+            slot_values[new_slot] = eth_src_int
+            slot_values[slot] = 0
+        self.free_slots = []
+        self.highwater = live
+        return slot_values
+
+    def update(self, changes):
+        """Update slots for learned and expired MACs.
+
+        Args:
+            changes (dict): True if MAC (int) learned, False if expired.
+        Returns:
+            dict: MAC (or 0 if none) by slot, for slots that changed.
+        """
+        slot_values = {}
+        for eth_src_int, learned in changes.items():
+            if not learned:
+                slot = self.slots.pop(eth_src_int, None)
+                if slot is not None:
+                    heapq.heappush(self.free_slots, slot)
+                    slot_values[slot] = 0
+        for eth_src_int, learned in changes.items():
+            if learned and eth_src_int not in self.slots:
+                if self.free_slots:
+                    slot = heapq.heappop(self.free_slots)
+                else:
+                    slot = self.highwater
+                    self.highwater += 1
+                self.slots[eth_src_int] = slot
+                slot_values[slot] = eth_src_int
+        if len(self.free_slots) > len(self.slots):
+            slot_values.update(self._compact())
+        return slot_values
+
+
 class Valve:
     """Generates the messages to configure a datapath as a l2 learning switch.
 
@@ -105,15 +166,22 @@ class Valve:
     __slots__ = [
         '_coprocessor_manager',
         '_dot1x_manager',
+        '_flow_reconcile_deadline',
+        '_flow_reconcile_prev_ids',
+        '_flow_reconcile_stats',
         '_last_advertise_sec',
         '_last_fast_advertise_sec',
         '_last_lldp_advertise_sec',
         '_last_packet_in_sec',
         '_last_pipeline_flows',
+        '_packet_in_admission',
         '_packet_in_count_sec',
-        '_port_highwater',
+        '_learned_mac_slots',
         '_route_manager_by_eth_type',
         '_route_manager_by_ipv',
+        '_send_window',
+        '_service_times',
+        '_held_flow_msgs',
         '_lldp_manager',
         '_managers',
         '_output_only_manager',
@@ -122,6 +190,7 @@ class Valve:
         'acl_manager',
         'dot1x',
         'dp',
+        'flow_shadow',
         'logger',
         'logname',
         'metrics',
@@ -135,6 +204,10 @@ class Valve:
     USE_BARRIERS = True
     STATIC_TABLE_IDS = False
     GROUPS = True
+    RECONCILE_FLOWS = True
+    RECONCILE_FLOWS_TIMEOUT = 10
+    MAX_INFLIGHT_BARRIERS = 0
+    SEND_CHUNK_MSGS = 500
 
 
     def __init__(self, dp, logname, metrics, notifier, dot1x):
@@ -146,7 +219,15 @@ class Valve:
         self.ofchannel_logger = None
         self.logger = None
         self.recent_ofmsgs = deque(maxlen=32)
+        self.flow_shadow = ValveFlowShadow()
+        self._flow_reconcile_deadline = None
+        self._flow_reconcile_prev_ids = None
+        self._flow_reconcile_stats = None
+        self._send_window = ValveSendWindow()
+        self._service_times = {}
+        self._held_flow_msgs = None
         self._last_pipeline_flows = []
+        self._packet_in_admission = None
         self._packet_in_count_sec = None
         self._last_packet_in_sec = None
         self._last_advertise_sec = None
@@ -168,6 +249,12 @@ class Valve:
         metrics_var = getattr(self.metrics, var)
         metrics_var.labels(**labels).set(val)
 
+    def _observe_var(self, var, val, labels=None):
+        if labels is None:
+            labels = self.dp.base_prom_labels()
+        metrics_var = getattr(self.metrics, var)
+        metrics_var.labels(**labels).observe(val)
+
     def _set_port_var(self, var, val, port):
         self._set_var(var, val, labels=self.dp.port_labels(port.number))
 
@@ -201,13 +288,22 @@ class Valve:
         self._last_lldp_advertise_sec = 0
         self._route_manager_by_ipv = {}
         self._route_manager_by_eth_type = {}
-        self._port_highwater = {}
+        self._learned_mac_slots = {}
+        self._service_times = {}
+        if not self._shadow_flows():
+            self.flow_shadow = ValveFlowShadow()
+
+        self._send_window.max_inflight = self.dp.max_inflight_barriers
+        if self._send_window.max_inflight is None:
+            self._send_window.max_inflight = self.MAX_INFLIGHT_BARRIERS
+        self._packet_in_admission = PacketInAdmission(
+            port_pps=self.dp.admit_packetin_port_pps,
+            vlan_pps=self.dp.admit_packetin_vlan_pps,
+            dp_pps=self.dp.admit_packetin_dp_pps)
 
         self.dp.reset_refs()
         for vlan_vid in self.dp.vlans.keys():
-            self._port_highwater[vlan_vid] = {}
-            for port_number in self.dp.ports.keys():
-                self._port_highwater[vlan_vid][port_number] = 0
+            self._learned_mac_slots[vlan_vid] = {}
 
         self._output_only_manager = OutputOnlyManager(
             self.dp.tables['vlan'], self.dp.highest_priority)
@@ -256,7 +352,8 @@ class Valve:
                 self.dp.max_host_fib_retry_count,
                 self.dp.max_resolve_backoff_time, proactive_learn,
                 self.DEC_TTL, self.dp.multi_out, fib_table,
-                self.dp.tables['vip'], self.pipeline, self.dp.routers, self.stack_manager)
+                self.dp.tables['vip'], self.pipeline, self.dp.routers, self.stack_manager,
+                groups=self.dp.groups if self.dp.group_table_routing else None)
             self._route_manager_by_ipv[route_manager.IPV] = route_manager
             for vlan in self.dp.vlans.values():
                 if vlan.faucet_vips_by_ipv(route_manager.IPV):
@@ -295,7 +392,90 @@ class Valve:
             valve_of.faucet_async(
                 packet_in=False, notify_flow_removed=False, port_status=False),
             valve_of.desc_stats_request()]
-        ofmsgs.extend(self._delete_all_valve_flows())
+        if not self._can_reconcile_flows():
+            ofmsgs.extend(self._delete_all_valve_flows())
+        return ofmsgs
+
+    def _shadow_flows(self):
+        """Return True if flows sent are shadowed, to be able to reconcile them later."""
+        return self.RECONCILE_FLOWS and self.dp.reconcile_flows
+
+    def _can_reconcile_flows(self):
+        """Return True if flows can be reconciled with the DP, rather than deleted and re-added."""
+        return self._shadow_flows() and bool(self.flow_shadow.flows)
+
+    def _reconcile_flows(self, ofmsgs, now):
+        """Hold back flowmods for a DP, requesting its flows to reconcile them with.
+
+        Groups and meters are not deleted, as that would also delete flows
+        using them, and those already added are modified instead.
+        """
+        self.logger.info('Reconciling flows with DP')
+        self.flow_shadow.clear()
+        self.flow_shadow.apply(valve_of.valve_flowreorder(
+            [ofmsg for ofmsg in ofmsgs if valve_of.is_flowmod(ofmsg)], use_barriers=False))
+        prev_group_ids = self.flow_shadow.group_ids
+        prev_meter_ids = self.flow_shadow.meter_ids
+        # Groups and meters not added again are deleted once flows are reconciled.
+        self.flow_shadow.group_ids = set()
+        self.flow_shadow.meter_ids = set()
+        self._flow_reconcile_prev_ids = (prev_group_ids, prev_meter_ids)
+        self._flow_reconcile_stats = []
+        self._flow_reconcile_deadline = now + self.RECONCILE_FLOWS_TIMEOUT
+        reconcile_ofmsgs = []
+        for ofmsg in ofmsgs:
+            if (valve_of.is_flowmod(ofmsg) or
+                    valve_of.is_groupdel(ofmsg) or valve_of.is_meterdel(ofmsg)):
+                continue
+            if valve_of.is_groupadd(ofmsg) and ofmsg.group_id in prev_group_ids:
+                ofmsg = valve_of.groupmod(
+                    type_=ofmsg.type, group_id=ofmsg.group_id, buckets=ofmsg.buckets)
+            elif valve_of.is_meteradd(ofmsg) and ofmsg.meter_id in prev_meter_ids:
+                ofmsg = valve_of.metermod(
+                    flags=ofmsg.flags, meter_id=ofmsg.meter_id, bands=ofmsg.bands)
+            reconcile_ofmsgs.append(ofmsg)
+        reconcile_ofmsgs.append(valve_of.flow_stats_request())
+        return reconcile_ofmsgs
+
+    def _reset_reconcile_flows(self):
+        self._flow_reconcile_deadline = None
+        self._flow_reconcile_prev_ids = None
+        self._flow_reconcile_stats = None
+
+    def _reconcile_flows_fallback(self, now):
+        """Give up reconciling flows with a DP, and cold start it instead."""
+        self.logger.warning('Could not reconcile flows with DP, deleting and re-adding all flows')
+        self._reset_reconcile_flows()
+        up_port_nos = set(self.dp.dyn_up_port_nos)
+        # Flush port state, as all flows are about to be deleted.
+        self.ports_delete(self.dp.ports.keys(), log_msg='flushed')
+        ofmsgs = self._cold_start_ports_and_vlans(now, up_port_nos)
+        self.dp.cold_start(now)
+        return ofmsgs
+
+    def flow_stats_reply_handler(self, msg):
+        """Handle flow stats from the DP, sending flows needed to reconcile with flow shadow.
+
+        Args:
+            msg (OFPFlowStatsReply): msg sent from switch.
+        Returns:
+            list: OpenFlow messages, if any.
+        """
+        if self._flow_reconcile_stats is None:
+            return []
+        self._flow_reconcile_stats.extend(msg.body)
+        if msg.flags & valve_of.ofp.OFPMPF_REPLY_MORE:
+            return []
+        flow_stats = self._flow_reconcile_stats
+        prev_group_ids, prev_meter_ids = self._flow_reconcile_prev_ids
+        self._reset_reconcile_flows()
+        ofmsgs = self.flow_shadow.reconcile(flow_stats)
+        self.logger.info('Reconciled %u flows on DP with %u expected, sending %u flow changes' % (
+            len(flow_stats), len(self.flow_shadow.flows), len(ofmsgs)))
+        for group_id in prev_group_ids - self.flow_shadow.group_ids:
+            ofmsgs.append(valve_of.groupdel(group_id=group_id))
+        for meter_id in prev_meter_ids - self.flow_shadow.meter_ids:
+            ofmsgs.append(valve_of.meterdel(meter_id=meter_id))
         return ofmsgs
 
     def ofchannel_log(self, ofmsgs):
@@ -328,7 +508,7 @@ class Valve:
         ofmsgs = [valve_table.wildcard_table.flowdel()]
         if self.dp.meters or self.dp.packetin_pps or self.dp.slowpath_pps:
             ofmsgs.append(valve_of.meterdel())
-        if self.dp.group_table:
+        if self.dp.group_table or self.dp.group_table_routing:
             ofmsgs.append(self.dp.groups.delete_all())
         return ofmsgs
 
@@ -416,6 +596,39 @@ class Valve:
             ofmsgs.extend(self.del_vlan(vlan))
         return ofmsgs
 
+    def _warm_change_vlans(self, vlans, prev_vlans, prev_group_ids):
+        """Change VLANs without interrupting forwarding, keeping learned hosts.
+
+        Only flows that differ from those installed are changed, and flows
+        no longer needed deleted, rather than deleting and re-adding all flows.
+        """
+        other_ofmsgs = []
+        for vlan in vlans:
+            prev_vlan = prev_vlans.get(vlan.vid, None)
+            if prev_vlan is not None:
+                # Host flows have timeouts so are not in the flow shadow,
+                # and must be deleted explicitly for hosts not kept.
+                for entry in vlan.clone_dyn_state(prev_vlan):
+                    other_ofmsgs.extend(
+                        self.switch_manager.delete_host_from_vlan(entry.eth_src, vlan))
+        ofmsgs = self.del_vlans(vlans) + self.add_vlans(vlans, cold_start=True)
+        flowmods = []
+        readded_group_ids = set()
+        for ofmsg in ofmsgs:
+            if valve_of.is_flowmod(ofmsg):
+                flowmods.append(ofmsg)
+            elif valve_of.is_groupadd(ofmsg) and ofmsg.group_id in prev_group_ids:
+                # Modify groups in place, rather than delete and add.
+                readded_group_ids.add(ofmsg.group_id)
+                other_ofmsgs.append(valve_of.groupmod(
+                    type_=ofmsg.type, group_id=ofmsg.group_id, buckets=ofmsg.buckets))
+            else:
+                other_ofmsgs.append(ofmsg)
+        other_ofmsgs = [
+            ofmsg for ofmsg in other_ofmsgs
+            if not (valve_of.is_groupdel(ofmsg) and ofmsg.group_id in readded_group_ids)]
+        return other_ofmsgs + self.flow_shadow.changes(flowmods)
+
     def _get_all_configured_port_nos(self):
         ports = set(self.dp.non_vlan_ports())
         for vlan in self.dp.vlans.values():
@@ -635,8 +848,14 @@ class Valve:
         self.notify(
             {'DP_CHANGE': {
                 'reason': 'cold_start'}})
+        # A changed pipeline may remove tables, so cannot be reconciled.
+        can_reconcile_flows = self._can_reconcile_flows() and not self._pipeline_change()
         ofmsgs = self._cold_start_ports_and_vlans(now, discovered_up_ports)
+        self._reset_reconcile_flows()
+        if can_reconcile_flows:
+            ofmsgs = self._reconcile_flows(ofmsgs, now)
         self.dp.cold_start(now)
+        self._service_times = {}
         self._inc_var('of_dp_connections')
         self._reset_dp_status()
         return ofmsgs
@@ -648,6 +867,17 @@ class Valve:
             {'DP_CHANGE': {
                 'reason': 'disconnect'}})
         self.dp.dyn_running = False
+        self._service_times = {}
+        self._send_window.reset()
+        self._held_flow_msgs = None
+        if self._flow_reconcile_prev_ids is not None:
+            # Groups and meters not yet reconciled may still be on the DP.
+            prev_group_ids, prev_meter_ids = self._flow_reconcile_prev_ids
+            self.flow_shadow.group_ids.update(prev_group_ids)
+            self.flow_shadow.meter_ids.update(prev_meter_ids)
+        self._reset_reconcile_flows()
+        self._packet_in_admission.reset()
+        self._set_var('of_flowmsgs_queued', 0)
         self._inc_var('of_dp_disconnections')
         self._reset_dp_status()
         self.ports_delete(self.dp.ports.keys(), now=now)
@@ -887,6 +1117,44 @@ class Valve:
                 return True
         return False
 
+    def admit_packet_in(self, now, msg):
+        """Admit a packet in within the port, VLAN and DP packet in rate limits.
+
+        Args:
+            now (float): current epoch time.
+            msg (OFPPacketIn): packet in message from the datapath.
+        Returns:
+            bool: True if the packet in is admitted.
+            list: OpenFlow messages, if any (e.g. to ban learning on a port over its limit).
+        """
+        if not self._packet_in_admission.active:
+            return (True, [])
+        if not msg.match or not msg.data:
+            return (True, [])
+        in_port = msg.match.get('in_port', None)
+        _, _, _, _, vlan_vid = valve_packet.parse_eth_header(msg.data)
+        limited = self._packet_in_admission.admit(now, in_port, vlan_vid)
+        if limited is None:
+            return (True, [])
+        ofmsgs = []
+        if limited == PacketInAdmission.PORT:
+            if in_port in self.dp.ports:
+                self._inc_var('port_packet_ins_limited', labels=self.dp.port_labels(in_port))
+                port = self.dp.ports[in_port]
+                if (self.dp.admit_packetin_port_ban and
+                        self._packet_in_admission.ban_port(
+                            now, in_port, self.dp.learn_ban_timeout)):
+                    self.logger.info(
+                        'packet in rate limit reached on %s, '
+                        'temporarily banning learning on this port' % port)
+                    ofmsgs.extend(self.switch_manager.ban_port_learning(port))
+        elif limited == PacketInAdmission.VLAN:
+            self._inc_var('vlan_packet_ins_limited', labels=dict(
+                self.dp.base_prom_labels(), vlan=vlan_vid))
+        else:
+            self._inc_var('of_limited_packet_ins')
+        return (False, ofmsgs)
+
     def learn_host(self, now, pkt_meta, other_valves):
         """Possibly learn a host on a port.
 
@@ -904,12 +1172,11 @@ class Valve:
             stacked_other_valves, pkt_meta)
         if learn_port is not None:
             learn_flows, previous_port, update_cache = self.switch_manager.learn_host_on_vlan_ports(
-                now, learn_port, pkt_meta.vlan, pkt_meta.eth_src,
+                now, learn_port, pkt_meta.vlan, pkt_meta.eth_src, pkt_meta.eth_src_int,
                 last_dp_coldstart_time=self.dp.dyn_last_coldstart_time)
             if update_cache:
-                pkt_meta.vlan.add_cache_host(pkt_meta.eth_src, learn_port, now)
-                if pkt_meta.l3_pkt is None:
-                    pkt_meta.reparse_ip()
+                pkt_meta.vlan.add_cache_host(pkt_meta.eth_src_int, learn_port, now)
+                pkt_meta.parse_l3_addrs()
                 learn_log = 'L2 learned on %s %s (%u hosts total)' % (
                     learn_port, pkt_meta.log(), pkt_meta.vlan.hosts_count())
                 stack_descr = None
@@ -942,7 +1209,8 @@ class Valve:
             return learn_flows
         return []
 
-    def parse_rcv_packet(self, in_port, vlan_vid, eth_type, data, orig_len, pkt, eth_pkt, vlan_pkt):
+    def parse_rcv_packet(self, in_port, vlan_vid, eth_type, data, orig_len, eth_src, eth_dst,
+                         eth_src_int):
         """Parse a received packet into a PacketMeta instance.
 
         Args:
@@ -951,20 +1219,19 @@ class Valve:
             eth_type (int): Ethernet type of packet.
             data (bytes): Raw packet data.
             orig_len (int): Original length of packet.
-            pkt (ryu.lib.packet.packet): parsed packet received.
-            ekt_pkt (ryu.lib.packet.ethernet): parsed Ethernet header.
-            vlan_pkt (ryu.lib.packet.vlan): parsed VLAN Ethernet header.
+            eth_src (str): source Ethernet MAC address.
+            eth_dst (str): destination Ethernet MAC address.
+            eth_src_int (int): source Ethernet MAC address, as an integer.
         Returns:
             PacketMeta instance.
         """
-        eth_src = eth_pkt.src
-        eth_dst = eth_pkt.dst
         vlan = None
         if vlan_vid in self.dp.vlans:
             vlan = self.dp.vlans[vlan_vid]
         port = self.dp.ports[in_port]
         pkt_meta = valve_packet.PacketMeta(
-            data, orig_len, pkt, eth_pkt, vlan_pkt, port, vlan, eth_src, eth_dst, eth_type)
+            data, orig_len, None, None, None, port, vlan, eth_src, eth_dst, eth_type,
+            eth_src_int)
         if vlan_vid == self.dp.global_vlan:
             vlan_vid = valve_packet.int_from_mac(pkt_meta.eth_dst)
             vlan = self.dp.vlans.get(vlan_vid, None)
@@ -992,12 +1259,11 @@ class Valve:
         if not msg.data:
             return None
         # Truncate packet in data (OVS > 2.5 does not honor max_len)
-        data = bytes(msg.data[:valve_of.MAX_PACKET_IN_BYTES])
+        data = bytes(memoryview(msg.data)[:valve_of.MAX_PACKET_IN_BYTES])
 
-        # eth/VLAN header only
-        pkt, eth_pkt, eth_type, vlan_pkt, vlan_vid = valve_packet.parse_packet_in_pkt(
-            data, max_len=valve_packet.ETH_VLAN_HEADER_SIZE)
-        if pkt is None or eth_pkt is None:
+        # eth/VLAN header only, Ryu packets are parsed later if needed.
+        eth_dst, eth_src, eth_src_int, eth_type, vlan_vid = valve_packet.parse_eth_header(data)
+        if eth_src is None:
             self.logger.info(
                 'unparseable packet from port %u' % in_port)
             return None
@@ -1008,13 +1274,14 @@ class Valve:
                 'packet for unknown VLAN %u' % vlan_vid)
             return None
         pkt_meta = self.parse_rcv_packet(
-            in_port, vlan_vid, eth_type, data, msg.total_len, pkt, eth_pkt, vlan_pkt)
-        if not valve_packet.mac_addr_is_unicast(pkt_meta.eth_src):
+            in_port, vlan_vid, eth_type, data, msg.total_len, eth_src, eth_dst,
+            eth_src_int)
+        if not valve_packet.mac_int_is_unicast(pkt_meta.eth_src_int):
             self.logger.info(
                 'packet with non-unicast eth_src %s port %u' % (
                     pkt_meta.eth_src, in_port))
             return None
-        if valve_packet.mac_addr_all_zeros(pkt_meta.eth_src):
+        if valve_packet.mac_int_all_zeros(pkt_meta.eth_src_int):
             self.logger.info(
                 'packet with all zeros eth_src %s port %u' % (
                     pkt_meta.eth_src, in_port))
@@ -1079,21 +1346,14 @@ class Valve:
                 'port_learn_bans', port.dyn_learn_ban_count, port)
             self._set_var(
                 'port_vlan_hosts_learned', port_vlan_hosts_learned, labels=port_vlan_labels)
-            highwater = self._port_highwater[vlan.vid][port.number]
-            stats_stale = vlan.dyn_host_cache_stats_stale.get(port.number, True)
+            changes = vlan.dyn_host_cache_changes.pop(port.number, None)
             # No change in hosts learned on this VLAN, don't re-export MACs.
-            if highwater == port_vlan_hosts_learned and not stats_stale:
+            if not changes:
                 return
-            if highwater > port_vlan_hosts_learned:
-                for i in range(port_vlan_hosts_learned, highwater + 1):
-                    self._set_var('learned_macs', 0, dict(port_vlan_labels, n=i))
-            self._port_highwater[vlan.vid][port.number] = port_vlan_hosts_learned
-            port_vlan_hosts = port.hosts(vlans=[vlan])
-            assert port_vlan_hosts_learned == len(port_vlan_hosts)
-            # TODO: make MAC table updates less expensive.
-            for i, entry in enumerate(sorted(port_vlan_hosts)):
-                self._set_var('learned_macs', entry.eth_src_int, dict(port_vlan_labels, n=i))
-            vlan.dyn_host_cache_stats_stale[port.number] = False
+            learned_mac_slots = self._learned_mac_slots[vlan.vid].setdefault(
+                port.number, LearnedMacSlots())
+            for slot, eth_src_int in learned_mac_slots.update(changes).items():
+                self._set_var('learned_macs', eth_src_int, dict(port_vlan_labels, n=slot))
 
         if updated_port:
             for vlan in updated_port.vlans():
@@ -1217,6 +1477,13 @@ class Valve:
         """
         ofmsgs_by_valve = defaultdict(list)
         if self.dp.dyn_running:
+            if self._flow_reconcile_deadline is not None and now > self._flow_reconcile_deadline:
+                ofmsgs_by_valve[self].extend(self._reconcile_flows_fallback(now))
+            release_time = self._send_window.release_time()
+            if release_time is not None and now >= release_time:
+                # A barrier reply was lost, so sending (even no) flows
+                # releases the batches queued behind it.
+                ofmsgs_by_valve.setdefault(self, [])
             ofmsgs_by_valve.update(self._lacp_state_expire(now, other_valves))
             for vlan in self.dp.vlans.values():
                 expired_hosts = self.switch_manager.expire_hosts_from_vlan(vlan, now)
@@ -1325,16 +1592,23 @@ class Valve:
                 ofmsgs.append(valve_of.meteradd(
                     new_dp.meters.get(added_meter).entry, command=0))
 
+        prev_vlans = self.dp.vlans
+        prev_group_ids = set()
+        if self.dp.group_table:
+            prev_group_ids = set(self.dp.groups.entries)
         self.dp_init(new_dp)
 
         if changed_vids:
             changed_vlans = [self.dp.vlans[vid] for vid in changed_vids]
-            # TODO: handle change versus add separately so can avoid delete first.
-            ofmsgs.extend(self.del_vlans(changed_vlans))
-            for vlan in changed_vlans:
-                vlan.reset_caches()
-            # The proceeding delete operation means we don't have to generate more deletes.
-            ofmsgs.extend(self.add_vlans(changed_vlans, cold_start=True))
+            if self._can_reconcile_flows():
+                ofmsgs.extend(self._warm_change_vlans(
+                    changed_vlans, prev_vlans, prev_group_ids))
+            else:
+                ofmsgs.extend(self.del_vlans(changed_vlans))
+                for vlan in changed_vlans:
+                    vlan.reset_caches()
+                # The proceeding delete operation means we don't have to generate more deletes.
+                ofmsgs.extend(self.add_vlans(changed_vlans, cold_start=True))
         if changed_ports:
             ofmsgs.extend(self.ports_add(all_up_port_nos))
         if added_ports:
@@ -1425,6 +1699,24 @@ class Valve:
         route_manager = self._route_manager_by_ipv[ip_dst.version]
         return route_manager.del_route(vlan, ip_dst)
 
+    def update_routes(self, vlan, route_changes):
+        """Add and delete routes in VLAN routing table, updating the FIB once per IP version.
+
+        Args:
+            vlan (VLAN): VLAN containing the routing table.
+            route_changes (list): (ip_dst, ip_gw) to add a route, or (ip_dst, None) to delete one.
+        Returns:
+            list: OpenFlow messages.
+        """
+        route_changes_by_ipv = defaultdict(list)
+        for ip_dst, ip_gw in route_changes:
+            route_changes_by_ipv[ip_dst.version].append((ip_dst, ip_gw))
+        ofmsgs = []
+        for ipv, ipv_route_changes in route_changes_by_ipv.items():
+            route_manager = self._route_manager_by_ipv[ipv]
+            ofmsgs.extend(route_manager.update_routes(vlan, ipv_route_changes))
+        return ofmsgs
+
     def resolve_gateways(self, now, _other_valves):
         """Call route managers to re/resolve gateways.
 
@@ -1440,11 +1732,91 @@ class Valve:
             return {self: ofmsgs}
         return {}
 
-    def oferror(self, msg):
+    def _state_expire_times(self):
+        """Yield times state_expire() next has work to do on a running DP."""
+        yield self._flow_reconcile_deadline
+        yield self._send_window.release_time()
+        for ports_up in self.dp.lags_up().values():
+            for port in ports_up:
+                yield port.dyn_lacp_updated_time + self.dp.lacp_timeout
+        for vlan in self.dp.vlans.values():
+            yield self.switch_manager.next_host_expire_time(vlan)
+            for route_manager in self._route_manager_by_ipv.values():
+                yield route_manager.next_resolve_expire_hosts_time(vlan)
+
+    def _resolve_gateways_times(self):
+        """Yield times resolve_gateways() next has work to do on a running DP."""
+        for route_manager in self._route_manager_by_ipv.values():
+            for vlan in self.dp.vlans.values():
+                yield route_manager.next_resolve_gateways_time(vlan)
+
+    def next_service_time(self, valve_service):
+        """Return when a periodic service next has work to do on this Valve.
+
+        Args:
+            valve_service (str): name of service method (e.g. state_expire).
+        Returns:
+            float: epoch time service is next due (0 if due every time), or None if
+                the service has no work until this Valve's state changes.
+        """
+        if valve_service == 'advertise':
+            if not self.dp.advertise_interval or not self._route_manager_by_ipv:
+                return None
+            return self._last_advertise_sec + self.dp.advertise_interval
+        if valve_service == 'fast_advertise':
+            if (not self.dp.fast_advertise_interval or
+                    not (self.dp.lacp_active_ports or self.dp.lldp_beacon)):
+                return None
+            return self._last_fast_advertise_sec + self.dp.fast_advertise_interval
+        if valve_service == 'fast_state_expire':
+            # Stack ports time out even when the DP is not running.
+            if not (self.dp.lldp_beacon or self.dp.stack_ports()):
+                return None
+            return 0
+        if not self.dp.dyn_running:
+            return None
+        if valve_service == 'state_expire':
+            service_times = self._state_expire_times()
+        elif valve_service == 'resolve_gateways':
+            service_times = self._resolve_gateways_times()
+        else:
+            return 0
+        return min(
+            (service_time for service_time in service_times if service_time is not None),
+            default=None)
+
+    def service_due(self, valve_service, now):
+        """Return True if a periodic service has work to do on this Valve now.
+
+        When a service is next due is kept until it is due, or until this
+        Valve sends flows, connects, disconnects or is reconfigured.
+
+        Args:
+            valve_service (str): name of service method (e.g. state_expire).
+            now (float): current epoch time.
+        Returns:
+            bool: True if due.
+        """
+        if valve_service not in self._service_times:
+            self._service_times[valve_service] = self.next_service_time(valve_service)
+        service_time = self._service_times[valve_service]
+        if service_time is None or service_time > now:
+            return False
+        # Calling the service changes when it is next due.
+        del self._service_times[valve_service]
+        return True
+
+    def oferror(self, msg, now):
         """Correlate OFError message with flow we sent, if any.
 
+        An error while reconciling flows means the DP is not as expected,
+        so the DP is cold started instead.
+
         Args:
             msg (ryu.controller.ofp_event.EventOFPMsgBase): message from datapath.
+            now (float): current epoch time.
+        Returns:
+            list: OpenFlow messages, if any.
         """
         self._inc_var('of_errors')
         orig_msgs = [orig_msg for orig_msg in self.recent_ofmsgs if orig_msg.xid == msg.xid]
@@ -1460,6 +1832,9 @@ class Valve:
         except KeyError:
             pass
         self.logger.error('OFError type: %s code: %s %s' % (error_type, error_code, error_txt))
+        if self._flow_reconcile_stats is not None:
+            return self._reconcile_flows_fallback(now)
+        return []
 
     def prepare_send_flows(self, flow_msgs):
         """Prepare to send flows to datapath.
@@ -1469,31 +1844,102 @@ class Valve:
         """
         if flow_msgs is None:
             return flow_msgs
+        # Sending flows means state changed, so services may be due sooner.
+        self._service_times = {}
         reordered_flow_msgs = valve_of.valve_flowreorder(
             flow_msgs, use_barriers=self.USE_BARRIERS)
         self.ofchannel_log(reordered_flow_msgs)
         self._inc_var('of_flowmsgs_sent', val=len(reordered_flow_msgs))
         self.recent_ofmsgs.extend(reordered_flow_msgs)
+        if self._shadow_flows():
+            self.flow_shadow.apply(reordered_flow_msgs)
+        return reordered_flow_msgs
+
+    def _prepare_ryu_flows(self, ryu_dp, flow_msgs):
+        reordered_flow_msgs = self.prepare_send_flows(flow_msgs)
+        for flow_msg in reordered_flow_msgs:
+            flow_msg.datapath = ryu_dp
+            if flow_msg.xid is None:
+                ryu_dp.set_xid(flow_msg)
         return reordered_flow_msgs
 
     def send_flows(self, ryu_dp, flow_msgs, now):
-        """Send flows to datapath (or disconnect an OF session).
+        """Send flows to datapath.
 
         Args:
             ryu_dp (ryu.controller.controller.Datapath): datapath.
             flow_msgs (list): OpenFlow messages to send.
+            now (float): current epoch time.
         """
+        reordered_flow_msgs = self._prepare_ryu_flows(ryu_dp, flow_msgs)
+        if self._held_flow_msgs is not None:
+            self._held_flow_msgs.extend(reordered_flow_msgs)
+            return
+        self._send_window.enqueue(valve_of.serialize_ofmsg_batches(reordered_flow_msgs))
+        self._send_ready_batches(ryu_dp, now)
 
-        def ryu_send_flows(local_flow_msgs):
-            for flow_msg in self.prepare_send_flows(local_flow_msgs):
-                flow_msg.datapath = ryu_dp
-                ryu_dp.send_msg(flow_msg)
+    def send_flows_chunks(self, ryu_dp, flow_msgs, chunk_msgs=None):
+        """Send flows to datapath a chunk at a time.
 
-        if flow_msgs is None:
-            self.datapath_disconnect(now)
-            ryu_dp.close()
-        else:
-            ryu_send_flows(flow_msgs)
+        Flows are reordered now, then serialized and written chunk_msgs at
+        a time as the returned generator is iterated, so the caller can
+        handle other events in between chunks. Flows sent by send_flows()
+        before the last chunk is written are held, and written after it.
+        Each chunk is written at the time it is reached, not when the
+        generator was created.
+
+        Args:
+            ryu_dp (ryu.controller.controller.Datapath): datapath.
+            flow_msgs (list): OpenFlow messages to send.
+            chunk_msgs (int): messages to write per chunk.
+        Returns:
+            generator: yields None after each chunk is written.
+        """
+        if chunk_msgs is None:
+            chunk_msgs = self.SEND_CHUNK_MSGS
+        reordered_flow_msgs = self._prepare_ryu_flows(ryu_dp, flow_msgs)
+        held_flow_msgs = []
+        self._held_flow_msgs = held_flow_msgs
+
+        def send_chunks():
+            for i in range(0, len(reordered_flow_msgs), chunk_msgs):
+                # Superseded by a disconnection or another chunked send.
+                if self._held_flow_msgs is not held_flow_msgs:
+                    return
+                self._send_window.enqueue(valve_of.serialize_ofmsg_batches(
+                    reordered_flow_msgs[i:i + chunk_msgs]))
+                self._send_ready_batches(ryu_dp, time.time())
+                yield
+            if self._held_flow_msgs is not held_flow_msgs:
+                return
+            self._held_flow_msgs = None
+            if held_flow_msgs:
+                self._send_window.enqueue(valve_of.serialize_ofmsg_batches(held_flow_msgs))
+                self._send_ready_batches(ryu_dp, time.time())
+
+        return send_chunks()
+
+    def _send_ready_batches(self, ryu_dp, now):
+        """Write batches not held back behind barriers in flight."""
+        labels = self.dp.base_prom_labels()
+        for batch_msgs, batch in self._send_window.ready(now):
+            ryu_dp.send(batch)
+            self._observe_var('of_flowmsgs_batch_size', batch_msgs, labels=labels)
+            self._observe_var('of_flowmsgs_batch_bytes', len(batch), labels=labels)
+        self._set_var('of_flowmsgs_queued', self._send_window.queued_msgs, labels=labels)
+
+    def barrier_reply_handler(self, ryu_dp, msg, now):
+        """Handle a barrier reply, sending any batches queued behind it.
+
+        Args:
+            ryu_dp (ryu.controller.controller.Datapath): datapath.
+            msg (OFPBarrierReply): msg sent from switch.
+            now (float): current epoch time.
+        """
+        rtt = self._send_window.barrier_reply(msg.xid, now)
+        if rtt is not None:
+            self._observe_var('of_barrier_rtt_secs', rtt)
+        self._send_ready_batches(ryu_dp, now)
 
     def flow_timeout(self, now, table_id, match):
         """Call flow timeout message handler:
@@ -1515,6 +1961,8 @@ class TfmValve(Valve):
     MAX_TABLE_ID = 0
     MIN_MAX_FLOWS = 0
     FILL_REQ = True
+    # Table features messages reset the pipeline, deleting all flows.
+    RECONCILE_FLOWS = False
 
     def _pipeline_flows(self):
         return [valve_of.table_features(
@@ -1552,6 +2000,8 @@ class ArubaValve(TfmValve):
     DEC_TTL = False
     # Aruba does not like empty miss instructions even if not used.
     FILL_REQ = False
+    # Avoid overflowing the switch's input queue during cold start.
+    MAX_INFLIGHT_BARRIERS = 2
 
     def _delete_all_valve_flows(self):
         ofmsgs = super(ArubaValve, self)._delete_all_valve_flows()
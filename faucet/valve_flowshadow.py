@@ -0,0 +1,253 @@
+"""Shadow of the flows FAUCET believes are installed in a datapath."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Education Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import defaultdict
+
+from faucet import valve_of
+
+
+def _matchkey(ofmsg):
+    return frozenset(ofmsg.match.items())
+
+
+def _serialized_match(ofmsg):
+    buf = bytearray()
+    ofmsg.match.serialize(buf, 0)
+    return bytes(buf)
+
+
+def _serialized_instructions(ofmsg):
+    buf = bytearray()
+    for instruction in ofmsg.instructions:
+        instruction.serialize(buf, len(buf))
+    return bytes(buf)
+
+
+def _wirekey(ofmsg):
+    """Return key identifying a flow (or flow stats entry) as the datapath does."""
+    return (ofmsg.table_id, ofmsg.priority, _serialized_match(ofmsg))
+
+
+def _wirevalue(ofmsg):
+    """Return the parts of a flow (or flow stats entry) that must be the same, to not be stale."""
+    return (ofmsg.cookie, _serialized_instructions(ofmsg))
+
+
+def _outputs_to(ofmsg, out_port, out_group):
+    """Return True if flow has an output action to out_port and a group action for out_group."""
+    if out_port == valve_of.ofp.OFPP_ANY and out_group == valve_of.ofp.OFPG_ANY:
+        return True
+    ports = set()
+    groups = set()
+    for instruction in ofmsg.instructions:
+        if valve_of.is_apply_actions(instruction):
+            for action in instruction.actions:
+                if action.type == valve_of.ofp.OFPAT_OUTPUT:
+                    ports.add(action.port)
+                elif action.type == valve_of.ofp.OFPAT_GROUP:
+                    groups.add(action.group_id)
+    return ((out_port == valve_of.ofp.OFPP_ANY or out_port in ports) and
+            (out_group == valve_of.ofp.OFPG_ANY or out_group in groups))
+
+
+class ValveFlowShadow:
+    """Shadow of the flows FAUCET believes are installed in a datapath.
+
+    Flows are keyed by table, priority and match, as a datapath keys them.
+    Flows with timeouts are not shadowed, as the datapath can expire them.
+    The IDs of groups and meters added are also kept.
+    """
+
+    def __init__(self):
+        self.flows = {}
+        self.group_ids = set()
+        self.meter_ids = set()
+        self._keys_by_table = defaultdict(set)
+        self._keys_by_match_field = defaultdict(set)
+
+    def clear(self):
+        """Forget all flows."""
+        self.flows = {}
+        self._keys_by_table = defaultdict(set)
+        self._keys_by_match_field = defaultdict(set)
+
+    @staticmethod
+    def _flowkey(ofmsg):
+        return (ofmsg.table_id, ofmsg.priority, _matchkey(ofmsg))
+
+    def _add(self, ofmsg):
+        key = self._flowkey(ofmsg)
+        if ofmsg.hard_timeout or ofmsg.idle_timeout:
+            self._del(key)
+            return
+        if key not in self.flows:
+            table_id, _, match_fields = key
+            self._keys_by_table[table_id].add(key)
+            for match_field in match_fields:
+                self._keys_by_match_field[match_field].add(key)
+        self.flows[key] = ofmsg
+
+    def _del(self, key):
+        if self.flows.pop(key, None) is None:
+            return
+        table_id, _, match_fields = key
+        self._keys_by_table[table_id].discard(key)
+        for match_field in match_fields:
+            keys = self._keys_by_match_field[match_field]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_match_field[match_field]
+
+    def _modify(self, key, ofmsg):
+        flow = self.flows[key]
+        self.flows[key] = valve_of.flowmod(
+            flow.cookie, valve_of.ofp.OFPFC_ADD, flow.table_id, flow.priority,
+            flow.out_port, flow.out_group, flow.match, tuple(ofmsg.instructions),
+            flow.hard_timeout, flow.idle_timeout, flow.flags)
+
+    def _matching_keys(self, ofmsg, strict):
+        """Return keys of flows that a delete or modify applies to."""
+        if ofmsg.table_id == valve_of.ofp.OFPTT_ALL:
+            table_ids = list(self._keys_by_table)
+        else:
+            table_ids = [ofmsg.table_id]
+        match_fields = _matchkey(ofmsg)
+        if strict:
+            keys = [(table_id, ofmsg.priority, match_fields) for table_id in table_ids]
+            keys = [key for key in keys if key in self.flows]
+        elif match_fields:
+            # Only flows that have all of the match fields can match, so only
+            # flows with the least common field need be checked.
+            keys = min(
+                (self._keys_by_match_field.get(match_field, ()) for match_field in match_fields),
+                key=len)
+            table_ids = set(table_ids)
+            keys = [
+                key for key in keys
+                if key[0] in table_ids and match_fields.issubset(key[2])]
+        else:
+            keys = []
+            for table_id in table_ids:
+                keys.extend(self._keys_by_table.get(table_id, ()))
+        cookie_mask = getattr(ofmsg, 'cookie_mask', 0)
+        return [
+            key for key in keys
+            if (self.flows[key].cookie & cookie_mask) == (ofmsg.cookie & cookie_mask) and
+            _outputs_to(self.flows[key], ofmsg.out_port, ofmsg.out_group)]
+
+    @staticmethod
+    def _apply_id(ids, ofmsg_id, all_id, delete):
+        if not delete:
+            ids.add(ofmsg_id)
+        elif ofmsg_id == all_id:
+            ids.clear()
+        else:
+            ids.discard(ofmsg_id)
+
+    def apply(self, ofmsgs):
+        """Update shadow with flow, group and meter mods, in the order they will be sent."""
+        for ofmsg in ofmsgs:
+            if valve_of.is_groupmod(ofmsg):
+                self._apply_id(
+                    self.group_ids, ofmsg.group_id, valve_of.ofp.OFPG_ALL,
+                    valve_of.is_groupdel(ofmsg))
+                continue
+            if valve_of.is_metermod(ofmsg):
+                self._apply_id(
+                    self.meter_ids, ofmsg.meter_id, valve_of.ofp.OFPM_ALL,
+                    valve_of.is_meterdel(ofmsg))
+                continue
+            if not valve_of.is_flowmod(ofmsg):
+                continue
+            command = ofmsg.command
+            if command == valve_of.ofp.OFPFC_ADD:
+                self._add(ofmsg)
+            elif command in (valve_of.ofp.OFPFC_DELETE, valve_of.ofp.OFPFC_DELETE_STRICT):
+                keys = self._matching_keys(ofmsg, command == valve_of.ofp.OFPFC_DELETE_STRICT)
+                if len(keys) == len(self.flows):
+                    self.clear()
+                    continue
+                for key in keys:
+                    self._del(key)
+            elif command in (valve_of.ofp.OFPFC_MODIFY, valve_of.ofp.OFPFC_MODIFY_STRICT):
+                for key in self._matching_keys(
+                        ofmsg, command == valve_of.ofp.OFPFC_MODIFY_STRICT):
+                    self._modify(key, ofmsg)
+
+    def reconcile(self, flow_stats):
+        """Return flowmods to make a datapath's flows the same as this shadow.
+
+        Args:
+            flow_stats (list): ryu.ofproto.ofproto_v1_3_parser.OFPFlowStats from the datapath.
+        Returns:
+            list: flowmods to delete flows not in the shadow, and add missing or stale flows.
+        """
+        missing_flows = {_wirekey(flow): flow for flow in self.flows.values()}
+        ofmsgs = []
+        for stat in flow_stats:
+            key = _wirekey(stat)
+            flow = missing_flows.pop(key, None)
+            if flow is None:
+                ofmsgs.append(valve_of.flowmod(
+                    0, valve_of.ofp.OFPFC_DELETE_STRICT, stat.table_id, stat.priority,
+                    valve_of.ofp.OFPP_ANY, valve_of.ofp.OFPG_ANY, stat.match, (), 0, 0))
+            elif _wirevalue(flow) != _wirevalue(stat):
+                ofmsgs.append(flow)
+        ofmsgs.extend(missing_flows.values())
+        return ofmsgs
+
+    def changes(self, ofmsgs):
+        """Return flowmods with the same result as ofmsgs, changing only flows that differ.
+
+        Flows that ofmsgs delete and then add again the same are left alone, flows
+        added again differently are modified in place and only flows not added
+        again are deleted, so that forwarding is not interrupted.
+
+        Args:
+            ofmsgs (list): flowmods, with all deletes applying before any adds.
+        Returns:
+            list: flowmods to send instead.
+        """
+        deleted_keys = set()
+        added = ValveFlowShadow()
+        ofmsgs_out = []
+        for ofmsg in ofmsgs:
+            command = ofmsg.command
+            if command in (valve_of.ofp.OFPFC_DELETE, valve_of.ofp.OFPFC_DELETE_STRICT):
+                deleted_keys.update(
+                    self._matching_keys(ofmsg, command == valve_of.ofp.OFPFC_DELETE_STRICT))
+            elif command == valve_of.ofp.OFPFC_ADD and not (
+                    ofmsg.hard_timeout or ofmsg.idle_timeout):
+                added.apply([ofmsg])
+            else:
+                ofmsgs_out.append(ofmsg)
+        for key, flow in added.flows.items():
+            current_flow = self.flows.get(key, None)
+            if current_flow is None:
+                ofmsgs_out.append(flow)
+            elif _wirevalue(current_flow) != _wirevalue(flow):
+                ofmsgs_out.append(valve_of.flowmod(
+                    flow.cookie, valve_of.ofp.OFPFC_MODIFY_STRICT, flow.table_id,
+                    flow.priority, flow.out_port, flow.out_group, flow.match,
+                    tuple(flow.instructions), 0, 0, flow.flags))
+        for key in deleted_keys - set(added.flows):
+            flow = self.flows[key]
+            ofmsgs_out.append(valve_of.flowmod(
+                0, valve_of.ofp.OFPFC_DELETE_STRICT, flow.table_id, flow.priority,
+                valve_of.ofp.OFPP_ANY, valve_of.ofp.OFPG_ANY, flow.match, (), 0, 0))
+        return ofmsgs_out
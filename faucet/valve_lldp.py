@@ -113,6 +113,7 @@ class ValveLLDPManager(ValveManagerBase):
             dict: ofmsgs by valve
         """
         stack_changes = 0
+        flood_changed_valves = set()
         ofmsgs_by_valve = defaultdict(list)
         stacked_valves = set()
         if self.stack_manager:
@@ -134,16 +135,20 @@ class ValveLLDPManager(ValveManagerBase):
                     port_up = True
                 elif port.is_stack_init() and port.stack['port'].is_stack_up():
                     port_up = True
+                # Our own stack port changed, so always reflood this DP.
+                flood_changed_valves.add(valve)
                 for stack_valve in stacked_valves:
-                    stack_valve.stack_manager.update_stack_topo(port_up, valve.dp, port)
+                    if stack_valve.stack_manager.update_stack_topo(port_up, valve.dp, port):
+                        flood_changed_valves.add(stack_valve)
         if stack_changes:
             self.logger.info('%u stack ports changed state' % stack_changes)
             notify_dps = {}
             for stack_valve in stacked_valves:
                 if not stack_valve.dp.dyn_running:
                     continue
-                ofmsgs_by_valve[stack_valve].extend(
-                    stack_valve.add_vlans(stack_valve.dp.vlans.values()))
+                if stack_valve in flood_changed_valves:
+                    ofmsgs_by_valve[stack_valve].extend(
+                        stack_valve.add_vlans(stack_valve.dp.vlans.values()))
                 for port in stack_valve.dp.stack_ports():
                     ofmsgs_by_valve[stack_valve].extend(
                         stack_valve.switch_manager.del_port(port))
@@ -20,6 +20,7 @@
 import functools
 import ipaddress
 import random
+import struct
 
 from ryu.lib import mac
 from ryu.lib import ofctl_v1_3 as ofctl
@@ -266,6 +267,17 @@ def is_packetout(ofmsg):
     return isinstance(ofmsg, parser.OFPPacketOut)
 
 
+def is_barrier(ofmsg):
+    """Return True if OF message is a BarrierRequest
+
+    Args:
+        ofmsg: ryu.ofproto.ofproto_v1_3_parser message.
+    Returns:
+        bool: True if is a BarrierRequest
+    """
+    return isinstance(ofmsg, parser.OFPBarrierRequest)
+
+
 def is_output(ofmsg):
     """Return True if flow message is an action output message.
 
@@ -606,6 +618,25 @@ def packetout(port_num, data):
     return packetouts([port_num], data)
 
 
+def flood_packetouts(port_nums, data, multi_out=True):
+    """Return OpenFlow packet outs to flood a packet to dataplane ports.
+
+    Args:
+        port_nums (list): ints, ports to output to.
+        data (bytes): raw packet to output.
+        multi_out (bool): True if one packet out can have multiple outputs.
+    Returns:
+        list: packet out messages.
+    """
+    if not port_nums:
+        return []
+    if multi_out:
+        return [packetouts(port_nums, data)]
+    port_nums = list(port_nums)
+    random.shuffle(port_nums)
+    return [packetout(port_num, data) for port_num in port_nums]
+
+
 @functools.lru_cache()
 def barrier():
     """Return OpenFlow barrier request.
@@ -849,6 +880,16 @@ def meterdel(datapath=None, meter_id=ofp.OFPM_ALL):
         meter_id)
 
 
+def metermod(datapath=None, flags=ofp.OFPMF_KBPS, meter_id=0, bands=None):
+    """Modify a meter."""
+    return parser.OFPMeterMod(
+        datapath,
+        ofp.OFPMC_MODIFY,
+        flags,
+        meter_id,
+        bands)
+
+
 def meteradd(meter_conf, command=ofp.OFPMC_ADD):
     """Add a meter based on YAML configuration."""
 
@@ -939,14 +980,31 @@ _MSG_KINDS_TYPES = {
 }
 
 
-# We need to examine the OF message more closely to classify it.
-_MSG_KINDS = {
-    parser.OFPFlowMod: (
-        ('deleteglobal', is_global_flowdel), ('delete', is_flowdel), ('flowaddmod', is_flowaddmod)),
-    parser.OFPGroupMod: (
-        ('deleteglobal', is_global_groupdel), ('delete', is_groupdel), ('groupadd', is_groupadd)),
-    parser.OFPMeterMod: (
-        ('deleteglobal', is_global_meterdel), ('delete', is_meterdel), ('meteradd', is_meteradd)),
+# We need to examine the OF message command more closely to classify it.
+_MSG_KINDS_COMMANDS = {
+    parser.OFPFlowMod: {
+        ofp.OFPFC_ADD: 'flowaddmod',
+        ofp.OFPFC_MODIFY: 'flowaddmod',
+        ofp.OFPFC_MODIFY_STRICT: 'flowaddmod',
+        ofp.OFPFC_DELETE: 'delete',
+        ofp.OFPFC_DELETE_STRICT: 'delete',
+    },
+    parser.OFPGroupMod: {
+        ofp.OFPGC_ADD: 'groupadd',
+        ofp.OFPGC_DELETE: 'delete',
+    },
+    parser.OFPMeterMod: {
+        ofp.OFPMC_ADD: 'meteradd',
+        ofp.OFPMC_DELETE: 'delete',
+    },
+}
+
+
+# A delete of this kind is global, if it is for all of these.
+_MSG_KINDS_GLOBAL_DELETES = {
+    parser.OFPFlowMod: is_global_flowdel,
+    parser.OFPGroupMod: is_global_groupdel,
+    parser.OFPMeterMod: is_global_meterdel,
 }
 
 
@@ -955,44 +1013,76 @@ def _msg_kind(ofmsg):
     ofmsg_kind = _MSG_KINDS_TYPES.get(ofmsg_type, None)
     if ofmsg_kind:
         return ofmsg_kind
-    kinds = _MSG_KINDS.get(ofmsg_type, None)
-    if kinds:
-        for kind, kind_func in kinds:
-            if kind_func(ofmsg):
-                return kind
+    commands = _MSG_KINDS_COMMANDS.get(ofmsg_type, None)
+    if commands:
+        ofmsg_kind = commands.get(ofmsg.command, 'other')
+        if ofmsg_kind == 'delete' and _MSG_KINDS_GLOBAL_DELETES[ofmsg_type](ofmsg):
+            return 'deleteglobal'
+        return ofmsg_kind
     return 'other'
 
 
+def _matchkey(ofmsg):
+    """Return a hashable key for an OF message's match (not an OFPMatch, which has no __eq__)."""
+    return frozenset(ofmsg.match.items())
+
+
+def _flowmodkey(ofmsg):
+    # An ADD and a MODIFY of the same flow are both kept, as a MODIFY does not add a missing flow.
+    return (_matchkey(ofmsg), ofmsg.cookie, ofmsg.priority, ofmsg.table_id, ofmsg.command)
+
+
+def _deletekey(ofmsg):
+    """Return key for a delete, without rendering it to a string."""
+    ofmsg_type = type(ofmsg)
+    if ofmsg_type == parser.OFPFlowMod:
+        return (
+            ofmsg_type, ofmsg.command, ofmsg.table_id, ofmsg.priority,
+            ofmsg.cookie, ofmsg.cookie_mask, ofmsg.out_port, ofmsg.out_group,
+            _matchkey(ofmsg))
+    if ofmsg_type == parser.OFPGroupMod:
+        return (ofmsg_type, ofmsg.command, ofmsg.group_id)
+    if ofmsg_type == parser.OFPMeterMod:
+        return (ofmsg_type, ofmsg.command, ofmsg.meter_id)
+    return str(ofmsg)
+
+
 def _partition_ofmsgs(input_ofmsgs):
-    """Partition input ofmsgs by kind."""
+    """Partition input ofmsgs by kind, deduplicating in the same pass."""
     by_kind = {}
     for ofmsg in input_ofmsgs:
-        by_kind.setdefault(_msg_kind(ofmsg), []).append(ofmsg)
+        kind = _msg_kind(ofmsg)
+        kind_ofmsgs = by_kind.get(kind, None)
+        if kind_ofmsgs is None:
+            kind_ofmsgs = {}
+            by_kind[kind] = kind_ofmsgs
+        kind_ofmsgs[_OFMSG_KEYS[kind](ofmsg)] = ofmsg
     return by_kind
 
 
-def _flowmodkey(ofmsg):
-    return (ofmsg.match, ofmsg.cookie, ofmsg.priority, ofmsg.table_id)
-
-
-def dedupe_ofmsgs(input_ofmsgs, random_order, flowkey):
-    """Return deduplicated ofmsg list."""
-    # Built in comparison doesn't work until serialized() called
-    # Can't use dict or json comparison as may be nested
-    deduped_input_ofmsgs = {flowkey(ofmsg): ofmsg for ofmsg in input_ofmsgs}
+def _sort_ofmsgs(deduped_ofmsgs, random_order):
+    """Return deduplicated ofmsgs, randomized or ordered by table/priority."""
     if random_order:
-        ofmsgs = list(deduped_input_ofmsgs.values())
+        ofmsgs = list(deduped_ofmsgs)
         random.shuffle(ofmsgs)
         return ofmsgs
     # If priority present, send highest table ID/priority first.
     return sorted(
-        deduped_input_ofmsgs.values(),
+        deduped_ofmsgs,
         key=lambda ofmsg: (
             getattr(ofmsg, 'table_id', ofp.OFPTT_ALL), getattr(ofmsg, 'priority', 2**16+1)), reverse=True)
 
 
-def dedupe_overlaps_ofmsgs(input_ofmsgs, random_order, flowkey):
-    deduped_ofmsgs = dedupe_ofmsgs(input_ofmsgs, random_order, flowkey)
+def dedupe_ofmsgs(input_ofmsgs, random_order, flowkey):
+    """Return deduplicated ofmsg list."""
+    # Built in comparison doesn't work until serialized() called
+    # Can't use dict or json comparison as may be nested
+    deduped_input_ofmsgs = {flowkey(ofmsg): ofmsg for ofmsg in input_ofmsgs}
+    return _sort_ofmsgs(deduped_input_ofmsgs.values(), random_order)
+
+
+def _remove_overlap_ofmsgs(deduped_ofmsgs):
+    """Remove deletes that are overlapped by a priority-less delete across all tables."""
     ofmsgs_by_table = {}
     for ofmsg in deduped_ofmsgs:
         table_id = getattr(ofmsg, 'table_id', None)
@@ -1004,38 +1094,64 @@ def dedupe_overlaps_ofmsgs(input_ofmsgs, random_order, flowkey):
     # all other table-specific deletes that have vlan=100).
     if ofp.OFPTT_ALL in all_table_ids:
         overlap_matches = {
-            tuple(ofmsg.match.items()) for ofmsg in ofmsgs_by_table[ofp.OFPTT_ALL]
+            frozenset(ofmsg.match.items()) for ofmsg in ofmsgs_by_table[ofp.OFPTT_ALL]
             if not ofmsg.priority}
         table_ids = all_table_ids - {ofp.OFPTT_ALL}
         if overlap_matches and table_ids:
+            # Index overlapping matches by one of their match field/values (None if
+            # they have no matches), so that each delete need only be checked against
+            # the overlapping matches that could possibly be a subset of it.
+            overlap_matches_by_field = {}
+            for overlap_match in overlap_matches:
+                overlap_matches_by_field.setdefault(
+                    next(iter(overlap_match), None), []).append(overlap_match)
+            match_all = None in overlap_matches_by_field
+
+            def _overlapped(ofmsg):
+                if match_all:
+                    return True
+                match_fields = frozenset(ofmsg.match.items())
+                for match_field in match_fields:
+                    for overlap_match in overlap_matches_by_field.get(match_field, ()):
+                        if overlap_match.issubset(match_fields):
+                            return True
+                return False
+
             for table_id in table_ids:
-                for overlap_match in overlap_matches:
-                    overlap_match = set(overlap_match)
-                    ofmsgs_by_table[table_id] = [
-                        ofmsg for ofmsg in ofmsgs_by_table[table_id]
-                        if not overlap_match.issubset(set(ofmsg.match.items()))]
+                ofmsgs_by_table[table_id] = [
+                    ofmsg for ofmsg in ofmsgs_by_table[table_id] if not _overlapped(ofmsg)]
             nooverlaps_ofmsgs = []
-            for _, ofmsgs in sorted(ofmsgs_by_table.items(), reverse=True):
+            # Deletes without a table (e.g. group deletes) go last.
+            for _, ofmsgs in sorted(
+                    ofmsgs_by_table.items(),
+                    key=lambda table_ofmsgs: (table_ofmsgs[0] is not None, table_ofmsgs[0]),
+                    reverse=True):
                 nooverlaps_ofmsgs.extend(ofmsgs)
             return nooverlaps_ofmsgs
 
     return deduped_ofmsgs
 
 
+def dedupe_overlaps_ofmsgs(input_ofmsgs, random_order, flowkey):
+    """Return deduplicated ofmsg list, with overlapping deletes removed."""
+    return _remove_overlap_ofmsgs(dedupe_ofmsgs(input_ofmsgs, random_order, flowkey))
 
-# kind, random_order, suggest_barrier, flowkey
+
+# kind, random_order, suggest_barrier, flowkey, remove_overlaps
 _OFMSG_ORDER = (
-    ('config', False, True, str, dedupe_ofmsgs),
-    ('deleteglobal', False, True, str, dedupe_ofmsgs),
-    ('delete', False, True, str, dedupe_overlaps_ofmsgs),
-    ('tfm', False, True, str, dedupe_ofmsgs),
-    ('groupadd', False, True, str, dedupe_ofmsgs),
-    ('meteradd', False, True, str, dedupe_ofmsgs),
-    ('flowaddmod', False, False, _flowmodkey, dedupe_ofmsgs),
-    ('other', False, False, str, dedupe_ofmsgs),
-    ('packetout', True, False, str, dedupe_ofmsgs),
+    ('config', False, True, str, False),
+    ('deleteglobal', False, True, _deletekey, False),
+    ('delete', False, True, _deletekey, True),
+    ('tfm', False, True, str, False),
+    ('groupadd', False, True, str, False),
+    ('meteradd', False, True, str, False),
+    ('flowaddmod', False, False, _flowmodkey, False),
+    ('other', False, False, str, False),
+    ('packetout', True, False, str, False),
 )
 
+_OFMSG_KEYS = {kind: flowkey for kind, _, _, flowkey, _ in _OFMSG_ORDER}
+
 
 def valve_flowreorder(input_ofmsgs, use_barriers=True):
     """Reorder flows for better OFA performance."""
@@ -1047,21 +1163,153 @@ def valve_flowreorder(input_ofmsgs, use_barriers=True):
     by_kind = _partition_ofmsgs(input_ofmsgs)
 
     # Suppress all other relevant deletes if a global delete is present.
-    delete_global_ofmsgs = by_kind.get('deleteglobal', [])
+    delete_global_ofmsgs = by_kind.get('deleteglobal', {})
     if delete_global_ofmsgs:
-        global_types = {type(ofmsg) for ofmsg in delete_global_ofmsgs}
-        new_delete = [ofmsg for ofmsg in by_kind.get('delete', []) if type(ofmsg) not in global_types]
-        by_kind['delete'] = new_delete
-
-    for kind, random_order, suggest_barrier, flowkey, dedupe_func in _OFMSG_ORDER:
-        ofmsgs = dedupe_func(by_kind.get(kind, []), random_order, flowkey)
-        if ofmsgs:
-            output_ofmsgs.extend(ofmsgs)
-            if use_barriers and suggest_barrier:
-                output_ofmsgs.append(barrier())
+        global_types = {type(ofmsg) for ofmsg in delete_global_ofmsgs.values()}
+        by_kind['delete'] = {
+            key: ofmsg for key, ofmsg in by_kind.get('delete', {}).items()
+            if type(ofmsg) not in global_types}
+
+    for kind, random_order, suggest_barrier, _, remove_overlaps in _OFMSG_ORDER:
+        deduped_ofmsgs = by_kind.get(kind, None)
+        if not deduped_ofmsgs:
+            continue
+        ofmsgs = _sort_ofmsgs(deduped_ofmsgs.values(), random_order)
+        if remove_overlaps:
+            ofmsgs = _remove_overlap_ofmsgs(ofmsgs)
+        output_ofmsgs.extend(ofmsgs)
+        if use_barriers and suggest_barrier:
+            output_ofmsgs.append(barrier())
     return output_ofmsgs
 
 
+# Offset of XID in OpenFlow header (version, type, length, xid).
+_OFP_HEADER_XID_OFFSET = 4
+_OFP_HEADER_XID_PACK_STR = '!I'
+MAX_SEND_BATCH_BYTES = 1024 * 1024
+
+
+def _ofpkey(ofp_obj):
+    """Return a hashable key for the fields of Ryu OF actions, instructions or buckets.
+
+    Ryu objects compare by identity, so equal objects built separately
+    (e.g. on reconnect) must be keyed by type and fields. Lengths are
+    left out, as Ryu only fills some of them in when serializing.
+    """
+    if isinstance(ofp_obj, (list, tuple)):
+        return tuple(_ofpkey(item) for item in ofp_obj)
+    if hasattr(ofp_obj, '__dict__'):
+        return (type(ofp_obj),) + tuple(
+            (attr, _ofpkey(val)) for attr, val in sorted(ofp_obj.__dict__.items())
+            if attr != 'len')
+    return ofp_obj
+
+
+def _serializekey(ofmsg):
+    """Return key identifying an OF message's serialized form, or None if not cacheable."""
+    ofmsg_type = type(ofmsg)
+    if ofmsg_type == parser.OFPFlowMod:
+        return (
+            ofmsg_type, ofmsg.cookie, ofmsg.cookie_mask, ofmsg.table_id, ofmsg.command,
+            ofmsg.idle_timeout, ofmsg.hard_timeout, ofmsg.priority, ofmsg.buffer_id,
+            ofmsg.out_port, ofmsg.out_group, ofmsg.flags, _matchkey(ofmsg),
+            _ofpkey(ofmsg.instructions))
+    if ofmsg_type == parser.OFPGroupMod:
+        return (
+            ofmsg_type, ofmsg.command, ofmsg.type, ofmsg.group_id, _ofpkey(ofmsg.buckets))
+    if ofmsg_type == parser.OFPPacketOut:
+        return (
+            ofmsg_type, ofmsg.buffer_id, ofmsg.in_port, _ofpkey(ofmsg.actions),
+            bytes(ofmsg.data))
+    if ofmsg_type == parser.OFPBarrierRequest:
+        return (ofmsg_type,)
+    return None
+
+
+class _SerializeKey:
+    """Hashable wrapper for an OF message, that compares by its serialize key."""
+
+    __slots__ = [
+        '_hash',
+        'key',
+        'ofmsg',
+    ]
+
+    def __init__(self, ofmsg, key):
+        self.ofmsg = ofmsg
+        self.key = key
+        self._hash = hash(key)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+@functools.lru_cache(maxsize=65536)
+def _serialized_ofmsg(serialize_key):
+    ofmsg = serialize_key.ofmsg
+    ofmsg.serialize()
+    # Don't keep the message itself alive in the cache, only its key.
+    serialize_key.ofmsg = None
+    return bytes(ofmsg.buf)
+
+
+def _serialize_ofmsg_into(buf, ofmsg):
+    key = _serializekey(ofmsg)
+    if key is None:
+        ofmsg.serialize()
+        buf += ofmsg.buf
+        return
+    offset = len(buf)
+    buf += _serialized_ofmsg(_SerializeKey(ofmsg, key))
+    struct.pack_into(_OFP_HEADER_XID_PACK_STR, buf, offset + _OFP_HEADER_XID_OFFSET, ofmsg.xid)
+
+
+def serialize_ofmsg(ofmsg):
+    """Return OF message serialized with its XID, from cache if possible.
+
+    Args:
+        ofmsg: ryu.ofproto.ofproto_v1_3_parser message, with datapath and XID set.
+    Returns:
+        bytearray: serialized message.
+    """
+    buf = bytearray()
+    _serialize_ofmsg_into(buf, ofmsg)
+    return buf
+
+
+def serialize_ofmsg_batches(ofmsgs, max_batch_bytes=MAX_SEND_BATCH_BYTES):
+    """Serialize OF messages into contiguous buffers, to be sent with one write each.
+
+    A batch ends after each barrier, so that messages behind a barrier
+    are not written before it, or when it reaches max_batch_bytes.
+
+    Args:
+        ofmsgs (list): ryu.ofproto.ofproto_v1_3_parser messages, with datapath and XID set.
+        max_batch_bytes (int): start a new batch once a batch is at least this size.
+    Returns:
+        generator: tuples of (number of messages, bytearray, XID of the barrier
+            the batch ends with or None) for each batch.
+    """
+    batch = bytearray()
+    batch_msgs = 0
+    for ofmsg in ofmsgs:
+        _serialize_ofmsg_into(batch, ofmsg)
+        batch_msgs += 1
+        if is_barrier(ofmsg):
+            yield (batch_msgs, batch, ofmsg.xid)
+        elif len(batch) >= max_batch_bytes:
+            yield (batch_msgs, batch, None)
+        else:
+            continue
+        batch = bytearray()
+        batch_msgs = 0
+    if batch_msgs:
+        yield (batch_msgs, batch, None)
+
+
 def flood_tagged_port_outputs(ports, in_port=None, exclude_ports=None):
     """Return list of actions necessary to flood to list of tagged ports."""
     flood_acts = []
@@ -1129,3 +1377,9 @@ def faucet_async(datapath=None, notify_flow_removed=False, packet_in=True, port_
 def desc_stats_request(datapath=None):
     """Query switch description."""
     return parser.OFPDescStatsRequest(datapath, 0)
+
+
+def flow_stats_request(datapath=None):
+    """Query all flows in all tables."""
+    return parser.OFPFlowStatsRequest(
+        datapath, 0, ofp.OFPTT_ALL, ofp.OFPP_ANY, ofp.OFPG_ANY, 0, 0, parser.OFPMatch())
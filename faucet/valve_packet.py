@@ -28,7 +28,7 @@ from ryu.lib.mac import BROADCAST, DONTCARE, is_multicast, haddr_to_bin
 from ryu.lib.packet import (
     arp, bpdu, ethernet,
     icmp, icmpv6, ipv4, ipv6,
-    lldp, slow, packet, vlan)
+    lldp, slow, packet, packet_utils, vlan)
 from ryu.lib.packet.stream_parser import StreamParser
 
 from faucet import valve_util
@@ -197,6 +197,58 @@ def parse_packet_in_pkt(data, max_len, eth_pkt=None, vlan_pkt=None):
     return (pkt, eth_pkt, eth_type, vlan_pkt, vlan_vid)
 
 
+ETH_HEADER_STRUCT = struct.Struct('!6s6sH')
+MAC_INT_GROUP_BIT = 1 << 40
+VLAN_HEADER_STRUCT = struct.Struct('!HH')
+
+
+def parse_eth_header(data):
+    """Decode the Ethernet/VLAN header of a packet, without building a Ryu packet.
+
+    Args:
+        data (bytes): packet data from dataplane (only the Ethernet/VLAN header is decoded).
+    Returns:
+        str: destination Ethernet MAC address (or None if unparseable).
+        str: source Ethernet MAC address (or None if unparseable).
+        int: source Ethernet MAC address, as a 48 bit integer.
+        int: Ethernet type of packet (inside VLAN)
+        int: VLAN VID (or None if no VLAN)
+    """
+    if len(data) < ETH_HEADER_SIZE:
+        return (None, None, None, None, None)
+    eth_dst, eth_src, eth_type = ETH_HEADER_STRUCT.unpack_from(data)
+    vlan_vid = None
+    if eth_type == valve_of.ether.ETH_TYPE_8021Q:
+        if len(data) < ETH_VLAN_HEADER_SIZE:
+            return (None, None, None, None, None)
+        tci, eth_type = VLAN_HEADER_STRUCT.unpack_from(data, ETH_HEADER_SIZE)
+        vlan_vid = tci & 0xfff
+    return (
+        addrconv.mac.bin_to_text(eth_dst), addrconv.mac.bin_to_text(eth_src),
+        int.from_bytes(eth_src, 'big'), eth_type, vlan_vid)
+
+
+def mac_int_all_zeros(mac_int):
+    """Returns True if a MAC address, as an integer, is all zeros."""
+    return mac_int == 0
+
+
+def mac_int_is_unicast(mac_int):
+    """Returns True if a MAC address, as an integer, is a unicast Ethernet address."""
+    # Broadcast has the group bit set too.
+    return not mac_int & MAC_INT_GROUP_BIT
+
+
+def mac_int_from_str(mac):
+    """Returns a MAC address string as a 48 bit integer."""
+    return int(mac.replace(':', ''), 16)
+
+
+def mac_int_to_str(mac_int):
+    """Returns a MAC address, as a 48 bit integer, as a string."""
+    return addrconv.mac.bin_to_text(mac_int.to_bytes(6, 'big'))
+
+
 @functools.lru_cache(maxsize=1024)
 def mac_addr_all_zeros(mac_addr):
     """Returns True if mac_addr is all zeros.
@@ -484,6 +536,45 @@ def arp_request(vid, eth_src, eth_dst, src_ip, dst_ip):
     return pkt
 
 
+def _eth_header_size(vid):
+    if vid is None:
+        return ETH_HEADER_SIZE
+    return ETH_VLAN_HEADER_SIZE
+
+
+@functools.lru_cache(maxsize=1024)
+def arp_request_template(vid, eth_src, src_ip):
+    """Return a serialized broadcast ARP request, for arp_request_from_template().
+
+    Args:
+        vid (int or None): VLAN VID to use (or None).
+        eth_src (str): Ethernet source address.
+        src_ip (ipaddress.IPv4Address): source IPv4 address.
+    Returns:
+        bytes: serialized ARP request, for the unspecified address.
+    """
+    return bytes(arp_request(
+        vid, eth_src, valve_of.mac.BROADCAST_STR, src_ip, ipaddress.IPv4Address(0)).data)
+
+
+def arp_request_from_template(template, vid, dst_ip):
+    """Return a serialized broadcast ARP request, from a template for the same VID.
+
+    Args:
+        template (bytes): serialized ARP request from arp_request_template().
+        vid (int or None): VLAN VID of template (or None).
+        dst_ip (ipaddress.IPv4Address): requested IPv4 address.
+    Returns:
+        bytes: serialized ARP request.
+    """
+    dst_ip_bytes = dst_ip.packed
+    target_ip_offset = _eth_header_size(vid) + ARP_REQ_PKT_SIZE - len(dst_ip_bytes)
+    return b''.join((
+        template[:target_ip_offset],
+        dst_ip_bytes,
+        template[target_ip_offset + len(dst_ip_bytes):]))
+
+
 @functools.lru_cache(maxsize=1024)
 def arp_reply(vid, eth_src, eth_dst, src_ip, dst_ip):
     """Return an ARP reply packet.
@@ -596,6 +687,57 @@ def nd_request(vid, eth_src, eth_dst, src_ip, dst_ip):
     return pkt
 
 
+@functools.lru_cache(maxsize=1024)
+def nd_request_template(vid, eth_src, src_ip):
+    """Return a serialized multicast neighbor solicitation, for nd_request_from_template().
+
+    Args:
+        vid (int or None): VLAN VID to use (or None).
+        eth_src (str): source Ethernet MAC address.
+        src_ip (ipaddress.IPv6Address): source IPv6 address.
+    Returns:
+        bytes: serialized neighbor solicitation, for the unspecified address.
+    """
+    return bytes(nd_request(
+        vid, eth_src, valve_of.mac.BROADCAST_STR, src_ip, ipaddress.IPv6Address(0)).data)
+
+
+def nd_request_from_template(template, vid, dst_ip):
+    """Return a serialized multicast neighbor solicitation, from a template for the same VID.
+
+    The Ethernet and IPv6 destinations (derived from dst_ip), the target
+    address and the ICMPv6 checksum are patched.
+
+    Args:
+        template (bytes): serialized solicitation from nd_request_template().
+        vid (int or None): VLAN VID of template (or None).
+        dst_ip (ipaddress.IPv6Address): requested IPv6 address.
+    Returns:
+        bytes: serialized neighbor solicitation.
+    """
+    ipv6_offset = _eth_header_size(vid)
+    icmpv6_offset = ipv6_offset + IPV6_HEADER_SIZE
+    mcast_ip = ipv6_solicited_node_from_ucast(dst_ip).packed
+    eth_dst = b'\x33\x33' + mcast_ip[-4:]
+    icmpv6_data = b''.join((
+        template[icmpv6_offset:icmpv6_offset + 2],
+        b'\x00\x00',
+        template[icmpv6_offset + 4:icmpv6_offset + 8],
+        dst_ip.packed,
+        template[icmpv6_offset + 24:]))
+    src_ip = template[ipv6_offset + 8:ipv6_offset + 24]
+    pseudo_header = struct.pack(
+        '!16s16sI3xB', src_ip, mcast_ip, len(icmpv6_data), valve_of.inet.IPPROTO_ICMPV6)
+    csum = packet_utils.checksum(pseudo_header + icmpv6_data)
+    return b''.join((
+        eth_dst,
+        template[len(eth_dst):ipv6_offset + 24],
+        mcast_ip,
+        icmpv6_data[:2],
+        struct.pack('!H', csum),
+        icmpv6_data[4:]))
+
+
 @functools.lru_cache(maxsize=1024)
 def nd_advert(vid, eth_src, eth_dst, src_ip, dst_ip):
     """Return IPv6 neighbor avertisement packet.
@@ -711,12 +853,13 @@ class PacketMeta:
     __slots__ = [
         'data',
         'orig_len',
-        'pkt',
-        'eth_pkt',
-        'vlan_pkt',
+        '_pkt',
+        '_eth_pkt',
+        '_vlan_pkt',
         'port',
         'vlan',
         'eth_src',
+        'eth_src_int',
         'eth_dst',
         'eth_type',
         'l3_pkt',
@@ -730,6 +873,13 @@ class PacketMeta:
         valve_of.ether.ETH_TYPE_IPV6: (6, None, ipv6.ipv6),
     }
 
+    # IP version, offsets of L3 source and destination addresses, and address size.
+    ETH_TYPES_L3_ADDRS = {
+        valve_of.ether.ETH_TYPE_IP: (4, 12, 16, 4),
+        valve_of.ether.ETH_TYPE_ARP: (None, 14, 24, 4),
+        valve_of.ether.ETH_TYPE_IPV6: (6, 8, 24, 16),
+    }
+
     MIN_ETH_TYPE_PKT_SIZE = {
         valve_of.ether.ETH_TYPE_ARP: VLAN_ARP_REQ_PKT_SIZE,
         valve_of.ether.ETH_TYPE_IP: ETH_VLAN_HEADER_SIZE + IPV4_HEADER_SIZE,
@@ -742,21 +892,59 @@ class PacketMeta:
     }
 
     def __init__(self, data, orig_len, pkt, eth_pkt, vlan_pkt, port, valve_vlan,
-                 eth_src, eth_dst, eth_type):
+                 eth_src, eth_dst, eth_type, eth_src_int):
         self.data = data
         self.orig_len = orig_len
-        self.pkt = pkt
-        self.eth_pkt = eth_pkt
-        self.vlan_pkt = vlan_pkt
+        self._pkt = pkt
+        self._eth_pkt = eth_pkt
+        self._vlan_pkt = vlan_pkt
         self.port = port
         self.vlan = valve_vlan
         self.eth_src = eth_src
+        self.eth_src_int = eth_src_int
         self.eth_dst = eth_dst
         self.eth_type = eth_type
         self.l3_pkt = None
         self.l3_src = None
         self.l3_dst = None
 
+    def _parse_header(self):
+        """Parse Ryu Ethernet/VLAN headers, if not already parsed."""
+        if self._eth_pkt is None:
+            _, self._eth_pkt, _, self._vlan_pkt, _ = parse_packet_in_pkt(
+                self.data, ETH_VLAN_HEADER_SIZE)
+
+    @property
+    def pkt(self):
+        """Ryu packet, parsed from all data on first use."""
+        if self._pkt is None:
+            self._pkt = parse_packet_in_pkt(self.data, 0)[0]
+        return self._pkt
+
+    @pkt.setter
+    def pkt(self, pkt):
+        self._pkt = pkt
+
+    @property
+    def eth_pkt(self):
+        """Ryu Ethernet header, parsed on first use."""
+        self._parse_header()
+        return self._eth_pkt
+
+    @eth_pkt.setter
+    def eth_pkt(self, eth_pkt):
+        self._eth_pkt = eth_pkt
+
+    @property
+    def vlan_pkt(self):
+        """Ryu VLAN header (or None if no VLAN), parsed on first use."""
+        self._parse_header()
+        return self._vlan_pkt
+
+    @vlan_pkt.setter
+    def vlan_pkt(self, vlan_pkt):
+        self._vlan_pkt = vlan_pkt
+
     def log(self):
         vlan_msg = ''
         if self.vlan:
@@ -816,6 +1004,20 @@ class PacketMeta:
                 self.l3_src = ipaddress.ip_address(self.l3_src)
                 self.l3_dst = ipaddress.ip_address(self.l3_dst)
 
+    def parse_l3_addrs(self):
+        """Decode L3 source and destination addresses, without building Ryu packets."""
+        if self.l3_src is not None or self.eth_type not in self.ETH_TYPES_L3_ADDRS:
+            return
+        ip_ver, src_offset, dst_offset, addr_size = self.ETH_TYPES_L3_ADDRS[self.eth_type]
+        if ip_ver is not None and ip_ver != self.ip_ver():
+            return
+        src_start = ETH_VLAN_HEADER_SIZE + src_offset
+        dst_start = ETH_VLAN_HEADER_SIZE + dst_offset
+        if len(self.data) < dst_start + addr_size:
+            return
+        self.l3_src = ipaddress.ip_address(self.data[src_start:src_start + addr_size])
+        self.l3_dst = ipaddress.ip_address(self.data[dst_start:dst_start + addr_size])
+
     def packet_complete(self):
         """True if we have the complete packet."""
         return len(self.data) == self.orig_len
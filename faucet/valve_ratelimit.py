@@ -0,0 +1,111 @@
+"""Admit packet ins from a datapath at a limited rate per port, VLAN and DP."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Education Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class TokenBucket:
+    """Token bucket, admitting rate events per second on average, in bursts of up to rate."""
+
+    __slots__ = [
+        'last_time',
+        'rate',
+        'tokens',
+    ]
+
+    def __init__(self, rate, now):
+        self.rate = rate
+        self.tokens = rate
+        self.last_time = now
+
+    def admit(self, now):
+        """Return True if an event is admitted now, consuming a token."""
+        elapsed = now - self.last_time
+        if elapsed > 0:
+            self.tokens = min(self.rate, self.tokens + elapsed * self.rate)
+            self.last_time = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class PacketInAdmission:
+    """Token buckets for packet ins per port, per VLAN and per DP.
+
+    A packet in must be admitted by its port's bucket, then its VLAN's,
+    then the DP's, so one busy port cannot use up the whole VLAN or DP's
+    rate. A rate of None or 0 does not limit.
+    """
+
+    PORT = 'port'
+    VLAN = 'vlan'
+    DP = 'dp'
+
+    def __init__(self, port_pps=None, vlan_pps=None, dp_pps=None):
+        self.port_pps = port_pps
+        self.vlan_pps = vlan_pps
+        self.dp_pps = dp_pps
+        # True if any rate is limited.
+        self.active = bool(port_pps or vlan_pps or dp_pps)
+        self.port_buckets = {}
+        self.vlan_buckets = {}
+        self.dp_bucket = None
+        self.port_bans = {}
+
+    def reset(self):
+        """Forget all buckets and bans (e.g. when the DP reconnects)."""
+        self.port_buckets = {}
+        self.vlan_buckets = {}
+        self.dp_bucket = None
+        self.port_bans = {}
+
+    @staticmethod
+    def _admit(buckets, key, rate, now):
+        bucket = buckets.get(key, None)
+        if bucket is None:
+            bucket = TokenBucket(rate, now)
+            buckets[key] = bucket
+        return bucket.admit(now)
+
+    def admit(self, now, port_no, vid):
+        """Admit a packet in.
+
+        Args:
+            now (float): current epoch time.
+            port_no (int): port packet in was received on.
+            vid (int): VLAN VID of packet in (or None if no VLAN).
+        Returns:
+            str: PORT, VLAN or DP if the packet in is not admitted by that bucket, else None.
+        """
+        if self.port_pps and not self._admit(self.port_buckets, port_no, self.port_pps, now):
+            return self.PORT
+        if self.vlan_pps and vid is not None and not self._admit(
+                self.vlan_buckets, vid, self.vlan_pps, now):
+            return self.VLAN
+        if self.dp_pps:
+            if self.dp_bucket is None:
+                self.dp_bucket = TokenBucket(self.dp_pps, now)
+            if not self.dp_bucket.admit(now):
+                return self.DP
+        return None
+
+    def ban_port(self, now, port_no, ban_timeout):
+        """Return True if a port should now be banned, for ban_timeout seconds."""
+        if self.port_bans.get(port_no, 0) > now:
+            return False
+        self.port_bans[port_no] = now + ban_timeout
+        return True
@@ -17,7 +17,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict, deque
+import heapq
 import random
 import time
 
@@ -83,6 +83,13 @@ class NextHop:
             return True
         return False
 
+    def resolution_due_time(self, max_age):
+        """Return time this nexthop will be due to be re resolved/retried."""
+        due_time = self.next_retry_time or 0
+        if self.eth_src is not None:
+            due_time = max(due_time, self.cache_time + max_age)
+        return due_time
+
     def __str__(self):
         return '%s' % [self.eth_src, self.port]
 
@@ -90,6 +97,59 @@ class NextHop:
         return self.__str__()
 
 
+class NextHopResolveQueue:
+    """Min-heap of IP gateways, by the time each is next due to be resolved.
+
+    A gateway is only queued once, at its earliest due time. A gateway queued
+    again at an earlier time leaves its later heap entry behind, ignored when
+    it reaches the top.
+    """
+
+    __slots__ = [
+        '_due_times',
+        '_heap',
+    ]
+
+    def __init__(self):
+        self._due_times = {}
+        self._heap = []
+
+    def __len__(self):
+        return len(self._due_times)
+
+    def push(self, ip_gw, due_time):
+        """Queue a gateway to be resolved at due_time (if not already queued earlier)."""
+        queued_due_time = self._due_times.get(ip_gw, None)
+        if queued_due_time is not None and queued_due_time <= due_time:
+            return
+        self._due_times[ip_gw] = due_time
+        if len(self._heap) > 2 * len(self._due_times) + 64:
+            self._heap = [
+                (gw_due_time, gw) for gw, gw_due_time in self._due_times.items()]
+            heapq.heapify(self._heap)
+        else:
+            heapq.heappush(self._heap, (due_time, ip_gw))
+
+    def pop(self, now):
+        """Return and dequeue the gateway due soonest, if due by now (or None)."""
+        while self._heap and self._heap[0][0] <= now:
+            due_time, ip_gw = heapq.heappop(self._heap)
+            if self._due_times.get(ip_gw, None) != due_time:
+                continue
+            del self._due_times[ip_gw]
+            return ip_gw
+        return None
+
+    def next_due_time(self):
+        """Return when the gateway due soonest is due (or None if none queued)."""
+        while self._heap:
+            due_time, ip_gw = self._heap[0]
+            if self._due_times.get(ip_gw, None) == due_time:
+                return due_time
+            heapq.heappop(self._heap)
+        return None
+
+
 class ValveRouteManager(ValveManagerBase):
     """Base class to implement RIB/FIB."""
 
@@ -98,6 +158,7 @@ class ValveRouteManager(ValveManagerBase):
         'neighbor_timeout',
         'dec_ttl',
         'fib_table',
+        'groups',
         'pipeline',
         'multi_out',
         'notify',
@@ -125,7 +186,7 @@ class ValveRouteManager(ValveManagerBase):
     def __init__(self, logger, notify, global_vlan, neighbor_timeout,
                  max_hosts_per_resolve_cycle, max_host_fib_retry_count,
                  max_resolve_backoff_time, proactive_learn, dec_ttl, multi_out,
-                 fib_table, vip_table, pipeline, routers, stack_manager):
+                 fib_table, vip_table, pipeline, routers, stack_manager, groups=None):
         self.notify = notify
         self.logger = logger
         self.global_vlan = AnonVLAN(global_vlan)
@@ -144,6 +205,7 @@ class ValveRouteManager(ValveManagerBase):
         self.active = False
         self.global_routing = self._global_routing()
         self.stack_manager = stack_manager
+        self.groups = groups
         if self.global_routing:
             self.logger.info('global routing enabled')
 
@@ -169,46 +231,56 @@ class ValveRouteManager(ValveManagerBase):
     def _gw_resolve_pkt():
         return None
 
+    @staticmethod
+    def _gw_resolve_pkt_template():
+        return None
+
+    @staticmethod
+    def _gw_resolve_pkt_from_template():
+        return None
+
     @staticmethod
     def _gw_respond_pkt():
         return None
 
+    def _stack_flood_port_nos(self):
+        """Return running stack port numbers to flood to for gw resolving"""
+        if not self.stack_manager:
+            return []
+        if self.stack_manager.stack.is_root():
+            ports = (self.stack_manager.away_ports -
+                     self.stack_manager.inactive_away_ports -
+                     self.stack_manager.pruned_away_ports)
+        else:
+            ports = [self.stack_manager.chosen_towards_port]
+        return [port.number for port in ports if port is not None and port.running()]
+
     def _flood_stack_links(self, pkt_builder, vlan, multi_out=True, *args):
         """Return flood packet-out actions to stack ports for gw resolving"""
-        ofmsgs = []
-        if self.stack_manager:
-            ports = list()
-            if self.stack_manager.stack.is_root():
-                ports = list(self.stack_manager.away_ports -
-                             self.stack_manager.inactive_away_ports -
-                             self.stack_manager.pruned_away_ports)
-            else:
-                ports = [self.stack_manager.chosen_towards_port]
-            if ports:
-                running_port_nos = [port.number for port in ports if port.running()]
-                pkt = pkt_builder(vlan.vid, *args)
-                if running_port_nos:
-                    random.shuffle(running_port_nos)
-                    if multi_out:
-                        ofmsgs.append(valve_of.packetouts(running_port_nos, bytes(pkt.data)))
-                    else:
-                        ofmsgs.extend(
-                            [valve_of.packetout(port_no, bytes(pkt.data)) for port_no in running_port_nos])
-        return ofmsgs
+        running_port_nos = self._stack_flood_port_nos()
+        if not running_port_nos:
+            return []
+        pkt = pkt_builder(vlan.vid, *args)
+        return valve_of.flood_packetouts(running_port_nos, bytes(pkt.data), multi_out)
 
-    def _resolve_gw_on_vlan(self, vlan, faucet_vip, ip_gw):
-        """Return flood packet-out actions for gw resolving"""
+    def _resolve_gws_on_vlan(self, vlan, faucet_vip_ip_gws):
+        """Return flood packet-out actions for resolving a batch of (faucet_vip, ip_gw).
+
+        Flood ports are found once per batch. Packets are patched from a serialized
+        template for each VID and VIP, rather than built from scratch.
+        """
         ofmsgs = []
-        stack_ofmsgs = self._flood_stack_links(
-            self._gw_resolve_pkt(), vlan, self.multi_out,
-            vlan.faucet_mac, valve_of.mac.BROADCAST_STR, faucet_vip.ip, ip_gw)
-        if stack_ofmsgs:
-            ofmsgs.extend(stack_ofmsgs)
-        vlan_ofmsgs = vlan.flood_pkt(
-            self._gw_resolve_pkt(), self.multi_out,
-            vlan.faucet_mac, valve_of.mac.BROADCAST_STR, faucet_vip.ip, ip_gw)
-        if vlan_ofmsgs:
-            ofmsgs.extend(vlan_ofmsgs)
+        flood_port_nos = vlan.flood_port_nos()
+        stack_port_nos = self._stack_flood_port_nos()
+        if stack_port_nos:
+            flood_port_nos.insert(0, (vlan.vid, stack_port_nos))
+        pkt_template = self._gw_resolve_pkt_template()
+        pkt_from_template = self._gw_resolve_pkt_from_template()
+        for vid, port_nos in flood_port_nos:
+            for faucet_vip, ip_gw in faucet_vip_ip_gws:
+                template = pkt_template(vid, vlan.faucet_mac, faucet_vip.ip)
+                ofmsgs.extend(valve_of.flood_packetouts(
+                    port_nos, pkt_from_template(template, vid, ip_gw), self.multi_out))
         return ofmsgs
 
     def _resolve_gw_on_port(self, vlan, port, faucet_vip, ip_gw, eth_dst):
@@ -305,6 +377,26 @@ class ValveRouteManager(ValveManagerBase):
             actions.append(valve_of.dec_ip_ttl())
         return tuple(actions)
 
+    def _nexthop_group_id(self, vlan, ip_gw):
+        """Return ID of the group that forwards to a nexthop."""
+        return self.groups.group_id_from_str('%s %s' % (vlan.vid, ip_gw))
+
+    def _del_nexthop_group(self, vlan, ip_gw):
+        """Return ofmsgs deleting the group that forwards to a nexthop, if any."""
+        if self.groups is not None:
+            group_id = self._nexthop_group_id(vlan, ip_gw)
+            if group_id in self.groups.entries:
+                return [self.groups.entries[group_id].delete()]
+        return []
+
+    def _nexthop_group_buckets(self, vlan, port, eth_dst):
+        """Return group buckets that rewrite and output to a nexthop on a port."""
+        actions = list(self._nexthop_actions(eth_dst, vlan))
+        if vlan.port_is_untagged(port):
+            actions.append(valve_of.pop_vlan())
+        actions.append(valve_of.output_port(port.number))
+        return [valve_of.bucket(actions=actions)]
+
     def _route_match(self, vlan, ip_dst):
         """Return vid, dst, eth_type flowrule match for fib entry"""
         return self.fib_table.match(vlan=vlan, eth_type=self.ETH_TYPE, nw_dst=ip_dst)
@@ -419,6 +511,24 @@ class ValveRouteManager(ValveManagerBase):
                 vlan, priority, faucet_vip, faucet_vip_host))
             ofmsgs.extend(self._add_faucet_fib_to_vip(
                 vlan, priority, faucet_vip, faucet_vip_host))
+        ofmsgs.extend(self._route_changes_flows(vlan))
+        return ofmsgs
+
+    def _route_changes_flows(self, vlan):
+        """Return flows to update the FIB, for route changes journaled in the RIB."""
+        ofmsgs = []
+        for ip_dst, ip_gw in vlan.pop_route_changes(self.IPV):
+            if ip_gw is None:
+                ofmsgs.extend(self._del_route_flows(vlan, ip_dst))
+                continue
+            cached_eth_dst = self._cached_nexthop_eth_dst(vlan, ip_gw)
+            if cached_eth_dst is not None:
+                ofmsgs.extend(self._add_resolved_route(
+                    vlan=vlan,
+                    ip_gw=ip_gw,
+                    ip_dst=ip_dst,
+                    eth_dst=cached_eth_dst,
+                    is_updated=False))
         return ofmsgs
 
     def _add_resolved_route(self, vlan, ip_gw, ip_dst, eth_dst, is_updated):
@@ -433,8 +543,12 @@ class ValveRouteManager(ValveManagerBase):
             self.logger.info(
                 'Adding new route %s via %s (%s) on VLAN %u' % (
                     ip_dst, ip_gw, eth_dst, vlan.vid))
-        inst = self.pipeline.accept_to_l2_forwarding(
-            actions=self._nexthop_actions(eth_dst, vlan))
+        if self.groups is not None and self._nexthop_group_id(vlan, ip_gw) in self.groups.entries:
+            inst = (valve_of.apply_actions(
+                (valve_of.group_act(self._nexthop_group_id(vlan, ip_gw)),)),)
+        else:
+            inst = self.pipeline.accept_to_l2_forwarding(
+                actions=self._nexthop_actions(eth_dst, vlan))
         routed_vlans = self._routed_vlans(vlan)
         for routed_vlan in routed_vlans:
             in_match = self._route_match(routed_vlan, ip_dst)
@@ -463,8 +577,28 @@ class ValveRouteManager(ValveManagerBase):
         """
         ofmsgs = []
         cached_eth_dst = self._cached_nexthop_eth_dst(vlan, resolved_ip_gw)
+        update_routes = cached_eth_dst != eth_src
+
+        # Only route gateways get a group, not hosts resolved for host routes.
+        if (self.groups is not None and port is not None and
+                resolved_ip_gw in vlan.route_gws_by_ipv(self.IPV)):
+            group_id = self._nexthop_group_id(vlan, resolved_ip_gw)
+            buckets = self._nexthop_group_buckets(vlan, port, eth_src)
+            if group_id in self.groups.entries and cached_eth_dst is not None:
+                # Routes already use the nexthop's group, so only the group changes.
+                cached_port = self._vlan_nexthop_cache_entry(vlan, resolved_ip_gw).port
+                if update_routes or cached_port != port:
+                    self.logger.info(
+                        'Updating next hop group for %s (%s) on VLAN %u' % (
+                            resolved_ip_gw, eth_src, vlan.vid))
+                    ofmsgs.append(self.groups.get_entry(group_id, buckets).modify())
+                update_routes = False
+            else:
+                ofmsgs.extend(self.groups.get_entry(
+                    group_id, buckets, type_=valve_of.ofp.OFPGT_INDIRECT).add())
+                update_routes = True
 
-        if cached_eth_dst != eth_src:
+        if update_routes:
             is_updated = cached_eth_dst is not None
             for ip_dst in vlan.ip_dsts_for_ip_gw(resolved_ip_gw):
                 ofmsgs.extend(self._add_resolved_route(
@@ -473,38 +607,56 @@ class ValveRouteManager(ValveManagerBase):
         self._update_nexthop_cache(now, vlan, eth_src, port, resolved_ip_gw)
         return ofmsgs
 
-    def _vlan_unresolved_nexthops(self, vlan, ip_gws, now):
-        """Return unresolved or expired IP gateways, never tried/oldest first.
-
-        Args:
-           vlan (vlan): VLAN containing this RIB/FIB.
-           ip_gws (list): tuple, IP gateway and controller IP in same subnet.
-           now (float): seconds since epoch.
-        Returns:
-           list: prioritized list of gateways.
-        """
-        vlan_nexthop_cache = self._vlan_nexthop_cache(vlan)
-        nexthop_entries = [
-            (ip_gw, vlan_nexthop_cache.get(ip_gw, None)) for ip_gw in ip_gws]
-        not_fresh_nexthops = [
-            (ip_gw, entry) for ip_gw, entry in nexthop_entries
-            if entry is None or entry.resolution_due(now, self.neighbor_timeout)]
-        unresolved_nexthops_by_retries = defaultdict(list)
-        for ip_gw, entry in not_fresh_nexthops:
-            if entry is None:
-                entry = self._update_nexthop_cache(now, vlan, None, None, ip_gw)
-            unresolved_nexthops_by_retries[entry.resolve_retries].append(ip_gw)
-        unresolved_nexthops = deque()
-        for _retries, nexthops in sorted(unresolved_nexthops_by_retries.items()):
-            random.shuffle(nexthops)
-            unresolved_nexthops.extend(nexthops)
-        return unresolved_nexthops
+    def _resolve_queue(self, vlan, queues, ip_gws):
+        """Return a VLAN's queue of gateways to resolve, queueing all ip_gws if new."""
+        queue = queues.get(self.IPV, None)
+        if queue is None:
+            queue = NextHopResolveQueue()
+            queues[self.IPV] = queue
+            vlan_nexthop_cache = self._vlan_nexthop_cache(vlan)
+            for ip_gw in ip_gws:
+                self._queue_resolve(queue, ip_gw, vlan_nexthop_cache.get(ip_gw, None))
+        return queue
+
+    def _next_resolve_time(self, queues, ip_gws):
+        """Return when a VLAN's queue of gateways next has one to resolve (or None)."""
+        queue = queues.get(self.IPV, None)
+        if queue is None:
+            # All gateways will be queued when first resolved.
+            if ip_gws:
+                return 0
+            return None
+        return queue.next_due_time()
+
+    def _queue_resolve(self, queue, ip_gw, nexthop_cache_entry):
+        due_time = 0
+        if nexthop_cache_entry is not None:
+            due_time = nexthop_cache_entry.resolution_due_time(self.neighbor_timeout)
+        queue.push(ip_gw, due_time)
+
+    def _schedule_resolve(self, vlan, ip_gw):
+        """Queue a gateway to be resolved when next due, as a route or host gateway."""
+        queues = None
+        if ip_gw in vlan.route_gws_by_ipv(self.IPV):
+            queues = vlan.dyn_unresolved_route_ip_gws
+        elif ip_gw in vlan.host_gws_by_ipv(self.IPV):
+            queues = vlan.dyn_unresolved_host_ip_gws
+        if queues is None:
+            return
+        queue = queues.get(self.IPV, None)
+        if queue is not None:
+            self._queue_resolve(
+                queue, ip_gw, self._vlan_nexthop_cache_entry(vlan, ip_gw))
 
     def advertise(self, vlan):
         raise NotImplementedError # pragma: no cover
 
-    def _resolve_gateway_flows(self, ip_gw, nexthop_cache_entry, vlan, now):
-        """Return packet-out ofmsgs using ARP/ND to resolve for nexthop"""
+    def _resolve_gateway_flows(self, ip_gw, nexthop_cache_entry, vlan, now, flood_ip_gws=None):
+        """Return packet-out ofmsgs using ARP/ND to resolve for nexthop.
+
+        If flood_ip_gws is a list, a nexthop to be resolved by flooding is
+        appended to it as (faucet_vip, ip_gw), to be flooded in a batch.
+        """
         faucet_vip = vlan.vip_map(ip_gw)
         if not faucet_vip:
             self.logger.info('Not resolving %s (not in connected network)' % ip_gw)
@@ -518,21 +670,23 @@ class ValveRouteManager(ValveManagerBase):
             eth_dst = nexthop_cache_entry.eth_src
             resolve_flows = [self._resolve_gw_on_port(
                 vlan, port, faucet_vip, ip_gw, eth_dst)]
+        elif flood_ip_gws is None:
+            resolve_flows = self._resolve_gws_on_vlan(vlan, [(faucet_vip, ip_gw)])
         else:
-            resolve_flows = self._resolve_gw_on_vlan(vlan, faucet_vip, ip_gw)
-        if resolve_flows:
+            flood_ip_gws.append((faucet_vip, ip_gw))
+            resolve_flows = None
+        if resolve_flows is None or resolve_flows:
             if last_retry_time is None:
                 self.logger.info(
-                    'resolving %s (%u flows) on VLAN %u' % (ip_gw, len(resolve_flows), vlan.vid))
+                    'resolving %s on VLAN %u' % (ip_gw, vlan.vid))
             else:
                 self.logger.info(
-                    'resolving %s retry %u (last attempt was %us ago; %u flows) on VLAN %u' % (
+                    'resolving %s retry %u (last attempt was %us ago) on VLAN %u' % (
                         ip_gw,
                         nexthop_cache_entry.resolve_retries,
                         now - last_retry_time,
-                        len(resolve_flows),
                         vlan.vid))
-        return resolve_flows
+        return resolve_flows or []
 
     def _expire_gateway_flows(self, ip_gw, nexthop_cache_entry, vlan, now):
         """Return ofmsgs deleting the expired nexthop information"""
@@ -542,37 +696,54 @@ class ValveRouteManager(ValveManagerBase):
                 ip_gw, nexthop_cache_entry.age(now), vlan))
         port = nexthop_cache_entry.port
         self._del_vlan_nexthop_cache_entry(vlan, ip_gw)
+        group_flows = self._del_nexthop_group(vlan, ip_gw)
         expire_flows = self._del_host_fib_route(
             vlan, ipaddress.ip_network(ip_gw.exploded))
         if port is None:
             expire_flows = []
-        return expire_flows
+        return expire_flows + group_flows
 
-    def _resolve_expire_gateway_flows(self, ip_gw, nexthop_cache_entry, vlan, now):
+    def _resolve_expire_gateway_flows(self, ip_gw, nexthop_cache_entry, vlan, now,
+                                      flood_ip_gws=None):
         """If cache entry is dead then delete related flows
         otherwise return packet-out ofmsgs to resolve nexthops"""
         if self.nexthop_dead(nexthop_cache_entry):
             return self._expire_gateway_flows(ip_gw, nexthop_cache_entry, vlan, now)
-        return self._resolve_gateway_flows(ip_gw, nexthop_cache_entry, vlan, now)
+        return self._resolve_gateway_flows(
+            ip_gw, nexthop_cache_entry, vlan, now, flood_ip_gws=flood_ip_gws)
 
     def _resolve_gateways_flows(self, resolve_handler, vlan, now,
-                                unresolved_nexthops, remaining_attempts):
-        """Resolve for nexthops using the resolve_handler
+                                queues, ip_gws, remaining_attempts):
+        """Resolve for due nexthops using the resolve_handler
         Return packet-out ofmsgs using V4 ARP/V6 ND to resolve nexthops
         """
         ofmsgs = []
-        for ip_gw in unresolved_nexthops:
-            if remaining_attempts == 0:
+        queue = self._resolve_queue(vlan, queues, ip_gws)
+        dequeued_ip_gws = []
+        flood_ip_gws = []
+        while remaining_attempts:
+            ip_gw = queue.pop(now)
+            if ip_gw is None:
                 break
+            if ip_gw not in ip_gws:
+                # Now a different kind of gateway (or no longer a gateway).
+                self._schedule_resolve(vlan, ip_gw)
+                continue
+            dequeued_ip_gws.append(ip_gw)
             entry = self._vlan_nexthop_cache_entry(vlan, ip_gw)
             if entry is None:
-                continue
+                entry = self._update_nexthop_cache(now, vlan, None, None, ip_gw)
             if not entry.resolution_due(now, self.neighbor_timeout):
                 continue
-            resolve_flows = resolve_handler(ip_gw, entry, vlan, now)
-            if resolve_flows:
+            flood_count = len(flood_ip_gws)
+            resolve_flows = resolve_handler(ip_gw, entry, vlan, now, flood_ip_gws=flood_ip_gws)
+            if resolve_flows or len(flood_ip_gws) > flood_count:
                 ofmsgs.extend(resolve_flows)
                 remaining_attempts -= 1
+        if flood_ip_gws:
+            ofmsgs.extend(self._resolve_gws_on_vlan(vlan, flood_ip_gws))
+        for ip_gw in dequeued_ip_gws:
+            self._schedule_resolve(vlan, ip_gw)
         return ofmsgs
 
     def resolve_gateways(self, vlan, now, resolve_all=True):
@@ -581,21 +752,22 @@ class ValveRouteManager(ValveManagerBase):
         Args:
             vlan (vlan): VLAN containing this RIB/FIB.
             now (float): seconds since epoch.
-            resolve_all (bool): attempt to resolve all unresolved gateways.
+            resolve_all (bool): attempt to resolve all due gateways (else just one).
         Returns:
             list: OpenFlow messages.
         """
-        unresolved_gateways = []
+        remaining_attempts = 1
         if resolve_all:
-            unresolved_gateways = self._vlan_unresolved_nexthops(
-                vlan, vlan.dyn_route_gws_by_ipv[self.IPV], now)
-            vlan.dyn_unresolved_route_ip_gws[self.IPV] = unresolved_gateways
-        else:
-            if vlan.dyn_unresolved_route_ip_gws[self.IPV]:
-                unresolved_gateways = [vlan.dyn_unresolved_route_ip_gws[self.IPV].popleft()]
+            remaining_attempts = self.max_hosts_per_resolve_cycle
         return self._resolve_gateways_flows(
             self._resolve_gateway_flows, vlan, now,
-            unresolved_gateways, self.max_hosts_per_resolve_cycle)
+            vlan.dyn_unresolved_route_ip_gws, vlan.route_gws_by_ipv(self.IPV),
+            remaining_attempts)
+
+    def next_resolve_gateways_time(self, vlan):
+        """Return when a gateway is next due to be resolved by resolve_gateways() (or None)."""
+        return self._next_resolve_time(
+            vlan.dyn_unresolved_route_ip_gws, vlan.route_gws_by_ipv(self.IPV))
 
     def resolve_expire_hosts(self, vlan, now, resolve_all=True):
         """Re/resolve hosts.
@@ -603,21 +775,22 @@ class ValveRouteManager(ValveManagerBase):
         Args:
             vlan (vlan): VLAN containing this RIB/FIB.
             now (float): seconds since epoch.
-            resolve_all (bool): attempt to resolve all unresolved gateways.
+            resolve_all (bool): attempt to resolve all due hosts (else just one).
         Returns:
             list: OpenFlow messages.
         """
-        unresolved_gateways = []
+        remaining_attempts = 1
         if resolve_all:
-            unresolved_gateways = self._vlan_unresolved_nexthops(
-                vlan, vlan.dyn_host_gws_by_ipv[self.IPV], now)
-            vlan.dyn_unresolved_host_ip_gws[self.IPV] = unresolved_gateways
-        else:
-            if vlan.dyn_unresolved_host_ip_gws[self.IPV]:
-                unresolved_gateways = [vlan.dyn_unresolved_host_ip_gws[self.IPV].popleft()]
+            remaining_attempts = self.max_hosts_per_resolve_cycle
         return self._resolve_gateways_flows(
             self._resolve_expire_gateway_flows, vlan, now,
-            unresolved_gateways, self.max_hosts_per_resolve_cycle)
+            vlan.dyn_unresolved_host_ip_gws, vlan.host_gws_by_ipv(self.IPV),
+            remaining_attempts)
+
+    def next_resolve_expire_hosts_time(self, vlan):
+        """Return when a host is next due to be resolved by resolve_expire_hosts() (or None)."""
+        return self._next_resolve_time(
+            vlan.dyn_unresolved_host_ip_gws, vlan.host_gws_by_ipv(self.IPV))
 
     def _cached_nexthop_eth_dst(self, vlan, ip_gw):
         """Return nexthop cache entry eth_dst for the ip_gw"""
@@ -654,7 +827,7 @@ class ValveRouteManager(ValveManagerBase):
                     # TODO: avoid relearning L3 source if same L3 source tries
                     # multiple L3 destinations quickly.
                     ofmsgs.extend(self.add_host_fib_route_from_pkt(now, pkt_meta))
-                    resolution_in_progress = dst_ip in vlan.dyn_host_gws_by_ipv[self.IPV]
+                    resolution_in_progress = dst_ip in vlan.host_gws_by_ipv(self.IPV)
                     ofmsgs.extend(self._add_host_fib_route(vlan, dst_ip, blackhole=True))
                     nexthop_cache_entry = self._update_nexthop_cache(
                         now, vlan, None, None, dst_ip)
@@ -663,6 +836,7 @@ class ValveRouteManager(ValveManagerBase):
                             dst_ip, nexthop_cache_entry, vlan,
                             nexthop_cache_entry.cache_time)
                         ofmsgs.extend(resolve_flows)
+                    self._schedule_resolve(vlan, dst_ip)
         return ofmsgs
 
     def router_vlan_for_ip_gw(self, vlan, ip_gw):
@@ -682,40 +856,77 @@ class ValveRouteManager(ValveManagerBase):
             return vlan
         return None
 
-    def add_route(self, vlan, ip_gw, ip_dst):
-        """Add a route to the RIB.
-
-        Args:
-            vlan (vlan): VLAN containing this RIB.
-            ip_gw (ipaddress.ip_address): IP address of nexthop.
-            ip_dst (ipaddress.ip_network): destination IP network.
-        Returns:
-            list: OpenFlow messages.
-        """
-        ofmsgs = []
+    def _add_rib_route(self, vlan, ip_gw, ip_dst):
+        """Add a route to the RIB only, returning the VLAN it was added to (or None)."""
         vlan = self.router_vlan_for_ip_gw(vlan, ip_gw)
         if vlan is None:
             self.logger.error(
                 ('Cannot resolve destination VLAN for gateway %s '
                  '(not in global router?)' % ip_gw))
-            return ofmsgs
+            return None
         if vlan.is_faucet_vip(ip_dst):
-            return ofmsgs
+            return None
         routes = self._vlan_routes(vlan)
         if routes.get(ip_dst, None) == ip_gw:
-            return ofmsgs
+            return None
 
         vlan.add_route(ip_dst, ip_gw)
-        cached_eth_dst = self._cached_nexthop_eth_dst(vlan, ip_gw)
-        if cached_eth_dst is not None:
-            ofmsgs.extend(self._add_resolved_route(
-                vlan=vlan,
-                ip_gw=ip_gw,
-                ip_dst=ip_dst,
-                eth_dst=cached_eth_dst,
-                is_updated=False))
+        self._schedule_resolve(vlan, ip_gw)
+        return vlan
+
+    def _del_rib_route(self, vlan, ip_dst):
+        """Delete a route from the RIB only, returning its gateway (or None)."""
+        if vlan.is_faucet_vip(ip_dst):
+            return None
+        routes = self._vlan_routes(vlan)
+        if ip_dst not in routes:
+            return None
+        ip_gw = routes[ip_dst]
+        vlan.del_route(ip_dst)
+        self._schedule_resolve(vlan, ip_gw)
+        return ip_gw
+
+    def update_routes(self, vlan, route_changes):
+        """Add and delete routes in the RIB, then update the FIB for all of them at once.
+
+        Args:
+            vlan (vlan): VLAN containing this RIB.
+            route_changes (list): (ip_dst, ip_gw) to add a route, or (ip_dst, None) to delete one.
+        Returns:
+            list: OpenFlow messages.
+        """
+        changed_vlans = {}
+        del_ip_gws = []
+        for ip_dst, ip_gw in route_changes:
+            if ip_gw is None:
+                del_ip_gw = self._del_rib_route(vlan, ip_dst)
+                if del_ip_gw is not None:
+                    changed_vlans[vlan.vid] = vlan
+                    del_ip_gws.append(del_ip_gw)
+            else:
+                route_vlan = self._add_rib_route(vlan, ip_gw, ip_dst)
+                if route_vlan is not None:
+                    changed_vlans[route_vlan.vid] = route_vlan
+        ofmsgs = []
+        for changed_vlan in changed_vlans.values():
+            ofmsgs.extend(self._route_changes_flows(changed_vlan))
+        for ip_gw in del_ip_gws:
+            if not vlan.ip_dsts_for_ip_gw(ip_gw):
+                ofmsgs.extend(self._del_nexthop_group(vlan, ip_gw))
         return ofmsgs
 
+    def add_route(self, vlan, ip_gw, ip_dst):
+        """Add a route to the RIB.
+
+        Args:
+            vlan (vlan): VLAN containing this RIB.
+            ip_gw (ipaddress.ip_address): IP address of nexthop.
+            ip_dst (ipaddress.ip_network): destination IP network.
+        Returns:
+            list: OpenFlow messages.
+        """
+        return self.update_routes(vlan, [(ip_dst, ip_gw)])
+
     def _add_host_fib_route(self, vlan, host_ip, blackhole=False):
         """Add a host FIB route.
 
@@ -805,14 +1016,7 @@ class ValveRouteManager(ValveManagerBase):
         Returns:
             list: OpenFlow messages.
         """
-        ofmsgs = []
-        if vlan.is_faucet_vip(ip_dst):
-            return ofmsgs
-        routes = self._vlan_routes(vlan)
-        if ip_dst in routes:
-            vlan.del_route(ip_dst)
-            ofmsgs.extend(self._del_route_flows(vlan, ip_dst))
-        return ofmsgs
+        return self.update_routes(vlan, [(ip_dst, None)])
 
     def control_plane_handler(self, now, pkt_meta):
         return self._proactive_resolve_neighbor(now, pkt_meta)
@@ -836,6 +1040,14 @@ class ValveIPv4RouteManager(ValveRouteManager):
     def _gw_resolve_pkt():
         return valve_packet.arp_request
 
+    @staticmethod
+    def _gw_resolve_pkt_template():
+        return valve_packet.arp_request_template
+
+    @staticmethod
+    def _gw_resolve_pkt_from_template():
+        return valve_packet.arp_request_from_template
+
     @staticmethod
     def _gw_respond_pkt():
         return valve_packet.arp_reply
@@ -946,6 +1158,14 @@ class ValveIPv6RouteManager(ValveRouteManager):
     def _gw_resolve_pkt():
         return valve_packet.nd_request
 
+    @staticmethod
+    def _gw_resolve_pkt_template():
+        return valve_packet.nd_request_template
+
+    @staticmethod
+    def _gw_resolve_pkt_from_template():
+        return valve_packet.nd_request_from_template
+
     @staticmethod
     def _gw_respond_pkt():
         return valve_packet.nd_advert
@@ -0,0 +1,104 @@
+"""Pace writes of OpenFlow messages to a datapath behind barrier replies."""
+
+# Copyright (C) 2015 Brad Cowie, Christopher Lorier and Joe Stringer.
+# Copyright (C) 2015 Research and Education Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict, deque
+
+
+class ValveSendWindow:
+    """Window of barriers in flight to a datapath.
+
+    A batch that ends with a barrier is in flight until the datapath
+    replies to the barrier. Once max_inflight barriers are in flight,
+    further batches are queued until a reply arrives (or the oldest
+    barrier times out). A max_inflight of 0 does not limit batches.
+    """
+
+    def __init__(self, max_inflight=0, barrier_timeout=10):
+        self.max_inflight = max_inflight
+        self.barrier_timeout = barrier_timeout
+        self.inflight = OrderedDict()
+        self.queue = deque()
+        self.queued_msgs = 0
+
+    def reset(self):
+        """Forget all queued batches and barriers in flight."""
+        self.inflight = OrderedDict()
+        self.queue = deque()
+        self.queued_msgs = 0
+
+    def _expire_inflight(self, now):
+        while self.inflight:
+            xid, sent_time = next(iter(self.inflight.items()))
+            if now - sent_time < self.barrier_timeout:
+                break
+            del self.inflight[xid]
+
+    def enqueue(self, batches):
+        """Queue serialized batches to be sent.
+
+        Args:
+            batches (iterable): tuples of (number of messages, bytearray,
+                XID of the barrier the batch ends with or None).
+        """
+        for batch_msgs, batch, barrier_xid in batches:
+            self.queue.append((batch_msgs, batch, barrier_xid))
+            self.queued_msgs += batch_msgs
+
+    def ready(self, now):
+        """Dequeue batches that can be sent now, in order.
+
+        Args:
+            now (float): current epoch time.
+        Returns:
+            list: tuples of (number of messages, bytearray), to send.
+        """
+        self._expire_inflight(now)
+        ready_batches = []
+        while self.queue:
+            if self.max_inflight and len(self.inflight) >= self.max_inflight:
+                break
+            batch_msgs, batch, barrier_xid = self.queue.popleft()
+            self.queued_msgs -= batch_msgs
+            if barrier_xid is not None:
+                self.inflight[barrier_xid] = now
+            ready_batches.append((batch_msgs, batch))
+        return ready_batches
+
+    def release_time(self):
+        """Return when queued batches are released by the oldest barrier in flight timing out.
+
+        Returns:
+            float: epoch time, or None if no batches are queued behind barriers.
+        """
+        if not self.queue or not self.inflight:
+            return None
+        return next(iter(self.inflight.values())) + self.barrier_timeout
+
+    def barrier_reply(self, xid, now):
+        """Handle a barrier reply.
+
+        Args:
+            xid (int): XID of barrier replied to.
+            now (float): current epoch time.
+        Returns:
+            float: seconds since the barrier was sent, or None if not in flight.
+        """
+        sent_time = self.inflight.pop(xid, None)
+        if sent_time is None:
+            return None
+        return now - sent_time
@@ -127,13 +127,32 @@ This includes port nominations and flood directionality."""
             event (bool): True if the port is UP
             dp (DP): DP object
             port (Port): The port being brought UP/DOWN
+        Returns:
+            bool: True if the ports this DP floods to/from changed
         """
+        prev_flood_state = self.flood_state()
         self.stack.modify_link(dp, port, event)
         towards_ports = self.reset_peer_distances()
+        flood_state = self.flood_state()
+        if flood_state == prev_flood_state:
+            return False
         if towards_ports:
             self.logger.info('shortest path to root is via %s' % towards_ports)
         else:
             self.logger.info('no path available to root')
+        return True
+
+    def flood_state(self):
+        """Return the stack state that flood rules for this DP are built from."""
+        return (
+            self.stack.is_root(),
+            self.stack.is_edge(),
+            frozenset(self.towards_root_ports),
+            frozenset(self.chosen_towards_ports),
+            self.chosen_towards_port,
+            frozenset(self.away_ports),
+            frozenset(self.inactive_away_ports),
+            frozenset(self.pruned_away_ports))
 
     def default_port_towards(self, dp_name):
         """
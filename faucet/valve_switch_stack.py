@@ -60,25 +60,31 @@ class ValveSwitchStackManagerBase(ValveSwitchManager):
         """
         other_local_dp_entries = []
         other_external_dp_entries = []
-        vlan_vid = pkt_meta.vlan.vid
-        for other_valve in other_valves:
-            other_dp_vlan = other_valve.dp.vlans.get(vlan_vid, None)
-            if other_dp_vlan is not None:
-                entry = other_dp_vlan.cached_host(pkt_meta.eth_src)
-                if not entry:
-                    continue
-                if not entry.port.non_stack_forwarding():
-                    continue
-                if entry.port.loop_protect_external:
-                    other_external_dp_entries.append(other_valve.dp)
-                else:
-                    other_local_dp_entries.append(other_valve.dp)
+        vlan = pkt_meta.vlan
+        if vlan.dyn_host_locations is not None:
+            other_dps_learned = vlan.dyn_host_locations.learned_by_others(
+                vlan.dp_id, vlan.vid, pkt_meta.eth_src_int)
+        else:
+            other_dps_learned = []
+            for other_valve in other_valves:
+                other_dp_vlan = other_valve.dp.vlans.get(vlan.vid, None)
+                if other_dp_vlan is not None:
+                    entry = other_dp_vlan.cached_host(pkt_meta.eth_src_int)
+                    if entry:
+                        other_dps_learned.append((other_valve.dp, entry))
+        for other_dp, entry in other_dps_learned:
+            if not entry.port.non_stack_forwarding():
+                continue
+            if entry.port.loop_protect_external:
+                other_external_dp_entries.append(other_dp)
+            else:
+                other_local_dp_entries.append(other_dp)
         # Another DP has learned locally, has priority.
         if other_local_dp_entries:
             return other_local_dp_entries[0]
         # No other DP has learned locally, but at least one has learned externally.
         if other_external_dp_entries:
-            entry = pkt_meta.vlan.cached_host(pkt_meta.eth_src)
+            entry = pkt_meta.vlan.cached_host(pkt_meta.eth_src_int)
             # This DP has not learned the host either, use other's external.
             if entry is None:
                 return other_external_dp_entries[0]
@@ -450,7 +450,7 @@ class ValveSwitchManager(ValveManagerBase):  # pylint: disable=too-many-public-m
         eth_src = pkt_meta.eth_src
         vlan = pkt_meta.vlan
 
-        entry = vlan.cached_host(eth_src)
+        entry = vlan.cached_host(pkt_meta.eth_src_int)
         if entry is None:
             if port.max_hosts:
                 if port.hosts_count() == port.max_hosts:
@@ -480,6 +480,17 @@ class ValveSwitchManager(ValveManagerBase):  # pylint: disable=too-many-public-m
             priority=(self.low_priority + 1),
             hard_timeout=self.learn_ban_timeout)
 
+    def ban_port_learning(self, port):
+        """Temporarily ban learning on a port.
+
+        Args:
+            port (Port): port to ban learning on.
+        Returns:
+            list: OpenFlow messages.
+        """
+        port.dyn_learn_ban_count += 1
+        return [self._temp_ban_host_learning(self.eth_src_table.match(in_port=port.number))]
+
     def delete_host_from_vlan(self, eth_src, vlan):
         """Delete a host from a VLAN."""
         ofmsgs = [self.eth_src_table.flowdel(
@@ -499,6 +510,13 @@ class ValveSwitchManager(ValveManagerBase):  # pylint: disable=too-many-public-m
                     vlan.hosts_count(), vlan.vid, expired_hosts))
         return expired_hosts
 
+    def next_host_expire_time(self, vlan):
+        """Return when a host is next due to expire from VLAN cache (or None)."""
+        oldest_cache_time = vlan.dyn_host_cache.oldest_cache_time()
+        if oldest_cache_time is None:
+            return None
+        return oldest_cache_time + self.learn_timeout
+
     def _jitter_learn_timeout(self, base_learn_timeout, port, eth_dst):
         """Calculate jittered learning timeout to avoid synchronized host timeouts."""
         # Hosts on this port never timeout.
@@ -690,7 +708,7 @@ class ValveSwitchManager(ValveManagerBase):  # pylint: disable=too-many-public-m
             dst_rule_idle_timeout))
         return (learn_exit, ofmsgs, cache_port, update_cache, delete_existing, refresh_rules)
 
-    def learn_host_on_vlan_ports(self, now, port, vlan, eth_src,
+    def learn_host_on_vlan_ports(self, now, port, vlan, eth_src, eth_src_int,
                                  delete_existing=True,
                                  last_dp_coldstart_time=None):
         """Learn a host on a port."""
@@ -699,7 +717,7 @@ class ValveSwitchManager(ValveManagerBase):  # pylint: disable=too-many-public-m
         cache_age = None
         refresh_rules = False
         update_cache = True
-        entry = vlan.cached_host(eth_src)
+        entry = vlan.cached_host(eth_src_int)
 
         # Host not cached, and no hosts expired since we cold started
         # Enable faster learning by assuming there's no previous host to delete
@@ -942,6 +960,9 @@ class ValveSwitchFlowRemovedManager(ValveSwitchManager):
     def expire_hosts_from_vlan(self, _vlan, _now):
         return []
 
+    def next_host_expire_time(self, _vlan):
+        return None
+
     def _learn_host_timeouts(self, port, eth_src):
         """Calculate flow timeouts for learning on a port."""
         learn_timeout = self._jitter_learn_timeout(self.learn_timeout, port, eth_src)
@@ -956,9 +977,9 @@ class ValveSwitchFlowRemovedManager(ValveSwitchManager):
         """When a src rule expires, the host is probably inactive or active in
         receiving but not sending. We mark just mark the host as expired."""
         ofmsgs = []
-        entry = vlan.cached_host_on_port(eth_src, port)
+        entry = vlan.cached_host_on_port(valve_packet.mac_int_from_str(eth_src), port)
         if entry is not None:
-            vlan.expire_cache_host(eth_src)
+            vlan.expire_cache_host(entry.eth_src_int)
             self.logger.info('expired src_rule for host %s' % eth_src)
         return ofmsgs
 
@@ -967,10 +988,10 @@ class ValveSwitchFlowRemovedManager(ValveSwitchManager):
         traffic but not receving. If the src rule not yet expires, we reinstall
         host rules."""
         ofmsgs = []
-        entry = vlan.cached_host(eth_dst)
+        entry = vlan.cached_host(valve_packet.mac_int_from_str(eth_dst))
         if entry is not None:
             ofmsgs.extend(self.learn_host_on_vlan_ports(
-                now, entry.port, vlan, eth_dst, delete_existing=False))
+                now, entry.port, vlan, eth_dst, entry.eth_src_int, delete_existing=False))
             self.logger.info(
                 'refreshing host %s from VLAN %u' % (eth_dst, vlan.vid))
         return ofmsgs
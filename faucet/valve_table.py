@@ -228,9 +228,10 @@ class ValveTable: # pylint: disable=too-many-arguments,too-many-instance-attribu
 class ValveGroupEntry:
     """Abstraction for a single OpenFlow group entry."""
 
-    def __init__(self, table, group_id, buckets):
+    def __init__(self, table, group_id, buckets, type_=valve_of.ofp.OFPGT_ALL):
         self.table = table
         self.group_id = group_id
+        self.type_ = type_
         self.update_buckets(buckets)
 
     def update_buckets(self, buckets):
@@ -242,7 +243,7 @@ class ValveGroupEntry:
         ofmsgs = []
         ofmsgs.append(self.delete())
         ofmsgs.append(valve_of.groupadd(
-            group_id=self.group_id, buckets=self.buckets))
+            type_=self.type_, group_id=self.group_id, buckets=self.buckets))
         self.table.entries[self.group_id] = self
         return ofmsgs
 
@@ -250,7 +251,7 @@ class ValveGroupEntry:
         """Return flow to modify an existing group entry."""
         assert self.group_id in self.table.entries
         self.table.entries[self.group_id] = self
-        return valve_of.groupmod(group_id=self.group_id, buckets=self.buckets)
+        return valve_of.groupmod(type_=self.type_, group_id=self.group_id, buckets=self.buckets)
 
     def delete(self):
         """Return flow to delete an existing group entry."""
@@ -276,13 +277,13 @@ class ValveGroupTable:
         digest = hashlib.sha256(key_str.encode('utf-8')).digest()
         return struct.unpack('<L', digest[:4])[0]
 
-    def get_entry(self, group_id, buckets):
+    def get_entry(self, group_id, buckets, type_=valve_of.ofp.OFPGT_ALL):
         """Update entry with group_id with buckets, and return the entry."""
         if group_id in self.entries:
             self.entries[group_id].update_buckets(buckets)
         else:
             self.entries[group_id] = ValveGroupEntry(
-                self, group_id, buckets)
+                self, group_id, buckets, type_=type_)
         return self.entries[group_id]
 
     def delete_all(self):
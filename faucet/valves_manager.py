@@ -24,6 +24,7 @@ from faucet.config_parser_util import config_changed, CONFIG_HASH_FUNC
 from faucet.config_parser import dp_parser, dp_preparsed_parser
 from faucet.valve import valve_factory, SUPPORTED_HARDWARE
 from faucet.valve_util import dpid_log, stat_config_files
+from faucet.vlan import HostLocations
 
 
 class MetaDPState:
@@ -102,6 +103,9 @@ class ValvesManager:
         self.config_applied = {}
         self.config_watcher = ConfigWatcher()
         self.meta_dp_state = MetaDPState()
+        self.host_locations = HostLocations()
+        self._running_valves = ()
+        self._other_running_valves_by_valve = {}
 
     def update_dp_live_time(self, now):
         """
@@ -260,10 +264,13 @@ class ValvesManager:
                 self._notify({'CONFIG_CHANGE': {'restart_type': 'new'}}, dp=new_dp)
             valve.update_config_metrics()
             self.valves[dp_id] = valve
+            self.host_locations.add_dp(valve.dp)
         if delete_dp is not None:
             for deleted_dp in deleted_dpids:
                 delete_dp(deleted_dp)
                 del self.valves[deleted_dp]
+                self.host_locations.del_dp(deleted_dp)
+        self.update_running_valves()
         self.bgp.reset(self.valves)
         self.dot1x.reset(self.valves)
         self.update_config_applied(sent)
@@ -305,25 +312,39 @@ class ValvesManager:
         self.bgp.update_metrics(now)
 
     def valve_flow_services(self, now, valve_service):
-        """Call a method on all Valves and send any resulting flows."""
+        """Call a method on all Valves it is due on, and send any resulting flows."""
         ofmsgs_by_valve = defaultdict(list)
+        self.update_running_valves()
         for valve in self.valves.values():
+            if not valve.service_due(valve_service, now):
+                continue
             other_valves = self._other_running_valves(valve)
             valve_service_labels = dict(valve.dp.base_prom_labels(), valve_service=valve_service)
             valve_service_func = getattr(valve, valve_service)
             with self.metrics.faucet_valve_service_secs.labels( # pylint: disable=no-member
                     **valve_service_labels).time():
                 for service_valve, ofmsgs in valve_service_func(now, other_valves).items():
-                    # Since we are calling all Valves, keep only the ofmsgs
-                    # provided by the last Valve called (eventual consistency).
-                    if service_valve in ofmsgs_by_valve:
-                        ofmsgs_by_valve[service_valve] = []
+                    # Since we are calling all Valves, a Valve may be given ofmsgs
+                    # by several Valves. Keep them all, in order - ofmsgs for the same
+                    # flow are deduplicated when sent, with the last one called winning.
                     ofmsgs_by_valve[service_valve].extend(ofmsgs)
         self._send_ofmsgs_by_valve(ofmsgs_by_valve)
 
+    def update_running_valves(self):
+        """Update which Valves have running DPs, after DPs connect/disconnect or are reconfigured."""
+        running_valves = tuple(
+            valve for valve in self.valves.values() if valve.dp.dyn_running)
+        if running_valves != self._running_valves:
+            self._running_valves = running_valves
+            self._other_running_valves_by_valve = {}
+
     def _other_running_valves(self, valve):
-        return [other_valve for other_valve in self.valves.values()
-                if valve != other_valve and other_valve.dp.dyn_running]
+        other_valves = self._other_running_valves_by_valve.get(valve, None)
+        if other_valves is None:
+            other_valves = [
+                other_valve for other_valve in self._running_valves if valve != other_valve]
+            self._other_running_valves_by_valve[valve] = other_valves
+        return other_valves
 
     def port_status_handler(self, valve, msg, now):
         """Handle a port status change message."""
@@ -337,6 +358,11 @@ class ValvesManager:
             **valve.dp.base_prom_labels()).inc()
         if valve.rate_limit_packet_ins(now):
             return
+        admitted, ban_ofmsgs = valve.admit_packet_in(now, msg)
+        if not admitted:
+            if ban_ofmsgs:
+                self._send_ofmsgs_by_valve({valve: ban_ofmsgs})
+            return
         pkt_meta = valve.parse_pkt_meta(msg)
         if pkt_meta is None:
             self.metrics.of_unexpected_packet_ins.labels( # pylint: disable=no-member
@@ -366,4 +392,11 @@ class ValvesManager:
         """Handle connection from DP."""
         self.meta_dp_state.dp_last_live_time[valve.dp.name] = now
         self.update_config_applied({valve.dp.dp_id: True})
-        return valve.datapath_connect(now, discovered_up_ports)
+        ofmsgs = valve.datapath_connect(now, discovered_up_ports)
+        self.update_running_valves()
+        return ofmsgs
+
+    def datapath_disconnect(self, now, valve):
+        """Handle disconnection of DP."""
+        valve.datapath_disconnect(now)
+        self.update_running_valves()
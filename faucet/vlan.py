@@ -16,14 +16,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
 import collections
+import heapq
 import ipaddress
-import random
 import netaddr
 
 from faucet import valve_of
 from faucet.conf import Conf, test_config_condition, InvalidConfigError
-from faucet.valve_packet import FAUCET_MAC
+from faucet.valve_packet import FAUCET_MAC, mac_int_to_str
 
 
 class OFVLAN:
@@ -52,16 +53,19 @@ class HostCacheEntry:
 
     __slots__ = [
         'cache_time',
-        'eth_src',
         'eth_src_int',
         'port',
     ]
 
-    def __init__(self, eth_src, port, cache_time):
-        self.eth_src = eth_src
+    def __init__(self, eth_src_int, port, cache_time):
         self.port = port
         self.cache_time = cache_time
-        self.eth_src_int = int(eth_src.replace(':', ''), 16)
+        self.eth_src_int = eth_src_int
+
+    @property
+    def eth_src(self):
+        """Return MAC of host as a string."""
+        return mac_int_to_str(self.eth_src_int)
 
     def __hash__(self):
         return hash((self.eth_src_int, self.port.number))
@@ -79,6 +83,360 @@ class HostCacheEntry:
         return self.__hash__() < other.__hash__()
 
 
+class HostCache:
+    """Compact table of hosts learned on a VLAN.
+
+    Each host is a row in typed arrays of MACs (as 48 bit ints), port numbers
+    and cache times. Rows are indexed by MAC, and each port has an array of
+    its hosts' rows. Rows of expired hosts are reused. A HostCacheEntry is
+    only built when a host is looked up, and is not kept by the cache.
+
+    Hosts are also kept in a min-heap by cache time, so the oldest hosts can be
+    found without visiting every host. A host that is cached again is pushed
+    again, and its previous heap entry ignored when it reaches the top.
+    """
+
+    __slots__ = [
+        '_cache_times',
+        '_eth_srcs',
+        '_expiry_heap',
+        '_free_rows',
+        '_port_nos',
+        '_port_row_pos',
+        '_ports',
+        '_rows_by_eth_src',
+        '_rows_by_port_no',
+    ]
+
+    def __init__(self):
+        self._eth_srcs = array.array('Q')
+        self._port_nos = array.array('L')
+        self._cache_times = array.array('d')
+        # Position of each row in its port's array of rows.
+        self._port_row_pos = array.array('L')
+        self._free_rows = array.array('L')
+        self._expiry_heap = []
+        self._rows_by_eth_src = {}
+        self._rows_by_port_no = {}
+        self._ports = {}
+
+    def __len__(self):
+        return len(self._rows_by_eth_src)
+
+    def _entry(self, row):
+        return HostCacheEntry(
+            self._eth_srcs[row], self._ports[self._port_nos[row]], self._cache_times[row])
+
+    def _add_port_row(self, port, row):
+        port_rows = self._rows_by_port_no.get(port.number, None)
+        if port_rows is None:
+            port_rows = array.array('L')
+            self._rows_by_port_no[port.number] = port_rows
+        self._ports[port.number] = port
+        self._port_nos[row] = port.number
+        self._port_row_pos[row] = len(port_rows)
+        port_rows.append(row)
+
+    def _del_port_row(self, row):
+        port_no = self._port_nos[row]
+        port_rows = self._rows_by_port_no[port_no]
+        last_row = port_rows.pop()
+        if last_row != row:
+            pos = self._port_row_pos[row]
+            port_rows[pos] = last_row
+            self._port_row_pos[last_row] = pos
+        if not port_rows:
+            del self._rows_by_port_no[port_no]
+            del self._ports[port_no]
+        return port_no
+
+    def add(self, eth_src_int, port, cache_time):
+        """Add/update a host on a port at a time.
+
+        Returns:
+            int: port number host was previously on, or None if a new host.
+        """
+        row = self._rows_by_eth_src.get(eth_src_int, None)
+        prev_port_no = None
+        if row is not None:
+            prev_port_no = self._del_port_row(row)
+        elif self._free_rows:
+            row = self._free_rows.pop()
+            self._eth_srcs[row] = eth_src_int
+            self._rows_by_eth_src[eth_src_int] = row
+        else:
+            row = len(self._eth_srcs)
+            self._eth_srcs.append(eth_src_int)
+            self._port_nos.append(0)
+            self._cache_times.append(0)
+            self._port_row_pos.append(0)
+            self._rows_by_eth_src[eth_src_int] = row
+        self._cache_times[row] = cache_time
+        self._add_port_row(port, row)
+        if len(self._expiry_heap) > 2 * len(self._rows_by_eth_src) + 64:
+            self._expiry_heap = [
+                (self._cache_times[row], eth_src_int)
+                for eth_src_int, row in self._rows_by_eth_src.items()]
+            heapq.heapify(self._expiry_heap)
+        else:
+            heapq.heappush(self._expiry_heap, (cache_time, eth_src_int))
+        return prev_port_no
+
+    def remove(self, eth_src_int):
+        """Remove a host.
+
+        Returns:
+            int: port number host was on, or None if not present.
+        """
+        row = self._rows_by_eth_src.pop(eth_src_int, None)
+        if row is None:
+            return None
+        self._free_rows.append(row)
+        return self._del_port_row(row)
+
+    def entry(self, eth_src_int):
+        """Return HostCacheEntry for a host, or None if not present."""
+        row = self._rows_by_eth_src.get(eth_src_int, None)
+        if row is None:
+            return None
+        return self._entry(row)
+
+    def entries(self):
+        """Return HostCacheEntry for all hosts."""
+        return [self._entry(row) for row in self._rows_by_eth_src.values()]
+
+    def hosts(self):
+        """Return (MAC as an integer, port number, cache time) for all hosts, without entries."""
+        return [
+            (eth_src_int, self._port_nos[row], self._cache_times[row])
+            for eth_src_int, row in self._rows_by_eth_src.items()]
+
+    def port(self, port_no):
+        """Return Port for a port number with hosts, or None."""
+        return self._ports.get(port_no, None)
+
+    def entries_on_port(self, port_no):
+        """Return HostCacheEntry for all hosts on a port."""
+        return [self._entry(row) for row in self._rows_by_port_no.get(port_no, ())]
+
+    def hosts_on_port(self, port_no):
+        """Return MACs (as integers) of all hosts on a port."""
+        return [self._eth_srcs[row] for row in self._rows_by_port_no.get(port_no, ())]
+
+    def count_on_port(self, port_no):
+        """Return number of hosts on a port."""
+        return len(self._rows_by_port_no.get(port_no, ()))
+
+    def _current(self, cache_time, eth_src_int):
+        """Return row of a heap entry, or None if the host has since been removed or cached again."""
+        row = self._rows_by_eth_src.get(eth_src_int, None)
+        if row is not None and self._cache_times[row] == cache_time:
+            return row
+        return None
+
+    def pop_cached_before(self, min_cache_time):
+        """Remove from the expiry heap, and return, hosts cached before min_cache_time.
+
+        The hosts remain in the cache, but will not be returned again
+        unless they are cached again.
+
+        Returns:
+            list: HostCacheEntry for each host.
+        """
+        entries = []
+        expiry_heap = self._expiry_heap
+        prev_heap_entry = None
+        while expiry_heap and expiry_heap[0][0] < min_cache_time:
+            heap_entry = heapq.heappop(expiry_heap)
+            # A host cached again at the same time is in the heap more than once.
+            if heap_entry == prev_heap_entry:
+                continue
+            prev_heap_entry = heap_entry
+            row = self._current(*heap_entry)
+            if row is not None:
+                entries.append(self._entry(row))
+        return entries
+
+    def oldest_cache_time(self):
+        """Return oldest cache time of hosts in the expiry heap, or None if none."""
+        expiry_heap = self._expiry_heap
+        while expiry_heap:
+            if self._current(*expiry_heap[0]) is not None:
+                return expiry_heap[0][0]
+            heapq.heappop(expiry_heap)
+        return None
+
+
+class HostLocations:
+    """Index of the DPs that have learned each host, by VLAN VID and host MAC.
+
+    One index is shared by the VLANs of all DPs managed by a controller. VLANs
+    update it as they learn and expire hosts, so the other DPs that have
+    learned a host can be found without checking every DP's host cache.
+    DPs are kept in the order they were first added, as Valves are.
+    """
+
+    def __init__(self):
+        self.dps = {}
+        self._dp_order = {}
+        self._next_dp_order = 0
+        self._dp_ids_by_host = {}
+        self._hosts_by_dp_id = collections.defaultdict(set)
+
+    def add_dp(self, dp):
+        """Index all hosts learned by a DP, replacing any previously indexed for it."""
+        self._del_dp_hosts(dp.dp_id)
+        if dp.dp_id not in self._dp_order:
+            self._dp_order[dp.dp_id] = self._next_dp_order
+            self._next_dp_order += 1
+        self.dps[dp.dp_id] = dp
+        for vlan in dp.vlans.values():
+            vlan.dyn_host_locations = self
+            if vlan.dyn_host_cache is not None:
+                for eth_src_int, _, _ in vlan.dyn_host_cache.hosts():
+                    self.add(dp.dp_id, vlan.vid, eth_src_int)
+
+    def del_dp(self, dp_id):
+        """Remove a DP, and all hosts it has learned, from the index."""
+        self.dps.pop(dp_id, None)
+        self._dp_order.pop(dp_id, None)
+        self._del_dp_hosts(dp_id)
+
+    def _del_dp_hosts(self, dp_id):
+        for host in self._hosts_by_dp_id.pop(dp_id, ()):
+            dp_ids = self._dp_ids_by_host[host]
+            dp_ids.discard(dp_id)
+            if not dp_ids:
+                del self._dp_ids_by_host[host]
+
+    def add(self, dp_id, vid, eth_src_int):
+        """Index a host learned by a DP."""
+        host = (vid, eth_src_int)
+        self._dp_ids_by_host.setdefault(host, set()).add(dp_id)
+        self._hosts_by_dp_id[dp_id].add(host)
+
+    def remove(self, dp_id, vid, eth_src_int):
+        """Remove a host expired by a DP from the index."""
+        host = (vid, eth_src_int)
+        dp_ids = self._dp_ids_by_host.get(host, None)
+        if dp_ids is None or dp_id not in dp_ids:
+            return
+        dp_ids.remove(dp_id)
+        if not dp_ids:
+            del self._dp_ids_by_host[host]
+        self._hosts_by_dp_id[dp_id].discard(host)
+
+    def learned_by_others(self, dp_id, vid, eth_src_int):
+        """Return list of (DP, HostCacheEntry), for other running DPs that learned a host.
+
+        DPs are returned in the order they were first added.
+        """
+        learned = []
+        for other_dp_id in sorted(
+                self._dp_ids_by_host.get((vid, eth_src_int), ()), key=self._dp_order.get):
+            if other_dp_id == dp_id:
+                continue
+            other_dp = self.dps[other_dp_id]
+            if not other_dp.dyn_running:
+                continue
+            other_vlan = other_dp.vlans.get(vid, None)
+            if other_vlan is None:
+                continue
+            entry = other_vlan.cached_host(eth_src_int)
+            if entry is not None:
+                learned.append((other_dp, entry))
+        return learned
+
+
+class RouteTable:
+    """Routes for one IP version on a VLAN.
+
+    Routes are kept by exact destination only, as nothing in the controller
+    looks routes up by longest prefix - the switch does that, in the FIB.
+    Each gateway's destinations are indexed, so gateways can be found as
+    host or route gateways without visiting every route. Route changes are
+    journaled (coalesced by destination), until popped to update the FIB.
+    """
+
+    __slots__ = [
+        '_changes',
+        '_dsts_by_gw',
+        'host_gws',
+        'route_gws',
+        'routes',
+    ]
+
+    def __init__(self):
+        self._dsts_by_gw = {}
+        self._changes = collections.OrderedDict()
+        self.routes = {}
+        self.host_gws = set()
+        self.route_gws = set()
+
+    def __len__(self):
+        return len(self.routes)
+
+    def _is_host_gw(self, ip_gw):
+        ip_dsts = self._dsts_by_gw.get(ip_gw, ())
+        if len(ip_dsts) != 1:
+            return False
+        ip_dst = next(iter(ip_dsts))
+        return (ip_dst.prefixlen == ip_dst.max_prefixlen and
+                ip_dst.network_address == ip_gw)
+
+    def _update_gw_type(self, ip_gw):
+        self.host_gws.discard(ip_gw)
+        self.route_gws.discard(ip_gw)
+        if self._is_host_gw(ip_gw):
+            self.host_gws.add(ip_gw)
+        elif ip_gw in self._dsts_by_gw:
+            self.route_gws.add(ip_gw)
+
+    def _journal(self, ip_dst, ip_gw):
+        self._changes.pop(ip_dst, None)
+        self._changes[ip_dst] = ip_gw
+
+    def add(self, ip_dst, ip_gw):
+        """Add (or replace) the route to ip_dst, via ip_gw."""
+        prev_ip_gw = self.routes.get(ip_dst, None)
+        if prev_ip_gw == ip_gw:
+            return
+        if prev_ip_gw is not None:
+            self._del_gw_dst(prev_ip_gw, ip_dst)
+        self.routes[ip_dst] = ip_gw
+        self._dsts_by_gw.setdefault(ip_gw, set()).add(ip_dst)
+        self._update_gw_type(ip_gw)
+        self._journal(ip_dst, ip_gw)
+
+    def delete(self, ip_dst):
+        """Delete the route to ip_dst, returning its gateway."""
+        ip_gw = self.routes.pop(ip_dst)
+        self._del_gw_dst(ip_gw, ip_dst)
+        self._journal(ip_dst, None)
+        return ip_gw
+
+    def _del_gw_dst(self, ip_gw, ip_dst):
+        ip_dsts = self._dsts_by_gw[ip_gw]
+        ip_dsts.remove(ip_dst)
+        if not ip_dsts:
+            del self._dsts_by_gw[ip_gw]
+        self._update_gw_type(ip_gw)
+
+    def dsts_for_gw(self, ip_gw):
+        """Return list of destinations routed via ip_gw."""
+        return list(self._dsts_by_gw.get(ip_gw, ()))
+
+    def gws(self):
+        """Return all gateways."""
+        return frozenset(self._dsts_by_gw)
+
+    def pop_changes(self):
+        """Return list of (ip_dst, ip_gw) changes since last popped (ip_gw None if deleted)."""
+        changes = list(self._changes.items())
+        self._changes.clear()
+        return changes
+
+
 class VLAN(Conf):
     """Contains state for one VLAN, including its configuration."""
 
@@ -171,18 +529,15 @@ class VLAN(Conf):
         self.dot1x_untagged = []
 
         self.dyn_host_cache = None
-        self.dyn_host_cache_by_port = None
-        self.dyn_host_cache_stats_stale = None
+        self.dyn_host_cache_changes = None
+        self.dyn_host_locations = None
         self.dyn_last_time_hosts_expired = None
         self.dyn_learn_ban_count = 0
         self.dyn_neigh_cache_by_ipv = None
         self.dyn_oldest_host_time = None
         self.dyn_last_updated_metrics_sec = None
 
-        self.dyn_routes_by_ipv = collections.defaultdict(dict)
-        self.dyn_gws_by_ipv = collections.defaultdict(dict)
-        self.dyn_host_gws_by_ipv = collections.defaultdict(set)
-        self.dyn_route_gws_by_ipv = collections.defaultdict(set)
+        self.dyn_route_tables_by_ipv = {}
         self.reset_caches()
         super(VLAN, self).__init__(_id, dp_id, conf)
 
@@ -258,12 +613,39 @@ class VLAN(Conf):
 
     def reset_caches(self):
         """Reset dynamic caches."""
-        self.dyn_host_cache = {}
-        self.dyn_host_cache_by_port = {}
-        self.dyn_host_cache_stats_stale = {}
+        host_cache_changes = collections.defaultdict(dict)
+        # Journal all hosts as expired, including changes not yet exported.
+        if self.dyn_host_cache_changes is not None:
+            for port_no, changes in self.dyn_host_cache_changes.items():
+                host_cache_changes[port_no] = dict.fromkeys(changes, False)
+        if self.dyn_host_cache is not None:
+            for eth_src_int, port_no, _ in self.dyn_host_cache.hosts():
+                host_cache_changes[port_no][eth_src_int] = False
+                if self.dyn_host_locations is not None:
+                    self.dyn_host_locations.remove(self.dp_id, self.vid, eth_src_int)
+        self.dyn_host_cache = HostCache()
+        self.dyn_host_cache_changes = host_cache_changes
         self.dyn_neigh_cache_by_ipv = collections.defaultdict(dict)
-        self.dyn_unresolved_route_ip_gws = collections.defaultdict(list)
-        self.dyn_unresolved_host_ip_gws = collections.defaultdict(list)
+        self.dyn_unresolved_route_ip_gws = {}
+        self.dyn_unresolved_host_ip_gws = {}
+
+    def clone_dyn_state(self, prev_vlan):
+        """Clone learned hosts still on this VLAN's ports, from a previous config of it.
+
+        Returns:
+            list: HostCacheEntry for hosts not cloned, as no longer on this VLAN's ports.
+        """
+        ports_by_number = {port.number: port for port in self.get_ports()}
+        removed_entries = []
+        prev_host_cache = prev_vlan.dyn_host_cache
+        for eth_src_int, port_no, cache_time in prev_host_cache.hosts():
+            port = ports_by_number.get(port_no, None)
+            if port is None:
+                removed_entries.append(HostCacheEntry(
+                    eth_src_int, prev_host_cache.port(port_no), cache_time))
+                continue
+            self.add_cache_host(eth_src_int, port, cache_time)
+        return removed_entries
 
     def reset_ports(self, ports):
         """Reset tagged and untagged port lists."""
@@ -274,56 +656,47 @@ class VLAN(Conf):
         self.dot1x_untagged = tuple([port for port in sorted_ports
                                      if self == port.dyn_dot1x_native_vlan])
 
-    def add_cache_host(self, eth_src, port, cache_time):
-        """Add/update a host to the cache on a port at at time."""
-        existing_entry = self.cached_host(eth_src)
-        if existing_entry is None:
-            self.dyn_host_cache_stats_stale[port.number] = True
-        else:
-            self.dyn_host_cache_by_port[existing_entry.port.number].remove(
-                existing_entry)
-        entry = HostCacheEntry(eth_src, port, cache_time)
-        if port.number not in self.dyn_host_cache_by_port:
-            self.dyn_host_cache_by_port[port.number] = set()
-        self.dyn_host_cache_by_port[port.number].add(entry)
-        self.dyn_host_cache[eth_src] = entry
-
-    def expire_cache_host(self, eth_src):
-        """Expire a host from caches."""
-        entry = self.cached_host(eth_src)
-        if entry is not None:
-            self.dyn_host_cache_stats_stale[entry.port.number] = True
-            self.dyn_host_cache_by_port[entry.port.number].remove(entry)
-            del self.dyn_host_cache[eth_src]
+    def add_cache_host(self, eth_src_int, port, cache_time):
+        """Add/update a host (by MAC as an integer) to the cache on a port at at time."""
+        prev_port_no = self.dyn_host_cache.add(eth_src_int, port, cache_time)
+        if prev_port_no != port.number:
+            if prev_port_no is not None:
+                self.dyn_host_cache_changes[prev_port_no][eth_src_int] = False
+            elif self.dyn_host_locations is not None:
+                self.dyn_host_locations.add(self.dp_id, self.vid, eth_src_int)
+            self.dyn_host_cache_changes[port.number][eth_src_int] = True
+
+    def expire_cache_host(self, eth_src_int):
+        """Expire a host (by MAC as an integer) from caches."""
+        port_no = self.dyn_host_cache.remove(eth_src_int)
+        if port_no is not None:
+            self.dyn_host_cache_changes[port_no][eth_src_int] = False
+            if self.dyn_host_locations is not None:
+                self.dyn_host_locations.remove(self.dp_id, self.vid, eth_src_int)
 
     def cached_hosts_on_port(self, port):
         """Return all hosts learned on a port."""
-        if port.number in self.dyn_host_cache_by_port:
-            return list(self.dyn_host_cache_by_port[port.number])
-        return []
+        return self.dyn_host_cache.entries_on_port(port.number)
 
     def cached_hosts_count_on_port(self, port):
         """Return count of all hosts learned on a port."""
-        hosts_count = 0
-        if port.number in self.dyn_host_cache_by_port:
-            hosts_count = len(self.dyn_host_cache_by_port[port.number])
-        return hosts_count
+        return self.dyn_host_cache.count_on_port(port.number)
 
-    def cached_host(self, eth_src):
-        """Return host from cache or None."""
-        return self.dyn_host_cache.get(eth_src, None)
+    def cached_host(self, eth_src_int):
+        """Return host (by MAC as an integer) from cache or None."""
+        return self.dyn_host_cache.entry(eth_src_int)
 
-    def cached_host_on_port(self, eth_src, port):
+    def cached_host_on_port(self, eth_src_int, port):
         """Return host cache entry if host in cache and on specified port."""
-        entry = self.cached_host(eth_src)
+        entry = self.cached_host(eth_src_int)
         if entry and port == entry.port:
             return entry
         return None
 
     def clear_cache_hosts_on_port(self, port):
         """Clear all hosts learned on a port."""
-        for entry in self.cached_hosts_on_port(port):
-            self.expire_cache_host(entry.eth_src)
+        for eth_src_int in self.dyn_host_cache.hosts_on_port(port.number):
+            self.expire_cache_host(eth_src_int)
 
     def expire_cache_hosts(self, now, learn_timeout):
         """Expire stale host entries."""
@@ -332,14 +705,13 @@ class VLAN(Conf):
 
         if self.dyn_oldest_host_time is None or self.dyn_oldest_host_time < min_cache_time:
             expired_hosts = [
-                entry for entry in self.dyn_host_cache.values()
-                if entry.cache_time < min_cache_time and not entry.port.permanent_learn]
+                entry for entry in self.dyn_host_cache.pop_cached_before(min_cache_time)
+                if not entry.port.permanent_learn]
             for entry in expired_hosts:
-                self.expire_cache_host(entry.eth_src)
-            self.dyn_oldest_host_time = now
-            if self.dyn_host_cache:
-                self.dyn_oldest_host_time = min(
-                    [entry.cache_time for entry in self.dyn_host_cache.values()])
+                self.expire_cache_host(entry.eth_src_int)
+            self.dyn_oldest_host_time = self.dyn_host_cache.oldest_cache_time()
+            if self.dyn_oldest_host_time is None:
+                self.dyn_oldest_host_time = now
         return expired_hosts
 
     def faucet_vips_by_ipv(self, ipv):
@@ -357,13 +729,21 @@ class VLAN(Conf):
         """Return IP versions configured on this VLAN."""
         return self._ipvs(self.faucet_vips)
 
+    def route_table_by_ipv(self, ipv):
+        """Return RouteTable for specified IP version on this VLAN."""
+        route_table = self.dyn_route_tables_by_ipv.get(ipv, None)
+        if route_table is None:
+            route_table = RouteTable()
+            self.dyn_route_tables_by_ipv[ipv] = route_table
+        return route_table
+
     def routes_by_ipv(self, ipv):
         """Return route table for specified IP version on this VLAN."""
-        return self.dyn_routes_by_ipv[ipv]
+        return self.route_table_by_ipv(ipv).routes
 
     def route_count_by_ipv(self, ipv):
         """Return route table count for specified IP version on this VLAN."""
-        return len(self.dyn_routes_by_ipv[ipv])
+        return len(self.route_table_by_ipv(ipv))
 
     def is_host_fib_route(self, host_ip):
         """Return True if IP destination is a host FIB route.
@@ -373,48 +753,35 @@ class VLAN(Conf):
         Returns:
             True if a host FIB route (and not used as a gateway).
         """
-        ip_dsts = self.ip_dsts_for_ip_gw(host_ip)
-        if (len(ip_dsts) == 1 and
-                ip_dsts[0].prefixlen == ip_dsts[0].max_prefixlen and
-                ip_dsts[0].network_address == host_ip):
-            return True
-        return False
+        return host_ip in self.route_table_by_ipv(host_ip.version).host_gws
 
-    def _update_gw_types(self, ip_gw):
-        """Update dyn host/route gw information to a different ip version"""
-        if self.is_host_fib_route(ip_gw):
-            self.dyn_host_gws_by_ipv[ip_gw.version].add(ip_gw)
-            self.dyn_route_gws_by_ipv[ip_gw.version] -= set([ip_gw])
-        else:
-            self.dyn_route_gws_by_ipv[ip_gw.version].add(ip_gw)
-            self.dyn_host_gws_by_ipv[ip_gw.version] -= set([ip_gw])
+    def host_gws_by_ipv(self, ipv):
+        """Return set of gateways that are only the gateway for their own host FIB route."""
+        return self.route_table_by_ipv(ipv).host_gws
+
+    def route_gws_by_ipv(self, ipv):
+        """Return set of gateways for other routes."""
+        return self.route_table_by_ipv(ipv).route_gws
 
     def add_route(self, ip_dst, ip_gw):
         """Add an IP route."""
-        self.dyn_routes_by_ipv[ip_gw.version][ip_dst] = ip_gw
-        if ip_gw not in self.dyn_gws_by_ipv[ip_gw.version]:
-            self.dyn_gws_by_ipv[ip_gw.version][ip_gw] = set()
-        self.dyn_gws_by_ipv[ip_gw.version][ip_gw].add(ip_dst)
-        self._update_gw_types(ip_gw)
+        self.route_table_by_ipv(ip_gw.version).add(ip_dst, ip_gw)
 
     def del_route(self, ip_dst):
         """Delete an IP route."""
-        ip_gw = self.dyn_routes_by_ipv[ip_dst.version][ip_dst]
-        del self.dyn_routes_by_ipv[ip_dst.version][ip_dst]
-        self.dyn_gws_by_ipv[ip_gw.version][ip_gw].remove(ip_dst)
-        if not self.dyn_gws_by_ipv[ip_gw.version][ip_gw]:
-            del self.dyn_gws_by_ipv[ip_gw.version][ip_gw]
-        self._update_gw_types(ip_gw)
+        self.route_table_by_ipv(ip_dst.version).delete(ip_dst)
+
+    def pop_route_changes(self, ipv):
+        """Return list of (ip_dst, ip_gw) route changes (ip_gw None if deleted) since last popped."""
+        return self.route_table_by_ipv(ipv).pop_changes()
 
     def ip_dsts_for_ip_gw(self, ip_gw):
         """Return list of IP destinations, for specified gateway."""
-        if ip_gw in self.dyn_gws_by_ipv[ip_gw.version]:
-            return list(self.dyn_gws_by_ipv[ip_gw.version][ip_gw])
-        return []
+        return self.route_table_by_ipv(ip_gw.version).dsts_for_gw(ip_gw)
 
     def all_ip_gws(self, ipv):
         """Return all IP gateways for specified IP version."""
-        return frozenset(self.dyn_gws_by_ipv[ipv].keys())
+        return self.route_table_by_ipv(ipv).gws()
 
     def neigh_cache_by_ipv(self, ipv):
         """Return neighbor cache for specified IP version on this VLAN."""
@@ -556,24 +923,25 @@ class VLAN(Conf):
         pkt = packet_builder(vid, *args)
         return valve_of.packetout(port.number, bytes(pkt.data))
 
-    def flood_pkt(self, packet_builder, multi_out=True, *args):
-        """Return Packet-out actions via flooding"""
-        ofmsgs = []
+    def flood_port_nos(self):
+        """Return list of (vid, running port numbers) to flood a packet to."""
+        flood_port_nos = []
+        exclude_ports = self.excluded_lag_ports()
         for vid, ports in (
                 (self.vid, self.tagged_flood_ports(False)),
                 (None, self.untagged_flood_ports(False))):
-            if ports:
-                pkt = packet_builder(vid, *args)
-                exclude_ports = self.excluded_lag_ports()
-                running_port_nos = [
-                    port.number for port in ports if port.running() and port not in exclude_ports]
-                if running_port_nos:
-                    random.shuffle(running_port_nos)
-                    if multi_out:
-                        ofmsgs.append(valve_of.packetouts(running_port_nos, pkt.data))
-                    else:
-                        ofmsgs.extend(
-                            [valve_of.packetout(port_no, pkt.data) for port_no in running_port_nos])
+            running_port_nos = [
+                port.number for port in ports if port.running() and port not in exclude_ports]
+            if running_port_nos:
+                flood_port_nos.append((vid, running_port_nos))
+        return flood_port_nos
+
+    def flood_pkt(self, packet_builder, multi_out=True, *args):
+        """Return Packet-out actions via flooding"""
+        ofmsgs = []
+        for vid, running_port_nos in self.flood_port_nos():
+            pkt = packet_builder(vid, *args)
+            ofmsgs.extend(valve_of.flood_packetouts(running_port_nos, pkt.data, multi_out))
         return ofmsgs
 
     def port_is_tagged(self, port):
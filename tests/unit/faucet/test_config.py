@@ -1631,6 +1631,63 @@ dps:
             }
         self._check_table_names_numbers(dp, tables)
 
+    def test_group_table_routing_egress_acl(self):
+        """Test group_table_routing is rejected with egress ACLs and egress_pipeline"""
+        config = """
+acls:
+    vlan-protect:
+        - rule:
+            dl_type: 0x800
+            actions:
+                allow: 0
+vlans:
+    office:
+        vid: 100
+        faucet_vips: ["10.100.0.254/24"]
+        acl_out: vlan-protect
+dps:
+    sw1:
+        dp_id: 0x1
+        group_table_routing: True
+        interfaces:
+            1:
+                native_vlan: office
+"""
+        self.check_config_failure(config, cp.dp_parser)
+        config = """
+vlans:
+    office:
+        vid: 100
+        faucet_vips: ["10.100.0.254/24"]
+dps:
+    sw1:
+        dp_id: 0x1
+        group_table_routing: True
+        egress_pipeline: True
+        interfaces:
+            1:
+                native_vlan: office
+"""
+        self.check_config_failure(config, cp.dp_parser)
+
+    def test_group_table_routing_hairpin(self):
+        """Test group_table_routing is rejected with hairpin ports"""
+        config = """
+vlans:
+    office:
+        vid: 100
+        faucet_vips: ["10.100.0.254/24"]
+dps:
+    sw1:
+        dp_id: 0x1
+        group_table_routing: True
+        interfaces:
+            1:
+                native_vlan: office
+                hairpin: True
+"""
+        self.check_config_failure(config, cp.dp_parser)
+
     def test_tunnel_config_valid_accepted(self):
         """Test config is accepted when tunnel acl is valid"""
         config = """
@@ -19,16 +19,18 @@
 
 
 import copy
+import ipaddress
+import struct
 import unittest
 
 from ryu.lib import mac
-from ryu.lib.packet import slow
+from ryu.lib.packet import arp, slow
 from ryu.ofproto import ether
 from ryu.ofproto import ofproto_v1_3 as ofp
 from ryu.ofproto import ofproto_v1_3_parser as parser
 
 from faucet import valve_of
-from faucet import valve_packet
+from faucet.valve import LearnedMacSlots
 
 from clib.valve_test_lib import (
     CONFIG, DP1_CONFIG, FAUCET_MAC, GROUP_DP1_CONFIG, IDLE_DP1_CONFIG,
@@ -74,10 +76,57 @@ dps:
                     'ipv4_src': '10.0.0.2',
                     'ipv4_dst': '10.0.0.3',
                     'vid': 0x100})
-        # pylint: disable=no-member
-        # pylint: disable=no-value-for-parameter
-        cache_info = valve_packet.parse_packet_in_pkt.cache_info()
-        self.assertGreater(cache_info.hits, cache_info.misses, msg=cache_info)
+
+
+class ValvePacketInAdmissionTestCase(ValveTestBases.ValveTestNetwork):
+    """Test packet ins are admitted within per port rate limits."""
+
+    CONFIG = """
+dps:
+    s1:
+        admit_packetin_port_pps: 2
+        admit_packetin_port_ban: True
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: 0x100
+            p2:
+                number: 2
+                native_vlan: 0x100
+""" % DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valves(self.CONFIG)
+
+    def _rcv_host_packet(self, port, host):
+        return self.rcv_packet(port, 0x100, {
+            'eth_src': '0e:00:00:00:%02x:%02x' % (port, host),
+            'eth_dst': self.P2_V200_MAC,
+            'ipv4_src': '10.0.0.2',
+            'ipv4_dst': '10.0.0.3',
+            'vid': 0x100})
+
+    def test_port_packet_in_limit(self):
+        """Test a port over its limit is banned, without limiting other ports."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        port1 = valve.dp.ports[1]
+        for host in range(2):
+            self.assertTrue(self._rcv_host_packet(1, host)[self.DP_ID])
+        ban_ofmsgs = self._rcv_host_packet(1, 2)[self.DP_ID]
+        self.assertEqual(1, port1.dyn_learn_ban_count)
+        self.assertEqual(1, len(ban_ofmsgs))
+        self.assertEqual(ban_ofmsgs[0].hard_timeout, valve.dp.learn_ban_timeout)
+        self.assertEqual(1, self.get_prom(
+            'port_packet_ins_limited_total', labels=valve.dp.port_labels(1), bare=True))
+        # Port is only banned once per ban timeout.
+        self.assertFalse(self._rcv_host_packet(1, 3)[self.DP_ID])
+        self.assertEqual(1, port1.dyn_learn_ban_count)
+        self.assertEqual(2, self.get_prom(
+            'port_packet_ins_limited_total', labels=valve.dp.port_labels(1), bare=True))
+        # Other ports are still admitted.
+        self.assertTrue(self._rcv_host_packet(2, 0)[self.DP_ID])
+        self.assertEqual(0, valve.dp.ports[2].dyn_learn_ban_count)
 
 
 class ValveCoprocessorTestCase(ValveTestBases.ValveTestNetwork):
@@ -200,13 +249,328 @@ class ValveOFErrorTestCase(ValveTestBases.ValveTestNetwork):
         test_err = parser.OFPErrorMsg(
             datapath=None, type_=ofp.OFPET_FLOW_MOD_FAILED, code=ofp.OFPFMFC_UNKNOWN)
         valve = self.valves_manager.valves[self.DP_ID]
-        valve.oferror(test_err)
+        valve.oferror(test_err, self.mock_time())
         test_unknown_type_err = parser.OFPErrorMsg(
             datapath=None, type_=666, code=ofp.OFPFMFC_UNKNOWN)
-        valve.oferror(test_unknown_type_err)
+        valve.oferror(test_unknown_type_err, self.mock_time())
         test_unknown_code_err = parser.OFPErrorMsg(
             datapath=None, type_=ofp.OFPET_FLOW_MOD_FAILED, code=666)
-        valve.oferror(test_unknown_code_err)
+        valve.oferror(test_unknown_code_err, self.mock_time())
+
+
+class ValveLearnedMacsTestCase(ValveTestBases.ValveTestNetwork):
+    """Test learned_macs metrics are cleared when a DP reconnects."""
+
+    CONFIG = ValveFuzzTestCase.CONFIG
+
+    def setUp(self):
+        self.setup_valves(self.CONFIG)
+
+    def test_learned_macs_reconnect(self):
+        """Test learned_macs slots are zeroed for hosts reset on reconnect."""
+        labels = dict(port='p1', port_description='p1', vlan='256', n='0')
+        self.rcv_packet(1, 0x100, {
+            'eth_src': self.P1_V100_MAC,
+            'eth_dst': self.UNKNOWN_MAC,
+            'ipv4_src': '10.0.0.1',
+            'ipv4_dst': '10.0.0.2'})
+        self.assertEqual(
+            int(self.P1_V100_MAC.replace(':', ''), 16), self.get_prom('learned_macs', labels=labels))
+        self.disconnect_dp()
+        self.connect_dp()
+        self.valves_manager.update_metrics(self.mock_time())
+        self.assertEqual(0, self.get_prom('learned_macs', labels=labels))
+
+
+class ValveLearnedMacSlotsTestCase(unittest.TestCase):  # pytype: disable=module-attr
+    """Test learned_macs slots are stable, reused and compacted."""
+
+    def test_slots(self):
+        """Test only changed slots are updated."""
+        slots = LearnedMacSlots()
+        self.assertEqual({0: 10, 1: 11, 2: 12}, slots.update({10: True, 11: True, 12: True}))
+        self.assertEqual({}, slots.update({11: True}))
+        # Expired MAC's slot is reused.
+        self.assertEqual({1: 13}, slots.update({11: False, 13: True}))
+        # Once more slots are free than used, remaining MACs are moved to the lowest slots.
+        self.assertEqual({0: 12, 1: 0, 2: 0}, slots.update({10: False, 13: False}))
+        self.assertEqual(1, slots.highwater)
+        self.assertEqual({1: 14}, slots.update({14: True}))
+
+
+class ValveSendFlowsTestCase(ValveTestBases.ValveTestNetwork):
+    """Test flows are written to the datapath in batches."""
+
+    class FakeRyuDP:
+        """Fake Ryu datapath, that records writes."""
+
+        ofproto = ofp
+        ofproto_parser = parser
+
+        def __init__(self):
+            self.xid = 0
+            self.writes = []
+
+        def set_xid(self, msg):
+            self.xid += 1
+            msg.set_xid(self.xid)
+
+        def send(self, buf):
+            self.writes.append(bytes(buf))
+            return True
+
+    def setUp(self):
+        self.setup_valves(CONFIG)
+
+    def test_send_flows_batched(self):
+        """Test connect flows are written as few contiguous batches split at barriers."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        ryu_dp = self.FakeRyuDP()
+        flow_msgs = valve.switch_features(None) + valve.datapath_connect(
+            self.mock_time(10), set(valve.dp.ports.keys()))
+        valve.send_flows(ryu_dp, flow_msgs, self.mock_time(10))
+        sent_msgs = valve_of.valve_flowreorder(flow_msgs, use_barriers=valve.USE_BARRIERS)
+        self.assertLess(len(ryu_dp.writes), len(sent_msgs))
+        self.assertEqual(len(ryu_dp.writes), self.get_prom('of_flowmsgs_batch_size_count'))
+        self.assertEqual(len(sent_msgs), self.get_prom('of_flowmsgs_batch_size_sum'))
+        self.assertEqual(
+            sum(len(buf) for buf in ryu_dp.writes), self.get_prom('of_flowmsgs_batch_bytes_sum'))
+        written_bufs = []
+        for buf in ryu_dp.writes:
+            while buf:
+                msg_len = struct.unpack_from('!H', buf, 2)[0]
+                written_bufs.append(buf[:msg_len])
+                buf = buf[msg_len:]
+        expected_bufs = []
+        for flow_msg in sent_msgs:
+            flow_msg.serialize()
+            expected_bufs.append(bytes(flow_msg.buf))
+        self.assertEqual(sorted(expected_bufs), sorted(written_bufs))
+        # Each batch ends with a barrier, except possibly the last.
+        for buf in ryu_dp.writes[:-1]:
+            self.assertEqual(ofp.OFPT_BARRIER_REQUEST, buf[-ofp.OFP_HEADER_SIZE + 1])
+
+    def test_send_flows_chunks(self):
+        """Test connect flows are written a chunk at a time, before flows sent in between."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        ryu_dp = self.FakeRyuDP()
+        flow_msgs = valve.switch_features(None) + valve.datapath_connect(
+            self.mock_time(10), set(valve.dp.ports.keys()))
+        sent_msgs = valve_of.valve_flowreorder(flow_msgs, use_barriers=valve.USE_BARRIERS)
+        chunks = valve.send_flows_chunks(ryu_dp, flow_msgs, chunk_msgs=10)
+        self.assertFalse(ryu_dp.writes)
+        next(chunks)
+        self.assertEqual(10, self.get_prom('of_flowmsgs_batch_size_sum'))
+        # Flows sent while chunks remain are held until the last chunk is written.
+        valve.send_flows(ryu_dp, [valve_of.barrier()], self.mock_time(10))
+        self.assertEqual(10, self.get_prom('of_flowmsgs_batch_size_sum'))
+        chunk_count = 1 + len(list(chunks))
+        self.assertEqual((len(sent_msgs) + 9) // 10, chunk_count)
+        self.assertEqual(len(sent_msgs) + 1, self.get_prom('of_flowmsgs_batch_size_sum'))
+        self.assertEqual(ofp.OFPT_BARRIER_REQUEST, ryu_dp.writes[-1][1])
+        self.assertEqual(ofp.OFP_HEADER_SIZE, len(ryu_dp.writes[-1]))
+
+
+class ValveSendWindowTestCase(ValveTestBases.ValveTestNetwork):
+    """Test flows are held back behind barriers in flight to the datapath."""
+
+    def setUp(self):
+        self.setup_valves(CONFIG.replace(
+            '        dp_id: 1\n', '        dp_id: 1\n        max_inflight_barriers: 1\n', 1))
+
+    def test_send_window(self):
+        """Test only one barrier is in flight, and the rest are sent on barrier replies."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        ryu_dp = ValveSendFlowsTestCase.FakeRyuDP()
+        flow_msgs = valve.switch_features(None) + valve.datapath_connect(
+            self.mock_time(10), set(valve.dp.ports.keys()))
+        valve.send_flows(ryu_dp, flow_msgs, self.mock_time(10))
+        sent_msgs = valve_of.valve_flowreorder(flow_msgs, use_barriers=valve.USE_BARRIERS)
+        self.assertEqual(1, len(ryu_dp.writes))
+        self.assertGreater(self.get_prom('of_flowmsgs_queued'), 0)
+        replies = 0
+        while self.get_prom('of_flowmsgs_queued'):
+            writes = len(ryu_dp.writes)
+            barrier_reply = parser.OFPBarrierReply(None)
+            barrier_reply.xid = struct.unpack_from(
+                '!I', ryu_dp.writes[-1], len(ryu_dp.writes[-1]) - ofp.OFP_HEADER_SIZE + 4)[0]
+            valve.barrier_reply_handler(ryu_dp, barrier_reply, self.mock_time(1))
+            replies += 1
+            self.assertEqual(writes + 1, len(ryu_dp.writes))
+        self.assertEqual(replies, self.get_prom('of_barrier_rtt_secs_count'))
+        self.assertEqual(1, self.get_prom('of_barrier_rtt_secs_sum') / replies)
+        self.assertEqual(len(sent_msgs), self.get_prom('of_flowmsgs_batch_size_sum'))
+
+    def test_lost_barrier_reply(self):
+        """Test batches queued behind a barrier whose reply is lost are released by a service."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        ryu_dp = ValveSendFlowsTestCase.FakeRyuDP()
+        now = self.mock_time(10)
+        flow_msgs = valve.switch_features(None) + valve.datapath_connect(
+            now, set(valve.dp.ports.keys()))
+        valve.send_flows(ryu_dp, flow_msgs, now)
+        self.assertEqual(1, len(ryu_dp.writes))
+        release_time = valve._send_window.release_time()  # pylint: disable=protected-access
+        self.assertEqual(now + valve._send_window.barrier_timeout, release_time)  # pylint: disable=protected-access
+        for expire_time, writes in ((now + 1, 1), (release_time, 2)):
+            ofmsgs_by_valve = valve.state_expire(expire_time, [])
+            self.assertIn(valve, ofmsgs_by_valve)
+            valve.send_flows(ryu_dp, ofmsgs_by_valve[valve], expire_time)
+            self.assertEqual(writes, len(ryu_dp.writes))
+
+
+    def test_packetout_not_barrier(self):
+        """Test a packet-out whose data ends like a barrier does not hold back batches."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        ryu_dp = ValveSendFlowsTestCase.FakeRyuDP()
+        barrier_like_data = b'\x00' * 56 + bytes([
+            ofp.OFP_VERSION, ofp.OFPT_BARRIER_REQUEST]) + b'\xde\xad\xbe\xef\x00\x01'
+        valve.send_flows(ryu_dp, [valve_of.packetout(1, barrier_like_data)], self.mock_time(10))
+        self.assertEqual(1, len(ryu_dp.writes))
+        self.assertTrue(ryu_dp.writes[0].endswith(barrier_like_data))
+        self.assertFalse(valve._send_window.inflight)  # pylint: disable=protected-access
+
+
+class ValveServiceTimeTestCase(ValveTestBases.ValveTestNetwork):
+    """Test services are only due on valves they have work to do on."""
+
+    CONFIG = """
+dps:
+    s1:
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: 0x100
+""" % DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valves(self.CONFIG)
+
+    def test_next_service_time(self):
+        """Test routing services are never due on an unrouted DP."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        for valve_service in ('resolve_gateways', 'advertise'):
+            self.assertIsNone(valve.next_service_time(valve_service), valve_service)
+        self.assertEqual(0, valve.next_service_time('fast_state_expire'))
+        # No hosts to expire yet.
+        self.assertIsNone(valve.next_service_time('state_expire'))
+        now = self.mock_time(10)
+        self.rcv_packet(1, 0x100, {
+            'eth_src': self.P1_V100_MAC,
+            'eth_dst': self.UNKNOWN_MAC,
+            'ipv4_src': '10.0.0.1',
+            'ipv4_dst': '10.0.0.2'})
+        learn_timeout = valve.switch_manager.learn_timeout
+        self.assertEqual(now + learn_timeout, valve.next_service_time('state_expire'))
+        self.assertFalse(valve.service_due('state_expire', now + learn_timeout - 1))
+        self.assertTrue(valve.service_due('state_expire', now + learn_timeout))
+        valve.fast_advertise(now, [])
+        self.assertEqual(
+            now + valve.dp.fast_advertise_interval, valve.next_service_time('fast_advertise'))
+        self.disconnect_dp()
+        self.assertIsNone(valve.next_service_time('state_expire'))
+
+
+class ValveReconcileFlowsTestCase(ValveTestBases.ValveTestNetwork):
+    """Test flows are reconciled, rather than deleted and re-added, on reconnect."""
+
+    REQUIRE_TFM = False
+
+    def setUp(self):
+        # TFM resets the pipeline, so cannot be reconciled.
+        self.setup_valves(CONFIG.replace(
+            "hardware: 'GenericTFM'",
+            "hardware: 'Generic'\n        reconcile_flows: True\n        group_table: True").replace(
+                'combinatorial_port_flood: True', ''))
+
+    @staticmethod
+    def _table_flows(table):
+        return [sorted(str(flow) for flow in flows) for flows in table.tables]
+
+    def test_reconcile_flows(self):
+        """Test only missing or stale flows are changed on reconnect."""
+        table = self.network.tables[self.DP_ID]
+        before_table_flows = self._table_flows(table)
+        # Lose a flow, and gain one FAUCET did not add, while disconnected.
+        lost_flow = table.tables[0].pop()
+        self.network.apply_ofmsgs(self.DP_ID, [valve_of.flowmod(
+            0, ofp.OFPFC_ADD, 0, 1, ofp.OFPP_ANY, ofp.OFPG_ANY,
+            parser.OFPMatch(in_port=99), (), 0, 0)])
+        self.assertNotEqual(before_table_flows, self._table_flows(table))
+        self.disconnect_dp()
+        connect_msgs = self.connect_dp()
+        self.assertEqual(before_table_flows, self._table_flows(table))
+        wildcard_deletes = [
+            ofmsg for ofmsg in connect_msgs
+            if valve_of.is_flowdel(ofmsg) and ofmsg.table_id == ofp.OFPTT_ALL]
+        self.assertFalse(wildcard_deletes)
+        flowmods = [ofmsg for ofmsg in connect_msgs if valve_of.is_flowmod(ofmsg)]
+        self.assertEqual(2, len(flowmods), msg=flowmods)
+        self.assertIn(lost_flow.priority, [ofmsg.priority for ofmsg in flowmods])
+
+    def test_reconcile_groups_meters(self):
+        """Test groups and meters are modified not deleted, unless no longer used."""
+        table = self.network.tables[self.DP_ID]
+        before_group_ids = set(table.groups)
+        self.assertTrue(before_group_ids)
+        stale_group_id = max(before_group_ids) + 1
+        self.apply_ofmsgs([valve_of.groupadd(group_id=stale_group_id)])
+        self.disconnect_dp()
+        connect_msgs = self.connect_dp()
+        self.assertEqual(before_group_ids, set(table.groups))
+        deletes = [
+            ofmsg for ofmsg in connect_msgs
+            if valve_of.is_groupdel(ofmsg) or valve_of.is_meterdel(ofmsg)]
+        self.assertEqual([stale_group_id], [ofmsg.group_id for ofmsg in deletes])
+        self.assertFalse([ofmsg for ofmsg in connect_msgs if valve_of.is_groupadd(ofmsg)])
+        self.assertFalse([ofmsg for ofmsg in connect_msgs if valve_of.is_meteradd(ofmsg)])
+        self.assertTrue([
+            ofmsg for ofmsg in connect_msgs
+            if valve_of.is_metermod(ofmsg) and ofmsg.command == ofp.OFPMC_MODIFY])
+
+    def test_no_flow_shadow(self):
+        """Test flows are not shadowed once reconciling flows is configured off."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        self.assertTrue(valve.flow_shadow.flows)
+        self.update_config(CONFIG.replace(
+            "hardware: 'GenericTFM'", "hardware: 'Generic'\n        group_table: True").replace(
+                'combinatorial_port_flood: True', ''), reload_type='cold')
+        self.assertFalse(valve.flow_shadow.flows)
+        self.assertFalse(valve.flow_shadow.group_ids)
+
+    def _connect_unreconciled(self):
+        valve = self.valves_manager.valves[self.DP_ID]
+        self.disconnect_dp()
+        now = self.mock_time(10)
+        connect_msgs = valve.switch_features(None) + valve.datapath_connect(
+            now, set(valve.dp.ports.keys()))
+        self.assertTrue(
+            [ofmsg for ofmsg in connect_msgs if isinstance(ofmsg, parser.OFPFlowStatsRequest)])
+        return valve, now
+
+    @staticmethod
+    def _global_flowdels(ofmsgs):
+        return [ofmsg for ofmsg in ofmsgs if valve_of.is_global_flowdel(ofmsg)]
+
+    def test_reconcile_timeout(self):
+        """Test DP is cold started if it does not reply with flows in time."""
+        valve, now = self._connect_unreconciled()
+        self.assertFalse(valve.state_expire(now + 1, None).get(valve, []))
+        expire_ofmsgs = valve.state_expire(now + valve.RECONCILE_FLOWS_TIMEOUT + 1, None)[valve]
+        self.assertTrue(self._global_flowdels(expire_ofmsgs))
+        self.apply_ofmsgs(expire_ofmsgs)
+        # A late reply is ignored.
+        self.assertFalse(valve.flow_stats_reply_handler(
+            self.network.tables[self.DP_ID].flow_stats_reply()))
+
+    def test_reconcile_error(self):
+        """Test DP is cold started on an error while reconciling."""
+        valve, now = self._connect_unreconciled()
+        test_err = parser.OFPErrorMsg(
+            datapath=None, type_=ofp.OFPET_BAD_REQUEST, code=ofp.OFPBRC_BAD_MULTIPART)
+        self.assertTrue(self._global_flowdels(valve.oferror(test_err, now)))
+        self.assertFalse(valve.oferror(test_err, now))
 
 
 class ValveGroupTestCase(ValveTestBases.ValveTestNetwork):
@@ -272,6 +636,192 @@ vlans:
         self.verify_flooding(matches)
 
 
+class ValveGroupRoutingTestCase(ValveTestBases.ValveTestNetwork):
+    """Tests for routing via a group per nexthop."""
+
+    CONFIG = """
+dps:
+    s1:
+        group_table_routing: True
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: v100
+            p2:
+                number: 2
+                tagged_vlans: [v100]
+            p3:
+                number: 3
+                native_vlan: v200
+            p4:
+                number: 4
+                native_vlan: v300
+vlans:
+    v100:
+        vid: 0x100
+        faucet_vips: ['10.0.0.254/24']
+        routes:
+            - route:
+                ip_dst: 10.99.99.0/24
+                ip_gw: 10.0.0.1
+    v200:
+        vid: 0x200
+        faucet_vips: ['10.0.2.254/24']
+        routes:
+            - route:
+                ip_dst: 10.99.2.0/24
+                ip_gw: 10.0.2.1
+    v300:
+        vid: 0x300
+    v400:
+        vid: 0x400
+""" % DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valves(self.CONFIG)
+
+    def _arp_reply(self, port, eth_src, arp_source_ip='10.0.0.1'):
+        return self.rcv_packet(port, 0x100, {
+            'eth_src': eth_src,
+            'eth_dst': FAUCET_MAC,
+            'arp_code': arp.ARP_REPLY,
+            'arp_source_ip': arp_source_ip,
+            'arp_target_ip': '10.0.0.254'})[self.DP_ID]
+
+    def test_nexthop_group(self):
+        """Test routes use the nexthop's group, and a nexthop move only modifies the group."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        route_manager = valve._route_manager_by_ipv[4]  # pylint: disable=protected-access
+        group_id = route_manager._nexthop_group_id(  # pylint: disable=protected-access
+            valve.dp.vlans[0x100], ipaddress.IPv4Address('10.0.0.1'))
+        resolve_ofmsgs = self._arp_reply(1, self.P1_V100_MAC)
+        group_adds = [ofmsg for ofmsg in resolve_ofmsgs if valve_of.is_groupadd(ofmsg)]
+        self.assertEqual(1, len(group_adds))
+        self.assertEqual(ofp.OFPGT_INDIRECT, group_adds[0].type)
+        self.assertEqual(group_id, group_adds[0].group_id)
+        route_flows = [
+            ofmsg for ofmsg in resolve_ofmsgs if valve_of.is_flowaddmod(ofmsg) and
+            ofmsg.table_id == valve.dp.tables['ipv4_fib'].table_id]
+        self.assertTrue(route_flows)
+        for route_flow in route_flows:
+            self.assertEqual(
+                [parser.OFPActionGroup(group_id).to_jsondict()],
+                [action.to_jsondict() for action in route_flow.instructions[0].actions])
+        # Nexthop moves to another port, so only its group changes.
+        move_ofmsgs = self._arp_reply(2, self.P2_V200_MAC)
+        group_mods = [
+            ofmsg for ofmsg in move_ofmsgs if valve_of.is_groupmod(ofmsg) and
+            ofmsg.command == ofp.OFPGC_MODIFY]
+        self.assertEqual(1, len(group_mods))
+        self.assertEqual(group_id, group_mods[0].group_id)
+        self.assertFalse([
+            ofmsg for ofmsg in move_ofmsgs if valve_of.is_flowaddmod(ofmsg) and
+            ofmsg.table_id == valve.dp.tables['ipv4_fib'].table_id])
+        # Deleting the last route via the nexthop deletes its group.
+        del_ofmsgs = valve.del_route(valve.dp.vlans[0x100], ipaddress.IPv4Network('10.99.99.0/24'))
+        group_dels = [ofmsg for ofmsg in del_ofmsgs if valve_of.is_groupdel(ofmsg)]
+        self.assertEqual(1, len(group_dels))
+        self.assertEqual(group_id, group_dels[0].group_id)
+        self.assertNotIn(group_id, valve.dp.groups.entries)
+
+    def test_host_nexthop_no_group(self):
+        """Test hosts that are not route gateways do not get a group."""
+        host_ofmsgs = self._arp_reply(1, self.P1_V100_MAC, arp_source_ip='10.0.0.2')
+        self.assertTrue(host_ofmsgs)
+        self.assertFalse([ofmsg for ofmsg in host_ofmsgs if valve_of.is_groupadd(ofmsg)])
+
+    def test_expire_nexthop_group(self):
+        """Test an expired nexthop's group is deleted."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        vlan = valve.dp.vlans[0x100]
+        ip_gw = ipaddress.IPv4Address('10.0.0.1')
+        route_manager = valve._route_manager_by_ipv[4]  # pylint: disable=protected-access
+        group_id = route_manager._nexthop_group_id(vlan, ip_gw)  # pylint: disable=protected-access
+        self._arp_reply(1, self.P1_V100_MAC)
+        self.assertIn(group_id, valve.dp.groups.entries)
+        entry = route_manager._vlan_nexthop_cache_entry(vlan, ip_gw)  # pylint: disable=protected-access
+        expire_ofmsgs = route_manager._expire_gateway_flows(  # pylint: disable=protected-access
+            ip_gw, entry, vlan, self.mock_time(0))
+        self.assertEqual(
+            [group_id], [ofmsg.group_id for ofmsg in expire_ofmsgs if valve_of.is_groupdel(ofmsg)])
+        self.assertNotIn(group_id, valve.dp.groups.entries)
+
+    def test_warm_reconfig_nexthop_group(self):
+        """Test nexthop groups are still deleted after a warm reconfig."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        ip_gw = ipaddress.IPv4Address('10.0.0.1')
+        route_manager = valve._route_manager_by_ipv[4]  # pylint: disable=protected-access
+        group_id = route_manager._nexthop_group_id(  # pylint: disable=protected-access
+            valve.dp.vlans[0x100], ip_gw)
+        self._arp_reply(1, self.P1_V100_MAC)
+        # Changing another VLAN's port keeps the nexthop, so its group is kept.
+        self.update_config(self.CONFIG.replace(
+            'native_vlan: v300', 'native_vlan: v400'), reload_type='warm')
+        valve = self.valves_manager.valves[self.DP_ID]
+        vlan = valve.dp.vlans[0x100]
+        self.assertIn(group_id, valve.dp.groups.entries)
+        route_manager = valve._route_manager_by_ipv[4]  # pylint: disable=protected-access
+        entry = route_manager._vlan_nexthop_cache_entry(vlan, ip_gw)  # pylint: disable=protected-access
+        expire_ofmsgs = route_manager._expire_gateway_flows(  # pylint: disable=protected-access
+            ip_gw, entry, vlan, self.mock_time(0))
+        self.assertEqual(
+            [group_id], [ofmsg.group_id for ofmsg in expire_ofmsgs if valve_of.is_groupdel(ofmsg)])
+        self.assertNotIn(group_id, valve.dp.groups.entries)
+
+    def test_warm_reconfig_vlan_nexthop_group(self):
+        """Test deleting a routed VLAN deletes its nexthop groups."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        route_manager = valve._route_manager_by_ipv[4]  # pylint: disable=protected-access
+        group_id = route_manager._nexthop_group_id(  # pylint: disable=protected-access
+            valve.dp.vlans[0x200], ipaddress.IPv4Address('10.0.2.1'))
+        self.rcv_packet(3, 0x200, {
+            'eth_src': self.P3_V200_MAC,
+            'eth_dst': FAUCET_MAC,
+            'arp_code': arp.ARP_REPLY,
+            'arp_source_ip': '10.0.2.1',
+            'arp_target_ip': '10.0.2.254'})
+        self.assertIn(group_id, valve.dp.groups.entries)
+        reload_ofmsgs = self.update_config(self.CONFIG.replace(
+            'native_vlan: v200', 'native_vlan: v400').replace("""
+    v200:
+        vid: 0x200
+        faucet_vips: ['10.0.2.254/24']
+        routes:
+            - route:
+                ip_dst: 10.99.2.0/24
+                ip_gw: 10.0.2.1""", ""), reload_type='warm')[self.DP_ID]
+        self.assertEqual(
+            [group_id], [ofmsg.group_id for ofmsg in reload_ofmsgs if valve_of.is_groupdel(ofmsg)])
+        valve = self.valves_manager.valves[self.DP_ID]
+        self.assertNotIn(group_id, valve.dp.groups.entries)
+
+    def test_update_routes(self):
+        """Test a batch of route changes updates the RIB and FIB in one call."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        vlan = valve.dp.vlans[0x100]
+        ip_gw = ipaddress.IPv4Address('10.0.0.1')
+        route_manager = valve._route_manager_by_ipv[4]  # pylint: disable=protected-access
+        group_id = route_manager._nexthop_group_id(vlan, ip_gw)  # pylint: disable=protected-access
+        self._arp_reply(1, self.P1_V100_MAC)
+        new_dsts = [ipaddress.IPv4Network('10.99.%u.0/24' % i) for i in (97, 98)]
+        add_ofmsgs = valve.update_routes(vlan, [(ip_dst, ip_gw) for ip_dst in new_dsts])
+        fib_table_id = valve.dp.tables['ipv4_fib'].table_id
+        self.assertEqual(2, len([
+            ofmsg for ofmsg in add_ofmsgs if valve_of.is_flowaddmod(ofmsg) and
+            ofmsg.table_id == fib_table_id]))
+        self.assertEqual(
+            set(new_dsts + [ipaddress.IPv4Network('10.99.99.0/24')]),
+            set(vlan.ip_dsts_for_ip_gw(ip_gw)))
+        # Withdrawing all routes via the nexthop deletes its group once.
+        del_ofmsgs = valve.update_routes(
+            vlan, [(ip_dst, None) for ip_dst in vlan.ip_dsts_for_ip_gw(ip_gw)])
+        self.assertFalse(vlan.ip_dsts_for_ip_gw(ip_gw))
+        self.assertEqual(
+            [group_id], [ofmsg.group_id for ofmsg in del_ofmsgs if valve_of.is_groupdel(ofmsg)])
+        self.assertNotIn(group_id, valve.dp.groups.entries)
+
+
 class ValveIdleLearnTestCase(ValveTestBases.ValveTestNetwork):
     """Smoke test for idle-flow based learning. This feature is not currently reliable."""
 
@@ -309,6 +309,81 @@ dps:
         verify_func()
 
 
+class ValveChangeVLANTestCase(ValveTestBases.ValveTestNetwork):
+    """Test change of VLAN config only changes the VLAN's flows that differ."""
+
+    REQUIRE_TFM = False
+
+    CONFIG = """
+dps:
+    s1:
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: v100
+            p2:
+                number: 2
+                native_vlan: v100
+            p3:
+                number: 3
+                native_vlan: v200
+vlans:
+    v100:
+        vid: 0x100
+        unicast_flood: True
+    v200:
+        vid: 0x200
+""" % DP1_CONFIG.replace(
+    "hardware: 'GenericTFM'", "hardware: 'Generic'\n        reconcile_flows: True")
+
+    WARM_CONFIG = CONFIG.replace('unicast_flood: True', 'unicast_flood: False')
+
+    def setUp(self):
+        self.setup_valves(self.CONFIG)
+
+    @staticmethod
+    def _table_flows(table):
+        return [sorted(str(flow) for flow in flows) for flows in table.tables]
+
+    def test_change_vlan(self):
+        """Test VLAN flows are not all deleted, and end up the same as at cold start."""
+        reload_ofmsgs = self.update_config(self.WARM_CONFIG, reload_type='warm')[self.DP_ID]
+        vlan_wildcard_deletes = [
+            ofmsg for ofmsg in reload_ofmsgs
+            if valve_of.is_flowdel(ofmsg) and ofmsg.command == ofp.OFPFC_DELETE and
+            ofmsg.table_id == ofp.OFPTT_ALL and
+            ofmsg.match.get('vlan_vid', None) == 0x100 | ofp.OFPVID_PRESENT]
+        self.assertFalse(vlan_wildcard_deletes)
+        table = self.network.tables[self.DP_ID]
+        warm_table_flows = self._table_flows(table)
+        self.cold_start()
+        self.assertEqual(warm_table_flows, self._table_flows(table))
+
+    def test_change_vlan_ports(self):
+        """Test flows are deleted for hosts on a port removed from a changed VLAN."""
+        self.rcv_packet(2, 0x100, {
+            'eth_src': self.P2_V100_MAC,
+            'eth_dst': self.UNKNOWN_MAC,
+            'ipv4_src': '10.0.0.2',
+            'ipv4_dst': '10.0.0.4'})
+        table = self.network.tables[self.DP_ID]
+
+        def host_flows():
+            return [
+                flow for flows in table.tables for flow in flows
+                if self.P2_V100_MAC in (
+                    flow.match.get('eth_src', None), flow.match.get('eth_dst', None))]
+
+        self.assertTrue(host_flows())
+        self.update_config(
+            self.WARM_CONFIG.replace(
+                'number: 2\n                native_vlan: v100',
+                'number: 2\n                native_vlan: v200'),
+            reload_type='warm')
+        self.assertFalse(host_flows())
+
+
 class ValveDeleteVLANTestCase(ValveTestBases.ValveTestNetwork):
     """Test deleting VLAN."""
 
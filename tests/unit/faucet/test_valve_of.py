@@ -59,6 +59,134 @@ class ValveOfTestCase(unittest.TestCase): # pytype: disable=module-attr
         # with regular flow last
         self.assertEqual(str(flow), reordered_str[-1], msg=reordered)
 
+    def test_reorder_dupe_structural(self):
+        """Test flowmods with equal but distinct matches are deduplicated."""
+
+        def _flowmod(command, priority):
+            return valve_of.flowmod(
+                cookie=0, hard_timeout=0, idle_timeout=0,
+                match_fields=valve_of.match({'in_port': 1, 'vlan_vid': valve_of.vid_present(100)}),
+                out_port=valve_of.ofp.OFPP_ANY, table_id=1, inst=(), priority=priority,
+                command=command, out_group=valve_of.ofp.OFPG_ANY)
+
+        flows = [
+            _flowmod(valve_of.ofp.OFPFC_ADD, 1),
+            _flowmod(valve_of.ofp.OFPFC_ADD, 1),
+            _flowmod(valve_of.ofp.OFPFC_ADD, 2),
+            _flowmod(valve_of.ofp.OFPFC_DELETE, 1),
+            _flowmod(valve_of.ofp.OFPFC_DELETE, 1),
+            _flowmod(valve_of.ofp.OFPFC_DELETE_STRICT, 1),
+            valve_of.groupdel(group_id=1),
+            valve_of.groupdel(group_id=1),
+        ]
+        reordered = valve_of.valve_flowreorder(flows, use_barriers=False)
+        self.assertEqual(
+            3, len([flow for flow in reordered if valve_of.is_flowdel(flow) or valve_of.is_groupdel(flow)]),
+            msg=reordered)
+        self.assertEqual(
+            [2, 1], [flow.priority for flow in reordered if valve_of.is_flowaddmod(flow)],
+            msg=reordered)
+        # An ADD is not lost to a MODIFY of the same flow, which would not add it.
+        flows = [
+            _flowmod(valve_of.ofp.OFPFC_ADD, 1),
+            _flowmod(valve_of.ofp.OFPFC_MODIFY_STRICT, 1),
+        ]
+        reordered = valve_of.valve_flowreorder(flows, use_barriers=False)
+        self.assertEqual(
+            [valve_of.ofp.OFPFC_ADD, valve_of.ofp.OFPFC_MODIFY_STRICT],
+            [flow.command for flow in reordered], msg=reordered)
+
+    def test_overlap_delete(self):
+        """Test table deletes overlapped by all table deletes are removed."""
+
+        def _flowdel(table_id, match_fields, priority=0):
+            return valve_of.flowmod(
+                cookie=0, hard_timeout=0, idle_timeout=0,
+                match_fields=valve_of.match(match_fields), out_port=valve_of.ofp.OFPP_ANY,
+                table_id=table_id, inst=(), priority=priority,
+                command=valve_of.ofp.OFPFC_DELETE, out_group=valve_of.ofp.OFPG_ANY)
+
+        overlap_vids = {valve_of.vid_present(vid) for vid in range(1, 10)}
+        other_vids = {valve_of.vid_present(vid) for vid in range(10, 20)}
+        flows = [valve_of.groupdel(group_id=1)]
+        for vid in overlap_vids:
+            flows.append(_flowdel(valve_of.ofp.OFPTT_ALL, {'vlan_vid': vid}))
+        for vid in overlap_vids | other_vids:
+            for table_id in range(1, 3):
+                for in_port in range(1, 3):
+                    flows.append(
+                        _flowdel(table_id, {'vlan_vid': vid, 'in_port': in_port}, priority=1))
+        reordered = valve_of.valve_flowreorder(flows, use_barriers=False)
+        table_vids = {
+            flow.match['vlan_vid'] for flow in reordered
+            if valve_of.is_flowdel(flow) and flow.table_id != valve_of.ofp.OFPTT_ALL}
+        self.assertEqual(other_vids, table_vids, msg=reordered)
+        self.assertEqual(1 + len(overlap_vids) + len(other_vids) * 4, len(reordered), msg=reordered)
+        # with deletes without a table last
+        self.assertTrue(valve_of.is_groupdel(reordered[-1]), msg=reordered)
+
+    def test_serialize_cache(self):
+        """Test cached serialization matches Ryu's, with XID patched."""
+
+        class FakeDP:
+            """Fake DP to be able to serialize messages."""
+
+            ofproto = valve_of.ofp
+            ofproto_parser = valve_of.parser
+
+        def _flowmod():
+            return valve_of.flowmod(
+                cookie=1, hard_timeout=0, idle_timeout=0,
+                match_fields=valve_of.match({'in_port': 1, 'vlan_vid': valve_of.vid_present(100)}),
+                out_port=valve_of.ofp.OFPP_ANY, table_id=1,
+                inst=(valve_of.apply_actions((valve_of.output_port(2),)),), priority=1,
+                command=valve_of.ofp.OFPFC_ADD, out_group=valve_of.ofp.OFPG_ANY)
+
+        for xid, ofmsg in enumerate((
+                _flowmod(), _flowmod(), valve_of.barrier(), valve_of.packetout(1, b'\x00' * 64),
+                valve_of.groupadd(group_id=1, buckets=[valve_of.bucket(
+                    actions=[valve_of.output_port(1)])]),
+                valve_of.faucet_config()), start=1):
+            ofmsg.datapath = FakeDP()
+            ofmsg.xid = xid
+            buf = bytes(valve_of.serialize_ofmsg(ofmsg))
+            ofmsg.serialize()
+            self.assertEqual(bytes(ofmsg.buf), buf, msg=ofmsg)
+        self.assertGreater(valve_of._serialized_ofmsg.cache_info().hits, 0)
+
+    def test_serialize_cache_structural(self):
+        """Test equal messages built from separate action objects share a cached serialization."""
+
+        class FakeDP:
+            """Fake DP to be able to serialize messages."""
+
+            ofproto = valve_of.ofp
+            ofproto_parser = valve_of.parser
+
+        def _flowmod():
+            # Not from the cached valve_of.output_port(), so each flowmod has its own actions.
+            actions = (
+                valve_of.parser.OFPActionSetField(vlan_vid=valve_of.vid_present(200)),
+                valve_of.parser.OFPActionOutput(3, max_len=0))
+            return valve_of.flowmod(
+                cookie=1, hard_timeout=0, idle_timeout=0,
+                match_fields=valve_of.match({'in_port': 3}),
+                out_port=valve_of.ofp.OFPP_ANY, table_id=2,
+                inst=(valve_of.apply_actions(actions),), priority=1,
+                command=valve_of.ofp.OFPFC_ADD, out_group=valve_of.ofp.OFPG_ANY)
+
+        bufs = []
+        for xid in (1, 2):
+            ofmsg = _flowmod()
+            ofmsg.datapath = FakeDP()
+            ofmsg.xid = xid
+            hits = valve_of._serialized_ofmsg.cache_info().hits
+            bufs.append(bytes(valve_of.serialize_ofmsg(ofmsg)))
+            ofmsg.serialize()
+            self.assertEqual(bytes(ofmsg.buf), bufs[-1])
+        self.assertEqual(hits + 1, valve_of._serialized_ofmsg.cache_info().hits)
+        self.assertNotEqual(bufs[0], bufs[1])
+
 
 if __name__ == "__main__":
     unittest.main() # pytype: disable=module-attr
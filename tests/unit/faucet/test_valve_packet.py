@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""Unit tests run as PYTHONPATH=../../.. python3 ./test_valve_packet.py."""
+
+# Copyright (C) 2015 Research and Innovation Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import ipaddress
+import unittest
+
+from ryu.lib import mac
+from ryu.ofproto import ether
+
+from faucet import valve_packet
+
+from clib.valve_test_lib import FAUCET_MAC
+
+
+class ValveResolvePktTemplateTestCase(unittest.TestCase):  # pytype: disable=module-attr
+    """Test resolve packets patched from templates match those built from scratch."""
+
+    def test_templates(self):
+        """Test ARP and ND requests from templates, tagged and untagged."""
+        for vid in (None, 0x100):
+            template = valve_packet.arp_request_template(
+                vid, FAUCET_MAC, ipaddress.IPv4Address('10.0.0.254'))
+            for dst_ip in ('10.0.0.1', '10.0.0.99'):
+                dst_ip = ipaddress.IPv4Address(dst_ip)
+                pkt = valve_packet.arp_request(
+                    vid, FAUCET_MAC, mac.BROADCAST_STR, ipaddress.IPv4Address('10.0.0.254'), dst_ip)
+                self.assertEqual(
+                    bytes(pkt.data),
+                    valve_packet.arp_request_from_template(template, vid, dst_ip))
+            template = valve_packet.nd_request_template(
+                vid, FAUCET_MAC, ipaddress.IPv6Address('fc00::1:254'))
+            for dst_ip in ('fc00::1:1', 'fc00::1:abcd'):
+                dst_ip = ipaddress.IPv6Address(dst_ip)
+                pkt = valve_packet.nd_request(
+                    vid, FAUCET_MAC, mac.BROADCAST_STR, ipaddress.IPv6Address('fc00::1:254'), dst_ip)
+                self.assertEqual(
+                    bytes(pkt.data),
+                    valve_packet.nd_request_from_template(template, vid, dst_ip))
+
+
+
+class ValveParseEthHeaderTestCase(unittest.TestCase):  # pytype: disable=module-attr
+    """Test Ethernet/VLAN headers are decoded from packet data."""
+
+    def test_parse_eth_header(self):
+        """Test tagged, untagged and truncated headers."""
+        eth_src = '0e:00:00:00:00:01'
+        for vid in (None, 0x100):
+            pkt = valve_packet.arp_request(
+                vid, eth_src, mac.BROADCAST_STR,
+                ipaddress.IPv4Address('10.0.0.1'), ipaddress.IPv4Address('10.0.0.2'))
+            data = bytes(pkt.data)
+            self.assertEqual(
+                (mac.BROADCAST_STR, eth_src, 0x0e0000000001, ether.ETH_TYPE_ARP, vid),
+                valve_packet.parse_eth_header(data))
+            self.assertEqual(
+                (None, None, None, None, None),
+                valve_packet.parse_eth_header(data[:valve_packet.ETH_HEADER_SIZE - 1]))
+
+
+if __name__ == "__main__":
+    unittest.main()  # pytype: disable=module-attr
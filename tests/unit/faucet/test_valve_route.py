@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""Unit tests run as PYTHONPATH=../../.. python3 ./test_valve_route.py."""
+
+# Copyright (C) 2015 Research and Innovation Advanced Network New Zealand Ltd.
+# Copyright (C) 2015--2019 The Contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import ipaddress
+import unittest
+
+from ryu.lib import mac
+from ryu.lib.packet import arp, packet
+from ryu.ofproto import ofproto_v1_3 as ofp
+
+from faucet import valve_packet
+from faucet.valve_route import NextHopResolveQueue
+
+from clib.valve_test_lib import DP1_CONFIG, FAUCET_MAC, ValveTestBases
+
+
+class ValveNextHopResolveQueueTestCase(unittest.TestCase):  # pytype: disable=module-attr
+    """Test gateways are dequeued only when due, soonest first."""
+
+    def test_queue(self):
+        """Test gateways are dequeued by due time, once each."""
+        ip_gw1 = ipaddress.IPv4Address('10.0.0.1')
+        ip_gw2 = ipaddress.IPv4Address('10.0.0.2')
+        queue = NextHopResolveQueue()
+        queue.push(ip_gw1, 10)
+        queue.push(ip_gw2, 5)
+        # Queueing again later does not delay a gateway, but earlier does advance it.
+        queue.push(ip_gw2, 20)
+        queue.push(ip_gw1, 3)
+        self.assertEqual(2, len(queue))
+        self.assertIsNone(queue.pop(2))
+        self.assertEqual(ip_gw1, queue.pop(6))
+        self.assertEqual(ip_gw2, queue.pop(6))
+        self.assertIsNone(queue.pop(100))
+        self.assertEqual(0, len(queue))
+
+
+class ValveResolveGatewaysTestCase(ValveTestBases.ValveTestNetwork):
+    """Test a resolve tick floods requests for due route gateways only."""
+
+    IP_GWS = [ipaddress.IPv4Address('10.0.0.%u' % i) for i in (1, 2, 3)]
+
+    CONFIG = """
+dps:
+    s1:
+%s
+        interfaces:
+            p1:
+                number: 1
+                native_vlan: v100
+            p2:
+                number: 2
+                native_vlan: v100
+            p3:
+                number: 3
+                tagged_vlans: [v100]
+vlans:
+    v100:
+        vid: 0x100
+        faucet_vips: ['10.0.0.254/24']
+        routes:
+            - route:
+                ip_dst: 10.99.1.0/24
+                ip_gw: 10.0.0.1
+            - route:
+                ip_dst: 10.99.2.0/24
+                ip_gw: 10.0.0.2
+            - route:
+                ip_dst: 10.99.3.0/24
+                ip_gw: 10.0.0.3
+""" % DP1_CONFIG
+
+    def setUp(self):
+        self.setup_valves(self.CONFIG)
+        # Gateways are first due for resolution one tick after they are cached.
+        self.assertFalse(self._resolve_tick(self.mock_time(0)))
+
+    def _resolve_tick(self, now):
+        valve = self.valves_manager.valves[self.DP_ID]
+        return valve.resolve_gateways(now, None).get(valve, [])
+
+    @staticmethod
+    def _arp_target_ips(ofmsgs):
+        target_ips = []
+        for pkt_out in ValveTestBases.packet_outs_from_flows(ofmsgs):
+            arp_pkt = packet.Packet(pkt_out.data).get_protocol(arp.arp)
+            target_ips.append(ipaddress.IPv4Address(arp_pkt.dst_ip))
+        return target_ips
+
+    def test_resolve_only_due_gateways(self):
+        """Test a resolve tick only tries gateways whose retry or cache timeout is due."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        vlan = valve.dp.vlans[0x100]
+        route_manager = valve._route_manager_by_ipv[4]  # pylint: disable=protected-access
+        now = self.mock_time()
+        self.assertEqual(set(self.IP_GWS), set(self._arp_target_ips(self._resolve_tick(now))))
+        # No gateway is due again until its retry backoff has passed.
+        self.assertFalse(self._resolve_tick(now))
+        self.rcv_packet(1, 0x100, {
+            'eth_src': self.P1_V100_MAC,
+            'eth_dst': FAUCET_MAC,
+            'arp_code': arp.ARP_REPLY,
+            'arp_source_ip': str(self.IP_GWS[0]),
+            'arp_target_ip': '10.0.0.254'})
+        resolved_entry = route_manager._vlan_nexthop_cache_entry(  # pylint: disable=protected-access
+            vlan, self.IP_GWS[0])
+        self.assertEqual(self.P1_V100_MAC, resolved_entry.eth_src)
+        resolved_retry_time = resolved_entry.last_retry_time
+        # Unresolved gateways are retried after their first backoff (at most 3s),
+        # the resolved one is left until its cache times out.
+        now = self.mock_time(4)
+        self.assertEqual(
+            set(self.IP_GWS[1:]), set(self._arp_target_ips(self._resolve_tick(now))))
+        self.assertEqual(resolved_retry_time, resolved_entry.last_retry_time)
+        now = self.mock_time(valve.dp.arp_neighbor_timeout)
+        self.assertIn(self.IP_GWS[0], self._arp_target_ips(self._resolve_tick(now)))
+
+    def test_resolve_flood_batch(self):
+        """Test due gateways are flooded in one batch, a packet-out per gateway and VID."""
+        valve = self.valves_manager.valves[self.DP_ID]
+        ofmsgs = self._resolve_tick(self.mock_time())
+        pkt_outs = ValveTestBases.packet_outs_from_flows(ofmsgs)
+        self.assertEqual(ofmsgs, pkt_outs)
+        # Untagged flood to p1 and p2, tagged flood to p3.
+        self.assertEqual(2 * len(self.IP_GWS), len(pkt_outs))
+        expected_pkts = []
+        for vid, port_nos in ((None, [1, 2]), (0x100, [3])):
+            for ip_gw in self.IP_GWS:
+                pkt = valve_packet.arp_request(
+                    vid, FAUCET_MAC, mac.BROADCAST_STR,
+                    ipaddress.IPv4Address('10.0.0.254'), ip_gw)
+                expected_pkts.append((bytes(pkt.data), port_nos))
+        sent_pkts = []
+        for pkt_out in pkt_outs:
+            self.assertEqual(ofp.OFPP_CONTROLLER, pkt_out.in_port)
+            sent_pkts.append(
+                (bytes(pkt_out.data), sorted(action.port for action in pkt_out.actions)))
+        self.assertEqual(sorted(expected_pkts), sorted(sent_pkts))
+        self.assertFalse(valve.resolve_gateways(self.mock_time(0), None))
+
+
+if __name__ == "__main__":
+    unittest.main()  # pytype: disable=module-attr
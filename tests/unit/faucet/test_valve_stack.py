@@ -647,6 +647,17 @@ class ValveStackChainTest(ValveTestBases.ValveTestNetwork):
         self.activate_all_ports()
         self.validate_edge_learn_ports()
 
+    def test_other_running_valves(self):
+        """Test other running valves follow DPs disconnecting and connecting"""
+        valve = self.valves_manager.valves[1]
+        other_valve = self.valves_manager.valves[2]
+        self.assertIn(other_valve, self.get_other_valves(valve))
+        self.assertNotIn(valve, self.get_other_valves(valve))
+        self.valves_manager.datapath_disconnect(self.mock_time(10), other_valve)
+        self.assertNotIn(other_valve, self.get_other_valves(valve))
+        self.connect_dp(2)
+        self.assertIn(other_valve, self.get_other_valves(valve))
+
 
 class ValveStackLoopTest(ValveTestBases.ValveTestNetwork):
     """Test base class for loop stack config"""
@@ -948,6 +959,7 @@ class ValveStackRedundancyTestCase(ValveTestBases.ValveTestNetwork):
             dp = self.valves_manager.valves[dpid].dp
             dp.dyn_running = False
             self.set_stack_all_ports_status(dp.name, STACK_STATE_INIT)
+        self.valves_manager.update_running_valves()
         for valve in self.valves_manager.valves.values():
             self.assertFalse(valve.dp.dyn_running)
             self.assertEqual('s1', valve.dp.stack.root_name)
@@ -1234,11 +1246,37 @@ class ValveStackGraphBreakTestCase(ValveStackLoopTest):
         self.validate_flooding(False)
         table = self.network.tables[self.DP_ID]
         self.assertLessEqual(table.flow_count(), 33, 'table overflow')
+        stack = self.valves_manager.valves[self.DP_ID].dp.stack
+        self.assertEqual(['s2', 's3'], stack.shortest_path_to_root('s2'))
+        self.assertFalse(stack.is_in_path('s2', 's3'))
+        self.assertEqual(2, stack.longest_path_to_root_len())
         # Deactivate link between the two other switches, not the one under test.
         other_dp = self.valves_manager.valves[2].dp
         other_port = other_dp.ports[2]
         self.deactivate_stack_port(other_port)
         self.validate_flooding(rerouted=True)
+        # Cached paths were recomputed for the changed topology.
+        self.assertEqual(['s2', 's1', 's3'], stack.shortest_path_to_root('s2'))
+        self.assertTrue(stack.is_in_path('s2', 's3'))
+        self.assertEqual(3, stack.longest_path_to_root_len())
+        self.assertEqual(['s2', 's1', 's3'], other_dp.stack.shortest_path_to_root())
+
+    def test_update_stack_topo_flood_state(self):
+        """Test only DPs whose flooding depends on a stack link need reflooding"""
+        self.activate_all_ports()
+        s1 = self.valves_manager.valves[1]
+        s2 = self.valves_manager.valves[2]
+        s3 = self.valves_manager.valves[3]
+        port = s1.dp.ports[2]
+        for valve in (s2, s3):
+            valve.stack_manager.reset_peer_distances()
+        # The root floods the same way whether s1 is directly connected or not.
+        self.assertFalse(s3.stack_manager.update_stack_topo(False, s1.dp, port))
+        # s2 is no longer an edge DP, once s1 has to reach the root via s2.
+        self.assertTrue(s2.dp.stack.is_edge())
+        self.assertTrue(s2.stack_manager.update_stack_topo(False, s1.dp, port))
+        self.assertFalse(s2.dp.stack.is_edge())
+        self.assertFalse(s2.stack_manager.update_stack_topo(False, s1.dp, port))
 
     def _set_max_lldp_lost(self, new_value):
         """Set the interface config option max_lldp_lost"""
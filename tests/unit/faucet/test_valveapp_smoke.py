@@ -55,6 +55,8 @@ class RyuAppSmokeTest(unittest.TestCase):  # pytype: disable=module-attr
                 ryu_app.features_handler,
                 ryu_app.packet_in_handler,
                 ryu_app.desc_stats_reply_handler,
+                ryu_app.flow_stats_reply_handler,
+                ryu_app.barrier_reply_handler,
                 ryu_app.port_status_handler,
                 ryu_app.flowremoved_handler,
                 ryu_app.reconnect_handler,
@@ -1,9 +1,10 @@
 """Unit tests for VLAN"""
 
 import unittest
+from collections import namedtuple
 from ipaddress import ip_address, ip_network, ip_interface
 
-from faucet.vlan import VLAN
+from faucet.vlan import HostLocations, VLAN
 
 
 class FaucetVLANMethodTest(unittest.TestCase):
@@ -230,6 +231,147 @@ class FaucetVLANMethodTest(unittest.TestCase):
             ip_network('fc00::30:0/112'): ip_address('fc00::1:99')
         })
 
+    def test_route_changes(self):
+        """Tests gateway types and the route change journal."""
+
+        vlan = VLAN(1, 1, {})
+        vlan.add_route(ip_network('10.0.0.0/8'), ip_address('10.0.0.1'))
+        vlan.add_route(ip_network('10.99.0.0/16'), ip_address('10.0.0.2'))
+        vlan.add_route(ip_network('10.0.0.3/32'), ip_address('10.0.0.3'))
+        self.assertEqual(vlan.host_gws_by_ipv(4), {ip_address('10.0.0.3')})
+        self.assertEqual(
+            vlan.route_gws_by_ipv(4), {ip_address('10.0.0.1'), ip_address('10.0.0.2')})
+        self.assertTrue(vlan.is_host_fib_route(ip_address('10.0.0.3')))
+        self.assertEqual(len(vlan.pop_route_changes(4)), 3)
+        self.assertEqual(vlan.pop_route_changes(4), [])
+        # Changes to the same destination are coalesced.
+        vlan.add_route(ip_network('10.99.0.0/16'), ip_address('10.0.0.3'))
+        vlan.del_route(ip_network('10.99.0.0/16'))
+        self.assertEqual(vlan.pop_route_changes(4), [(ip_network('10.99.0.0/16'), None)])
+        self.assertEqual(vlan.route_gws_by_ipv(4), {ip_address('10.0.0.1')})
+        self.assertEqual(vlan.host_gws_by_ipv(4), {ip_address('10.0.0.3')})
+
+    def test_host_cache(self):
+        """Tests hosts can be learned, moved and expired."""
+
+        port = namedtuple('port', ['number', 'permanent_learn'])
+        port1 = port(1, False)
+        port2 = port(2, True)
+        vlan = VLAN(1, 1, {})
+        vlan.reset_ports([])
+        vlan.add_cache_host(0x0e0000000001, port1, 1)
+        vlan.add_cache_host(0x0e0000000002, port1, 2)
+        vlan.add_cache_host(0x0e0000000003, port2, 3)
+        self.assertEqual(vlan.hosts_count(), 3)
+        self.assertEqual(vlan.cached_hosts_count_on_port(port1), 2)
+        entry = vlan.cached_host(0x0e0000000002)
+        self.assertEqual(entry.eth_src, '0e:00:00:00:00:02')
+        self.assertEqual(entry.eth_src_int, 0x0e0000000002)
+        self.assertEqual(entry.port, port1)
+        self.assertEqual(entry.cache_time, 2)
+        # Move host to another port.
+        vlan.add_cache_host(0x0e0000000002, port2, 4)
+        self.assertEqual(vlan.cached_host(0x0e0000000002).port, port2)
+        self.assertIsNone(vlan.cached_host_on_port(0x0e0000000002, port1))
+        self.assertEqual(vlan.cached_host_on_port(0x0e0000000002, port2).cache_time, 4)
+        self.assertEqual(
+            ['0e:00:00:00:00:01'], [entry.eth_src for entry in vlan.cached_hosts_on_port(port1)])
+        self.assertEqual(vlan.cached_hosts_count_on_port(port2), 2)
+        # Permanently learned hosts are not expired.
+        expired_hosts = vlan.expire_cache_hosts(10, 5)
+        self.assertEqual(['0e:00:00:00:00:01'], [entry.eth_src for entry in expired_hosts])
+        self.assertEqual(vlan.hosts_count(), 2)
+        self.assertEqual(vlan.cached_hosts_count_on_port(port1), 0)
+        # Expired host's storage is reused.
+        vlan.add_cache_host(0x0e0000000004, port1, 11)
+        self.assertEqual(vlan.cached_host(0x0e0000000004).port, port1)
+        vlan.add_cache_host(0x0e0000000005, port1, 12)
+        vlan.clear_cache_hosts_on_port(port2)
+        self.assertEqual(vlan.hosts_count(), 2)
+        self.assertIsNone(vlan.cached_host(0x0e0000000003))
+
+    def test_host_cache_expiry(self):
+        """Tests hosts cached again are expired by their latest cache time."""
+
+        port1 = namedtuple('port', ['number', 'permanent_learn'])(1, False)
+        vlan = VLAN(1, 1, {})
+        vlan.reset_ports([])
+        vlan.add_cache_host(0x0e0000000001, port1, 1)
+        vlan.add_cache_host(0x0e0000000002, port1, 2)
+        vlan.add_cache_host(0x0e0000000001, port1, 8)
+        expired_hosts = vlan.expire_cache_hosts(10, 5)
+        self.assertEqual(['0e:00:00:00:00:02'], [entry.eth_src for entry in expired_hosts])
+        self.assertEqual(vlan.dyn_oldest_host_time, 8)
+        self.assertFalse(vlan.expire_cache_hosts(12, 5))
+        expired_hosts = vlan.expire_cache_hosts(14, 5)
+        self.assertEqual(['0e:00:00:00:00:01'], [entry.eth_src for entry in expired_hosts])
+        self.assertEqual(vlan.hosts_count(), 0)
+        self.assertEqual(vlan.dyn_oldest_host_time, 14)
+        # A host moved at the same cache time is expired once.
+        port2 = namedtuple('port', ['number', 'permanent_learn'])(2, False)
+        vlan.add_cache_host(0x0e0000000003, port1, 20)
+        vlan.add_cache_host(0x0e0000000003, port2, 20)
+        expired_hosts = vlan.expire_cache_hosts(30, 5)
+        self.assertEqual(['0e:00:00:00:00:03'], [entry.eth_src for entry in expired_hosts])
+
+    def test_clone_dyn_state(self):
+        """Tests hosts still on a VLAN's ports are cloned from a previous config."""
+
+        port = namedtuple('port', ['number', 'permanent_learn'])
+        port1 = port(1, False)
+        port2 = port(2, False)
+        prev_vlan = VLAN(1, 1, {})
+        prev_vlan.reset_ports([])
+        prev_vlan.add_cache_host(0x0e0000000001, port1, 1)
+        prev_vlan.add_cache_host(0x0e0000000002, port2, 2)
+        vlan = VLAN(1, 1, {})
+        vlan.get_ports = lambda: [port1]
+        removed_entries = vlan.clone_dyn_state(prev_vlan)
+        self.assertEqual(['0e:00:00:00:00:02'], [entry.eth_src for entry in removed_entries])
+        self.assertEqual(vlan.cached_host(0x0e0000000001).cache_time, 1)
+        self.assertIsNone(vlan.cached_host(0x0e0000000002))
+
+    def test_host_locations(self):
+        """Tests index of DPs that have learned a host."""
+
+        port1 = namedtuple('port', ['number', 'permanent_learn'])(1, False)
+        fake_dp = namedtuple('dp', ['dp_id', 'vlans', 'dyn_running'])
+        host_locations = HostLocations()
+        dps = []
+        for dp_id in (1, 2, 3):
+            vlan = VLAN(1, dp_id, {'vid': 100})
+            vlan.reset_ports([])
+            dps.append(fake_dp(dp_id, {100: vlan}, dp_id != 3))
+        dp1, dp2, dp3 = dps
+        # Hosts learned before a DP is added are indexed.
+        dp2.vlans[100].add_cache_host(0x0e0000000001, port1, 1)
+        for dp in dps:
+            host_locations.add_dp(dp)
+        dp3.vlans[100].add_cache_host(0x0e0000000001, port1, 2)
+        self.assertEqual(
+            [(dp2, '0e:00:00:00:00:01')],
+            [(dp, entry.eth_src) for dp, entry in host_locations.learned_by_others(
+                1, 100, 0x0e0000000001)])
+        self.assertFalse(host_locations.learned_by_others(2, 100, 0x0e0000000001))
+        self.assertFalse(host_locations.learned_by_others(1, 200, 0x0e0000000001))
+        dp2.vlans[100].expire_cache_host(0x0e0000000001)
+        self.assertFalse(host_locations.learned_by_others(1, 100, 0x0e0000000001))
+        dp2.vlans[100].add_cache_host(0x0e0000000001, port1, 3)
+        dp2.vlans[100].reset_caches()
+        self.assertFalse(host_locations.learned_by_others(1, 100, 0x0e0000000001))
+        dp2.vlans[100].add_cache_host(0x0e0000000001, port1, 4)
+        host_locations.del_dp(2)
+        self.assertFalse(host_locations.learned_by_others(1, 100, 0x0e0000000001))
+        # DPs are returned in the order first added, even if added again.
+        host_locations.add_dp(dp2)
+        dp3 = dp3._replace(dyn_running=True)
+        host_locations.add_dp(dp3)
+        for dp in (dp2, dp3):
+            dp.vlans[100].add_cache_host(0x0e0000000002, port1, 5)
+        self.assertEqual(
+            [dp3, dp2],
+            [dp for dp, _ in host_locations.learned_by_others(1, 100, 0x0e0000000002)])
+
 
 if __name__ == "__main__":
     unittest.main() # pytype: disable=module-attr